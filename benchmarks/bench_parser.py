@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of cleaning of article pages by the parsers.
+
+Every page of the fixture corpus is cleaned by ReutersParser, FastReutersParser and
+LxmlReutersParser, the results must be the same, then the time of cleaning by every
+parser is measured:
+
+    python benchmarks/bench_parser.py --repeat 200
+"""
+import sys
+import time
+from pathlib import Path
+
+import click
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT.joinpath("src")))
+
+from parsers import FastReutersParser, LxmlReutersParser, ReutersParser  # noqa: E402
+
+FIXTURES = Path(__file__).absolute().parent.joinpath("fixtures", "reuters")
+PARSERS = [ReutersParser, FastReutersParser, LxmlReutersParser]
+
+
+def load_pages(directory: Path, padding: int):
+    """pages of the corpus, padding adds navigation and scripts like on a real page"""
+    noise = (
+        "<script>var data = {'items': [1, 2, 3]};</script>"
+        "<nav><ul><li><a href='/section'>Section</a></li></ul></nav>"
+    ) * padding
+    pages = {}
+    for path in sorted(directory.glob("*.html")):
+        text = path.read_text("utf8")
+        pages[path.name] = text.replace("<body>", "<body>" + noise, 1)
+    return pages
+
+
+def check(pages) -> bool:
+    ok = True
+    for name, text in pages.items():
+        expected = ReutersParser.cleaned_data(text)
+        for parser in PARSERS[1:]:
+            if parser.cleaned_data(text) != expected:
+                click.echo(f"{parser.__name__} differs from ReutersParser on {name}")
+                ok = False
+    return ok
+
+
+def measure(parser, pages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in pages.values():
+            parser.cleaned_data(text)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--fixtures", default=str(FIXTURES), help="Folder with article pages")
+@click.option("--repeat", default=100, help="Number of times every page is cleaned")
+@click.option("--padding", default=50, help="Number of blocks of navigation and scripts added to every page")
+def main(fixtures, repeat, padding):
+    """Run the benchmark of the parsers"""
+    pages = load_pages(Path(fixtures), padding)
+    if not pages:
+        raise click.UsageError(f"no pages in {fixtures}")
+    if not check(pages):
+        sys.exit(1)
+    click.echo(f"{len(pages)} pages, the same output of all parsers")
+
+    baseline = None
+    for parser in PARSERS:
+        elapsed = measure(parser, pages, repeat)
+        per_page = elapsed / (repeat * len(pages)) * 1000
+        baseline = baseline or elapsed
+        click.echo(f"{parser.__name__:<20} {per_page:8.3f}ms per page x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Offline end-to-end benchmark of the scrape pipeline.
+
+A local HTTP server serves synthetic RSS feeds and Reuters-like article pages,
+Feed.run scrapes them into an in-memory client, Postgres or Mongo, and the time of
+every stage is measured: feed fetch, feed parse, article download, HTML cleaning
+and DB insert. The results are written as JSON and can be compared with the results
+of another commit:
+
+    python benchmarks/bench_pipeline.py --output new.json --compare old.json
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import click
+import requests
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT.joinpath("src")))
+sys.path.insert(0, str(Path(__file__).absolute().parent))
+
+from memory_client import MemoryClient  # noqa: E402
+from parsers import ReutersParser  # noqa: E402
+from scraper import Feed  # noqa: E402
+
+STAGES = ["feed_fetch", "feed_parse", "article_download", "html_cleaning", "db_insert"]
+
+PARAGRAPH = (
+    "<p>The quick brown fox jumps over the lazy dog while markets in Asia opened "
+    "higher on Monday as investors weighed fresh economic data.</p>"
+)
+
+
+def rss(base_url, feed, items, run_id):
+    """return a RSS document with items linked to articles of the server"""
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    entries = []
+    for i in range(items):
+        posted = format_datetime(now + timedelta(minutes=i), usegmt=True)
+        entries.append(
+            f"<item><title>News {feed}-{i}</title>"
+            f"<description>Short description of news {feed}-{i}</description>"
+            f"<link>{base_url}/article/{run_id}/{feed}/{i}</link>"
+            f"<pubDate>{posted}</pubDate></item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>Feed {feed}</title><link>{base_url}</link>"
+        + "".join(entries)
+        + "</channel></rss>"
+    )
+
+
+def article(title, size):
+    """return a Reuters-like page with a headline, a body of about size bytes and garbage around"""
+    body = PARAGRAPH * max(1, size // len(PARAGRAPH))
+    return (
+        "<html><head><script>var tracking = {};</script><title>"
+        f"{title}</title></head><body><nav><ul><li>World</li><li>Business</li></ul></nav>"
+        f'<h1 class="ArticleHeader_headline">{title}</h1>'
+        '<div class="StandardArticleBody_body">'
+        f"{body}"
+        '<div class="RelatedCoverage_related-coverage-module"><a href="/x">Related</a></div>'
+        "</div><footer>Reuters</footer></body></html>"
+    )
+
+
+class SyntheticServer(ThreadingHTTPServer):
+    """HTTP stand-in for feeds and news sites with configurable latency and size"""
+
+    daemon_threads = True
+
+    def __init__(self, items, article_size, latency, jitter):
+        super().__init__(("127.0.0.1", 0), SyntheticHandler)
+        self.items = items
+        self.article_size = article_size
+        self.latency = latency
+        self.jitter = jitter
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def sleep(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+
+class SyntheticHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.sleep()
+        parts = self.path.strip("/").split("/")
+        if parts[0] == "feed":
+            # /feed/<run>/<feed>
+            body = rss(server.base_url, parts[2], server.items, parts[1])
+            content_type = "application/rss+xml"
+        elif parts[0] == "article":
+            # /article/<run>/<feed>/<item>
+            body = article(f"News {parts[2]}-{parts[3]}", server.article_size)
+            content_type = "text/html"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class Timings:
+    """Thread-safe storage of (start, end) of every measured call by stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = defaultdict(list)
+
+    def add(self, stage, start, end, items=1):
+        with self._lock:
+            self.events[stage].append((start, end, items))
+
+    @contextlib.contextmanager
+    def measure(self, stage, items=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, start, time.perf_counter(), items)
+
+    def summary(self):
+        result = {}
+        for stage in STAGES:
+            events = self.events.get(stage, [])
+            if not events:
+                continue
+            durations = sorted(end - start for start, end, _ in events)
+            items = sum(i for _, _, i in events)
+            # stages run concurrently, so throughput is measured on the wall clock of the stage
+            wall = max(end for _, end, _ in events) - min(start for start, _, _ in events)
+            result[stage] = {
+                "calls": len(events),
+                "items": items,
+                "items_per_sec": items / wall if wall else None,
+                "p50_ms": percentile(durations, 50) * 1000,
+                "p99_ms": percentile(durations, 99) * 1000,
+                "total_sec": sum(durations),
+            }
+        return result
+
+
+def percentile(values, p):
+    """return the nearest-rank percentile of sorted values"""
+    index = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class TimedSession(requests.Session):
+    """Session which measures article downloads"""
+
+    def __init__(self, timings):
+        super().__init__()
+        self._timings = timings
+
+    def get(self, url, **kwargs):
+        if "/article/" not in url:
+            return super().get(url, **kwargs)
+        with self._timings.measure("article_download"):
+            return super().get(url, **kwargs)
+
+
+class TimedParser(ReutersParser):
+    """ReutersParser which measures cleaning of every page"""
+
+    timings = None
+
+    def cleaned_data(self, text: str) -> str:
+        with self.timings.measure("html_cleaning"):
+            return super().cleaned_data(text)
+
+
+def measure_inserts(client, timings):
+    """make the client measure every insert of news"""
+    save_news = client.save_news
+
+    def timed_save_news(news):
+        with timings.measure("db_insert", len(news)):
+            return save_news(news)
+
+    client.save_news = timed_save_news
+
+
+class TimedFeed(Feed):
+    """Feed which measures fetch and parse of the RSS"""
+
+    def __init__(self, *args, timings, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._timings = timings
+
+    def fetch(self):
+        start = time.perf_counter()
+        r = super().fetch()
+        self._fetch_time = (start, time.perf_counter())
+        return r
+
+    def parse(self):
+        start = time.perf_counter()
+        super().parse()
+        end = time.perf_counter()
+        fetch_start, fetch_end = self._fetch_time
+        self._timings.add("feed_fetch", fetch_start, fetch_end)
+        # parse is measured without the download of the feed
+        self._timings.add("feed_parse", start, end - (fetch_end - fetch_start), len(self._news))
+
+
+def make_client(db, schema, pg_host, mongo_host):
+    if db == "memory":
+        return MemoryClient(schema)
+    if db == "postgres":
+        from postgres import PostgresClient
+
+        client = PostgresClient(host=pg_host, schema=schema)
+    else:
+        from mongo import MongoClient
+
+        client = MongoClient(host=mongo_host, schema=schema)
+    client.create_schema(schema)
+    return client
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline):
+    """print the change of throughput and latency against the results of another run"""
+    click.echo(f"compare {result['commit']} with {baseline['commit']}")
+    for stage in STAGES:
+        new, old = result["stages"].get(stage), baseline["stages"].get(stage)
+        if not new or not old:
+            continue
+        line = f"{stage:<18}"
+        for key in ("items_per_sec", "p50_ms", "p99_ms"):
+            if new[key] and old[key]:
+                line += f" {key} {new[key] / old[key]:6.2f}x"
+        click.echo(line)
+
+
+@click.command()
+@click.option("--db", default="memory", type=click.Choice(["memory", "postgres", "mongo"]), help="Database of the scraper")
+@click.option("--pg-host", default="localhost", help="Host of Postgres")
+@click.option("--mongo-host", default="localhost", help="Host of MongoDB")
+@click.option("--feeds", default=5, help="Number of feeds")
+@click.option("--items", default=50, help="Number of news in a feed")
+@click.option("--article-size", default=20000, help="Size of the body of an article in bytes")
+@click.option("--latency", default=0.01, help="Latency of every response of the server in seconds")
+@click.option("--jitter", default=0.0, help="Random latency added to every response in seconds")
+@click.option("--workers", default=8, help="Number of news pages of a feed downloaded at the same time")
+@click.option("--output", default=None, help="File for results in JSON")
+@click.option("--compare", "baseline", default=None, help="File with results of another run to compare with")
+@click.option("--verbose", is_flag=True, help="Show the output of the scraper")
+def main(db, pg_host, mongo_host, feeds, items, article_size, latency, jitter, workers, output, baseline, verbose):
+    """Run the benchmark of the scrape pipeline"""
+    server = SyntheticServer(items, article_size, latency, jitter)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    run_id = f"{os.getpid()}{int(time.time())}"
+    schema = f"benchmark_{run_id}"
+    client = make_client(db, schema, pg_host, mongo_host)
+    timings = Timings()
+    measure_inserts(client, timings)
+    TimedParser.timings = timings
+    session = TimedSession(timings)
+
+    started = time.perf_counter()
+    output_stream = None if verbose else io.StringIO()
+    with contextlib.redirect_stdout(output_stream or sys.stdout):
+        for i in range(feeds):
+            feed = TimedFeed(
+                url=f"{server.base_url}/feed/{run_id}/{i}",
+                body_news_parser=TimedParser(),
+                database_client=client,
+                schema=schema,
+                workers=workers,
+                session=session,
+                timings=timings,
+            )
+            feed.run()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    result = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(),
+        "params": {
+            "db": db,
+            "feeds": feeds,
+            "items": items,
+            "article_size": article_size,
+            "latency": latency,
+            "jitter": jitter,
+            "workers": workers,
+        },
+        "elapsed_sec": elapsed,
+        "items_per_sec": feeds * items / elapsed,
+        "stages": timings.summary(),
+    }
+
+    click.echo(f"{feeds * items} news in {elapsed:.2f}s ({result['items_per_sec']:.1f} items/s)")
+    for stage, s in result["stages"].items():
+        click.echo(
+            f"{stage:<18} {s['items']:>6} items {s['items_per_sec'] or 0:>9.1f} items/s "
+            f"p50 {s['p50_ms']:8.2f}ms p99 {s['p99_ms']:8.2f}ms"
+        )
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of the cold start of the command line.
+
+Every case runs a new interpreter, the time of the whole process and the heavy libraries
+which it imported are shown. A command imports cli and then only the client and the parser
+which it uses, cases of the registry show the price of one implementation. Cases of commands
+run export and create-schema with the in-memory client of benchmarks, so they show libraries
+which the command imports without a database. With --baseline the cases run with src of
+other checkout too:
+
+    git worktree add /tmp/scraper-old <revision>
+    python benchmarks/bench_startup.py --baseline /tmp/scraper-old/src
+"""
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT.joinpath("src")))
+
+from registry import CLIENTS, PARSERS  # noqa: E402
+
+HEAVY = ["psycopg2", "pymongo", "bs4", "html2text", "lxml", "feedparser", "tldextract", "requests"]
+
+PROBE = """
+import sys
+sys.path.insert(0, {src!r})
+{code}
+print()
+print(" ".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+CASES = {
+    "python": "pass",
+    "import cli": "import cli",
+    "cli --help": "import cli\ntry:\n    cli.cli(['--help'])\nexcept SystemExit:\n    pass",
+}
+
+
+# a command runs with config.ini of the temporary folder and the in-memory client
+COMMAND = """
+sys.path.insert(0, {benchmarks!r})
+import cli
+from registry import CLIENTS
+CLIENTS.register("MemoryClient", "memory_client:MemoryClient")
+cli.crud_config(cli.CONFIG_FILE)
+cli.change_setting(cli.CONFIG_FILE, "client", "MemoryClient")
+cli.change_setting(cli.CONFIG_FILE, "schema", "benchmark")
+cli.cli({args!r}, standalone_mode=False)
+"""
+
+
+def command_cases() -> dict:
+    """cases which run one command of cli"""
+    benchmarks = str(ROOT.joinpath("benchmarks"))
+    return {
+        "export": COMMAND.format(benchmarks=benchmarks, args=["export", "--filename", "news.csv"]),
+        "create-schema": COMMAND.format(benchmarks=benchmarks, args=["create-schema", "benchmark"]),
+    }
+
+
+def registry_cases() -> dict:
+    """cases which import cli and load one implementation by the registry"""
+    cases = {}
+    for registry_name, registry in (("CLIENTS", CLIENTS), ("PARSERS", PARSERS)):
+        for name in registry.names():
+            cases[name] = f"import cli\nfrom registry import {registry_name}\n{registry_name}.load({name!r})"
+    return cases
+
+
+def measure(src: str, code: str, repeat: int):
+    """return the median time of the process in seconds and the heavy libraries imported by it"""
+    script = PROBE.format(src=src, code=code, heavy=HEAVY)
+    times = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", script], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            times.append(time.perf_counter() - start)
+            if result.returncode:
+                raise click.ClickException(result.stderr.decode())
+    return statistics.median(times), result.stdout.decode().splitlines()[-1]
+
+
+@click.command()
+@click.option("--repeat", default=10, help="Number of runs of every case")
+@click.option("--baseline", default=None, help="Folder src of other checkout to compare with")
+def main(repeat, baseline):
+    """Run the benchmark of the cold start"""
+    sources = [("current", str(ROOT.joinpath("src")))]
+    if baseline:
+        sources.append(("baseline", str(Path(baseline).absolute())))
+
+    cases = dict(CASES, **registry_cases(), **command_cases())
+    for case, code in cases.items():
+        for label, src in sources:
+            if case not in CASES and not Path(src, "registry.py").exists():
+                continue
+            seconds, loaded = measure(src, code, repeat)
+            click.echo(f"{case:<20} {label:<9} {seconds * 1000:8.1f}ms  {loaded or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import threading
+from typing import Iterator, List, Set
+
+from clients import DBClientABC, Feed, FeedHistory, FoundNews, News, NewsRef, NewsSignature
+
+
+class MemoryClient(DBClientABC):
+    """
+    Client which keeps everything in memory, used to measure the scraper without a database
+    """
+
+    def __init__(self, schema="benchmark", storage=None):
+        self._schema = schema
+        # clones share the storage like real clients share the database
+        self._storage = storage if storage is not None else {
+            "feeds": {},
+            "news": [],
+            "hashes": set(),
+            # feed id by the hash of news
+            "news_feeds": {},
+            "scraper_info": [],
+            "watermarks": {},
+            # signatures by (hash, kind) and hashes of originals by (kind, key of band)
+            "signatures": {},
+            "bands": {},
+            "lock": threading.Lock(),
+        }
+
+    @property
+    def news(self) -> list:
+        return self._storage["news"]
+
+    def save_feed(self, url, parser=None):
+        with self._storage["lock"]:
+            feeds = self._storage["feeds"]
+            feed = Feed(len(feeds) + 1, url, parser)
+            feeds[url] = feed
+            return feed
+
+    def get_feed_by_url(self, url, **kwargs) -> Feed:
+        feed = self._storage["feeds"].get(url)
+        return feed or self.save_feed(url, kwargs.get("parser"))
+
+    def get_feeds(self) -> List[Feed]:
+        return list(self._storage["feeds"].values())
+
+    def save_feed_validators(self, feed_id, etag: str = None, modified: str = None) -> None:
+        feeds = self._storage["feeds"]
+        for url, feed in feeds.items():
+            if feed.id == feed_id:
+                feeds[url] = feed._replace(etag=etag, modified=modified)
+
+    def get_feed_history(self, feed_id, limit: int = 20) -> FeedHistory:
+        news_feeds = self._storage["news_feeds"]
+        posted = sorted(
+            (n.posted for _, n in self.news if news_feeds.get(n.hash) == feed_id and n.posted),
+            reverse=True,
+        )
+        counts = [info[1] for info, _ in reversed(self._storage["scraper_info"]) if info[4] == feed_id]
+        return FeedHistory(posted[:limit], counts[:limit])
+
+    def save_feed_schedule(self, feed_id, poll_interval: float, next_poll_at) -> None:
+        feeds = self._storage["feeds"]
+        for url, feed in feeds.items():
+            if feed.id == feed_id:
+                feeds[url] = feed._replace(poll_interval=poll_interval, next_poll_at=next_poll_at)
+
+    def save_news(self, data) -> int:
+        saved = 0
+        with self._storage["lock"]:
+            for n in data:
+                if n.hash in self._storage["hashes"]:
+                    continue
+                self._storage["hashes"].add(n.hash)
+                self._storage["news_feeds"][n.hash] = n.feed.id
+                self.news.append(
+                    (
+                        len(self.news) + 1,
+                        News(n.title, n.short_description, n.posted, n.url, n.hash, n.full_description),
+                    )
+                )
+                saved += 1
+        return saved
+
+    def get_existing_hashes(self, hashes: List[str]) -> Set[str]:
+        return self._storage["hashes"].intersection(hashes)
+
+    def get_news(self, from_date=None, to_date=None) -> List[News]:
+        return list(self.iter_news(from_date, to_date))
+
+    def iter_news(
+            self, from_date=None, to_date=None, batch_size: int = 1000, after_id=None, until_id=None
+    ) -> Iterator[News]:
+        for id, n in list(self.news):
+            if from_date and n.posted < from_date or to_date and n.posted > to_date:
+                continue
+            if after_id is not None and id <= after_id or until_id is not None and id > until_id:
+                continue
+            yield n
+
+    def search_news(
+            self, query: str, limit: int = 20, offset: int = 0, from_date=None, to_date=None
+    ) -> Iterator[FoundNews]:
+        # every word must be found, words of the title weigh more like in the indexes of databases
+        words = query.lower().split()
+        found = []
+        for id, n in list(self.news):
+            if from_date and n.posted < from_date or to_date and n.posted > to_date:
+                continue
+            texts = [((n.title or "").lower(), 10), ((n.short_description or "").lower(), 5),
+                     ((n.full_description or "").lower(), 1)]
+            if not words or not all(any(w in text for text, _ in texts) for w in words):
+                continue
+            rank = sum(weight * text.count(w) for text, weight in texts for w in words)
+            found.append(FoundNews(id, n.title, n.posted, n.url, rank, n.short_description))
+        found.sort(key=lambda f: f.rank, reverse=True)
+        return iter(found[offset:offset + limit])
+
+    def get_similar_signatures(self, kind: str, keys: List[int]) -> List[NewsSignature]:
+        found = {}
+        for key in set(keys):
+            for hash in self._storage["bands"].get((kind, key), ()):
+                found.setdefault(hash, []).append(key)
+        return [self._storage["signatures"][(hash, kind)]._replace(keys=keys) for hash, keys in found.items()]
+
+    def save_signatures(self, signatures: List[NewsSignature]) -> None:
+        with self._storage["lock"]:
+            for s in signatures:
+                self._storage["signatures"].setdefault((s.hash, s.kind), s)
+                for key in s.keys:
+                    self._storage["bands"].setdefault((s.kind, key), set()).add(s.hash)
+
+    def get_export_bound(self):
+        return len(self.news) or None
+
+    def get_news_refs(self, from_date=None, to_date=None, after_id=None, limit: int = 1000):
+        refs = []
+        for id, n in list(self.news):
+            if from_date and n.posted < from_date or to_date and n.posted > to_date:
+                continue
+            if after_id is not None and id <= after_id:
+                continue
+            refs.append(NewsRef(id, n.hash, n.url))
+            if len(refs) == limit:
+                break
+        return refs
+
+    def update_full_descriptions(self, descriptions) -> int:
+        with self._storage["lock"]:
+            for id, text in descriptions:
+                _, n = self.news[id - 1]
+                self.news[id - 1] = (id, n._replace(full_description=text))
+        return len(descriptions)
+
+    def get_watermark(self, destination: str):
+        return self._storage["watermarks"].get(destination)
+
+    def save_watermark(self, destination: str, last_id) -> None:
+        self._storage["watermarks"][destination] = last_id
+
+    def delete_watermark(self, destination: str) -> None:
+        self._storage["watermarks"].pop(destination, None)
+
+    def create_schema(self, name: str = None) -> None:
+        if name:
+            self._schema = name
+
+    def save_scraper_info(self, scraper_info, by_user=False, metrics: dict = None):
+        self._storage["scraper_info"].append((scraper_info, metrics))
+
+    def get_last_posted_date(self):
+        return max((n.posted for _, n in self.news), default=None)
+
+    def clone(self, schema: str = None) -> "MemoryClient":
+        return self.__class__(schema or self._schema, self._storage)
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,435 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator, List, Set
+
+import asyncpg
+import motor.motor_asyncio
+import pymongo
+
+from clients import Feed, News
+from postgres import (
+    NEWS_COLUMNS,
+    add_partitions,
+    insert_new_news_sql,
+    missing_partitions,
+    news_filter,
+    numbered_placeholders,
+    schema_ddl,
+)
+
+
+class AsyncDBClientABC(ABC):
+    """
+    The contract of DBClientABC for asyncio, a client keeps many operations in flight,
+    so one client is shared by all feeds of the event loop
+    """
+
+    @abstractmethod
+    async def save_feed(self, url, parser=None) -> Feed:
+        pass
+
+    @abstractmethod
+    async def get_feed_by_url(self, url, **kwargs) -> Feed:
+        pass
+
+    @abstractmethod
+    async def get_feeds(self) -> List[Feed]:
+        pass
+
+    @abstractmethod
+    async def save_news(self, news) -> int:
+        pass
+
+    @abstractmethod
+    async def get_existing_hashes(self, hashes: List[str]) -> Set[str]:
+        pass
+
+    @abstractmethod
+    def iter_news(
+            self,
+            from_date: datetime = None,
+            to_date: datetime = None,
+            batch_size: int = 1000,
+            after_id=None,
+            until_id=None,
+    ) -> AsyncIterator[News]:
+        pass
+
+    @abstractmethod
+    async def get_last_posted_date(self):
+        pass
+
+    @abstractmethod
+    async def create_schema(self, name: str = None) -> None:
+        pass
+
+    @abstractmethod
+    async def save_scraper_info(self, scraper_info, by_user=False, metrics: dict = None):
+        pass
+
+    @abstractmethod
+    def clone(self, schema: str = None) -> "AsyncDBClientABC":
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+
+
+class AsyncPostgresClient(AsyncDBClientABC):
+    """
+    Client for working with PostgresDB by asyncpg, queries take connections from a pool
+    """
+
+    def __init__(
+            self,
+            dbname="postgres",
+            user="postgres",
+            password="scraper",
+            host="db",
+            schema="rsscraper",
+            pool=None,
+            minconn=1,
+            maxconn=10,
+    ):
+        self._dbname = dbname
+        self._host = host
+        self._password = password
+        self._user = user
+        self._schema = schema
+        # a pool received from other client is shared and is not closed by this client
+        self._pool = pool
+        self._shared = pool is not None
+        self._minconn = minconn
+        self._maxconn = maxconn
+        self._pool_lock = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._dbname}, {self._host}, ******, {self._user}, {self._schema})"
+
+    async def _get_pool(self) -> asyncpg.pool.Pool:
+        if self._pool:
+            return self._pool
+        # the lock is created in the running loop, so the client may be created before the loop
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if not self._pool:
+                self._pool = await asyncpg.create_pool(
+                    user=self._user,
+                    password=self._password,
+                    host=self._host,
+                    database=self._dbname,
+                    min_size=self._minconn,
+                    max_size=self._maxconn,
+                )
+        return self._pool
+
+    async def save_feed(self, url, parser=None) -> Feed:
+        pool = await self._get_pool()
+        SQL = f"INSERT INTO {self._schema}.feeds (url, body_parser) VALUES($1, $2) RETURNING id"
+        id = await pool.fetchval(SQL, url, parser)
+        return Feed(id, url, parser)
+
+    async def get_feed_by_url(self, url, **kwargs) -> Feed:
+        pool = await self._get_pool()
+        SQL = f"""
+        SELECT id, url, body_parser, etag, modified, poll_interval, next_poll_at FROM {self._schema}.feeds
+        WHERE url = $1
+        """
+        try:
+            row = await pool.fetchrow(SQL, url)
+        except (asyncpg.exceptions.UndefinedTableError, asyncpg.exceptions.UndefinedColumnError):
+            # the schema is not created or is created by an older version
+            await self.create_schema()
+            row = await pool.fetchrow(SQL, url)
+        if row:
+            return Feed(*row)
+        return await self.save_feed(url, kwargs.get("parser"))
+
+    async def get_feeds(self) -> List[Feed]:
+        pool = await self._get_pool()
+        SQL = f"""
+        SELECT id, url, body_parser, etag, modified, poll_interval, next_poll_at FROM {self._schema}.feeds
+        ORDER BY id
+        """
+        try:
+            return [Feed(*row) for row in await pool.fetch(SQL)]
+        except asyncpg.exceptions.UndefinedTableError:
+            return []
+
+    async def save_news(self, news) -> int:
+        """
+        Save news which are not saved yet by one statement, return the number of saved news
+        """
+        columns = [[] for _ in range(7)]
+        for n in news:
+            row = (n.feed.id, n.title, n.short_description, n.posted, n.url, n.hash, n.full_description)
+            for column, value in zip(columns, row):
+                column.append(value)
+        if not columns[0]:
+            return 0
+
+        # every column is sent as an array, so a batch of any size is one statement
+        SQL = insert_new_news_sql(
+            self._schema,
+            f"""unnest(
+                $1::int4[], $2::varchar[], $3::varchar[], $4::timestamp[], $5::varchar[], $6::varchar[], $7::text[]
+            ) AS u ({NEWS_COLUMNS})""",
+        )
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                months = missing_partitions(self._schema, columns[3])
+                if months:
+                    await conn.execute(f"SELECT {self._schema}.create_news_partitions($1::timestamp[])", months)
+                    add_partitions(self._schema, months)
+                inserted = await conn.fetch(SQL, *columns)
+        return len(inserted)
+
+    async def get_existing_hashes(self, hashes: List[str]) -> Set[str]:
+        if not hashes:
+            return set()
+        pool = await self._get_pool()
+        SQL = f"SELECT hash FROM {self._schema}.news_hashes WHERE hash = ANY($1::varchar[])"
+        return {row["hash"] for row in await pool.fetch(SQL, list(hashes))}
+
+    async def iter_news(
+            self,
+            from_date: datetime = None,
+            to_date: datetime = None,
+            batch_size: int = 1000,
+            after_id=None,
+            until_id=None,
+    ) -> AsyncIterator[News]:
+        """
+        Yield news by a cursor, only batch_size rows are kept in memory
+        """
+        # positions of an incremental export are ids of transactions which saved news
+        WHERE, params = news_filter(from_date, to_date, after_id, until_id, key="xact")
+        ORDER = "ORDER BY id" if after_id is not None or until_id is not None else ""
+        SQL = f"""
+        SELECT title, short_description, posted, url, hash, full_description
+        FROM {self._schema}.news
+        {numbered_placeholders(WHERE)}
+        {ORDER}
+        """
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            # a cursor lives only in a transaction
+            async with conn.transaction():
+                async for row in conn.cursor(SQL, *params, prefetch=batch_size):
+                    yield News(*row)
+
+    async def get_last_posted_date(self):
+        pool = await self._get_pool()
+        try:
+            return await pool.fetchval(f"SELECT max(posted) FROM {self._schema}.news")
+        except asyncpg.exceptions.UndefinedTableError:
+            return None
+
+    async def create_schema(self, name: str = None) -> None:
+        """
+        Creates a new schema, if the schema exists adds only missing columns and indexes
+        """
+        if name:
+            self._schema = name
+        pool = await self._get_pool()
+        await pool.execute(schema_ddl(self._schema))
+
+    async def save_scraper_info(self, scraper_info, by_user=False, metrics: dict = None):
+        pool = await self._get_pool()
+        SQL = f"""
+        INSERT INTO {self._schema}.scraper_info
+        (date_run, count, by_user, url, feed_id, metrics)
+        VALUES($1, $2, $3, $4, $5, $6::jsonb)
+        """
+        await pool.execute(SQL, *scraper_info, json.dumps(metrics) if metrics is not None else None)
+
+    def clone(self, schema: str = None) -> "AsyncPostgresClient":
+        """
+        Return a new client with the same settings, clients share the pool after it is created
+        """
+        return self.__class__(
+            dbname=self._dbname,
+            user=self._user,
+            password=self._password,
+            host=self._host,
+            schema=schema or self._schema,
+            pool=self._pool,
+            minconn=self._minconn,
+            maxconn=self._maxconn,
+        )
+
+    async def close(self) -> None:
+        if self._pool and not self._shared:
+            await self._pool.close()
+            self._pool = None
+
+
+class AsyncMongoClient(AsyncDBClientABC):
+    """
+    Client for working with MongoDB by motor
+    """
+
+    def __init__(self, host="db", port=27017, schema="rsscraper", connection=None):
+        self._host = host
+        self._port = port
+        # a connection received from other client is shared and is not closed by this client
+        self._connection = connection
+        self._shared = connection is not None
+        self._db = None
+        self._schema = schema
+
+    @property
+    def connection(self) -> motor.motor_asyncio.AsyncIOMotorClient:
+        if self._connection is None:
+            self._connection = motor.motor_asyncio.AsyncIOMotorClient(self._host, self._port)
+        return self._connection
+
+    async def _get_db(self):
+        if self._db is None:
+            await self.create_schema()
+        return self._db
+
+    async def save_feed(self, url, parser=None) -> Feed:
+        db = await self._get_db()
+        result = await db["feeds"].insert_one({"url": url, "parser": parser})
+        return Feed(result.inserted_id, url, parser)
+
+    async def get_feed_by_url(self, url, **kwargs) -> Feed:
+        db = await self._get_db()
+        document = await db["feeds"].find_one({"url": url})
+        if not document:
+            return await self.save_feed(url, kwargs.get("parser"))
+        return self._feed(document)
+
+    async def get_feeds(self) -> List[Feed]:
+        db = await self._get_db()
+        return [self._feed(f) async for f in db["feeds"].find().sort("_id")]
+
+    @staticmethod
+    def _feed(document) -> Feed:
+        return Feed(
+            document["_id"],
+            document["url"],
+            document["parser"],
+            document.get("etag"),
+            document.get("modified"),
+            document.get("poll_interval"),
+            document.get("next_poll_at"),
+        )
+
+    async def save_news(self, news) -> int:
+        db = await self._get_db()
+        # upsert by hash inserts only news which are not saved yet
+        operations = [
+            pymongo.UpdateOne(
+                {"hash": n.hash},
+                {
+                    "$setOnInsert": {
+                        "feed_id": n.feed.id,
+                        "title": n.title,
+                        "short_description": n.short_description,
+                        "posted": n.posted,
+                        "url": n.url,
+                        "hash": n.hash,
+                        "full_description": n.full_description,
+                    }
+                },
+                upsert=True,
+            )
+            for n in news
+        ]
+        if not operations:
+            return 0
+        result = await db["news"].bulk_write(operations, ordered=False)
+        return result.upserted_count
+
+    async def get_existing_hashes(self, hashes: List[str]) -> Set[str]:
+        db = await self._get_db()
+        documents = db["news"].find({"hash": {"$in": list(hashes)}}, {"hash": 1})
+        return {n["hash"] async for n in documents}
+
+    async def iter_news(
+            self,
+            from_date: datetime = None,
+            to_date: datetime = None,
+            batch_size: int = 1000,
+            after_id=None,
+            until_id=None,
+    ) -> AsyncIterator[News]:
+        db = await self._get_db()
+        query = {}
+        if from_date or to_date:
+            query["posted"] = {}
+            if from_date:
+                query["posted"]["$gt"] = from_date
+            if to_date:
+                query["posted"]["$lt"] = to_date
+        if after_id is not None or until_id is not None:
+            query["_id"] = {}
+            if after_id is not None:
+                query["_id"]["$gt"] = after_id
+            if until_id is not None:
+                query["_id"]["$lte"] = until_id
+
+        documents = db["news"].find(query, batch_size=batch_size)
+        if "_id" in query:
+            # an incremental export goes in order of id to the watermark
+            documents = documents.sort("_id")
+        async for n in documents:
+            yield News(
+                n["title"],
+                n["short_description"],
+                n["posted"],
+                n["url"],
+                n["hash"],
+                n["full_description"],
+            )
+
+    async def get_last_posted_date(self):
+        db = await self._get_db()
+        document = await db["news"].find_one(sort=[("posted", pymongo.DESCENDING)], projection={"posted": 1})
+        return document["posted"] if document else None
+
+    async def create_schema(self, name: str = None) -> None:
+        if name:
+            self._schema = name
+            self._db = None
+
+        if self._db is None:
+            self._db = self.connection[self._schema]
+            await self._db["news"].create_index("hash", unique=True)
+
+    async def save_scraper_info(self, scraper_info, by_user=False, metrics: dict = None):
+        db = await self._get_db()
+        await db["scraper_info"].insert_one(
+            {
+                "run_date": scraper_info[0],
+                "count": scraper_info[1],
+                "by_user": scraper_info[2],
+                "url": scraper_info[3],
+                "feed_id": str(scraper_info[4]),
+                "metrics": metrics,
+            }
+        )
+
+    def clone(self, schema: str = None) -> "AsyncMongoClient":
+        """
+        Return a new client with the same settings, clients share one connection
+        """
+        return self.__class__(
+            host=self._host,
+            port=self._port,
+            schema=schema or self._schema,
+            connection=self.connection,
+        )
+
+    async def close(self) -> None:
+        if self._connection is not None and not self._shared:
+            self._connection.close()
+            self._connection = None
+            self._db = None
@@ -0,0 +1,134 @@
+import fcntl
+import gzip
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+def load_page(directory, key: str) -> Optional[str]:
+    """
+    return a page from the cache folder by its key without the cache object,
+    used by processes which only read the cache
+    """
+    path = Path(directory).joinpath(key[:2], f"{key}.gz")
+    with gzip.open(path, "rb") as f:
+        return f.read().decode("utf8")
+
+
+class HTMLCache:
+    """
+    Cache of raw news pages on disk, a page is stored compressed by gzip in a file named
+    by the hash of its URL. When the size of the cache is over max_bytes the least recently
+    used pages are removed. Processes can share the folder, the size of the folder is kept
+    in the file .size which is changed under the lock of the file .lock
+    """
+
+    def __init__(self, directory, max_bytes: int = 1024 ** 3):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lock_path = self._directory.joinpath(".lock")
+        self._size_path = self._directory.joinpath(".size")
+
+    @contextmanager
+    def _locked(self):
+        """lock the folder for other threads and other processes"""
+        with self._lock, open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _scan(self) -> List[Tuple[float, Path, int]]:
+        """return files of pages in order of use, the least recently used is the first"""
+        files = []
+        for path in self._directory.glob("*/*.gz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        # modification time is updated on every use, so it is the time of the last use
+        return sorted(files)
+
+    def _read_size(self) -> int:
+        try:
+            return int(self._size_path.read_text())
+        except (FileNotFoundError, ValueError):
+            # the first use of the folder or a process was killed while it wrote the size
+            return sum(size for _, _, size in self._scan())
+
+    @staticmethod
+    def key(url: str) -> str:
+        # the same hash as News.hash, so a page can be found by a saved news
+        return hashlib.sha1(url.encode("utf8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self._directory.joinpath(key[:2], f"{key}.gz")
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    @property
+    def size(self) -> int:
+        with self._locked():
+            return self._read_size()
+
+    def __len__(self):
+        return len(self._scan())
+
+    def get(self, url: str) -> Optional[str]:
+        """return the page by its URL or None when the page is not in the cache"""
+        return self.get_by_key(self.key(url))
+
+    def get_by_key(self, key: str) -> Optional[str]:
+        try:
+            text = load_page(self._directory, key)
+            os.utime(self._path(key))
+        except (EOFError, OSError):
+            # a missing or broken file is a miss
+            return None
+        return text
+
+    def put(self, url: str, text: str) -> None:
+        key = self.key(url)
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # a page is written to a temporary file, so a reader never sees a part of it
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp, "wb") as f:
+            f.write(text.encode("utf8"))
+
+        with self._locked():
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+            size = self._read_size() + path.stat().st_size - replaced
+            if size > self._max_bytes:
+                size = self._evict()
+            self._size_path.write_text(str(size))
+
+    def _evict(self) -> int:
+        """
+        remove the least recently used pages of all processes till the cache is not over max_bytes,
+        the size is computed again from the files, return the size of the left pages
+        """
+        files = self._scan()
+        size = sum(s for _, _, s in files)
+        for _, path, s in files[:-1]:
+            if size <= self._max_bytes:
+                break
+            size -= s
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        return size
@@ -3,12 +3,12 @@ import io
 import configparser
 
 import click
-from scraper import Feed
-from clients import PostgresClient, MongoClient
-from parsers import ReutersParser
+from registry import CLIENTS, PARSERS, FILETYPES
 from datetime import datetime
 from collections import namedtuple
 
+# modules of commands are imported by the commands, so a command imports only libraries which it uses
+
 CONFIG_FILE = "config.ini"
 
 def create_config(path):
@@ -44,13 +44,54 @@ def crud_config(path):
     return Setting(parser, client, schema)
 
 def change_setting(path, section, value):
+    """
+    Change a setting, the file is written only when the value is changed
+    """
     config = configparser.ConfigParser()
     config.read(path)
+    if config.has_option("Settings", section) and config.get("Settings", section) == value:
+        return
     config.set("Settings", section, value)
     with open(path, "w") as config_file:
         config.write(config_file)
 
 
+def create_exporters(prometheus_dir, statsd):
+    """
+    Create exporters of metrics of runs
+    """
+    from metrics import PrometheusTextfile, StatsdExporter
+
+    exporters = []
+    if prometheus_dir:
+        exporters.append(PrometheusTextfile(prometheus_dir))
+    if statsd:
+        exporters.append(StatsdExporter(statsd))
+    return exporters
+
+
+def new_cleaner(cleaners):
+    """
+    Create a pool of processes which clean news pages
+    """
+    if not cleaners:
+        return None
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(cleaners)
+
+
+def new_dedup(dedup):
+    """
+    Create the detector of near duplicates of news
+    """
+    if dedup == 'off':
+        return None
+    from dedup import NearDuplicates
+
+    return NearDuplicates(skip=dedup)
+
+
 @click.group()
 def cli():
     pass
@@ -58,40 +99,145 @@ def cli():
 @click.command()
 @click.option('--client', default=None, help="The database client that will be used for the scraper, 'PostgresClient' or 'MongoClient' ")
 @click.option('--schema', default=None, help='Name of the database where the data will be saved')
-def run_scraper(client, schema):
+@click.option('--workers', default=8, help='Number of news pages downloaded at the same time')
+@click.option('--timeout', default=10.0, help='Timeout of a news page download in seconds')
+@click.option('--rate', default=None, type=float, help='Max requests per second to one host')
+@click.option('--prometheus-dir', default=None, help='Folder for metrics of runs in the Prometheus text format')
+@click.option('--statsd', default=None, help='Address <host:port> of StatsD for metrics of runs')
+@click.option('--cache-dir', default=None, help='Folder for the cache of raw news pages')
+@click.option('--cache-size', default=1024, help='Max size of the cache of raw news pages in MB')
+@click.option('--cleaners', default=0, help='Number of processes which clean news pages, 0 to clean in the scraper process')
+@click.option('--batch-size', default=100, help='Number of news saved to the database by one insert')
+@click.option('--flush-interval', default=5.0, help='Max seconds a downloaded news waits for the insert')
+@click.option('--dedup', default='off', type=click.Choice(['off', 'download', 'store']), help='Skip news which tell a saved story: download skips pages by titles and short descriptions, store skips saving of bodies')
+def run_scraper(
+        client, schema, workers, timeout, rate, prometheus_dir, statsd, cache_dir, cache_size, cleaners, batch_size, flush_interval,
+        dedup
+):
     """Run scraper"""
+    from scraper import Feed
+    from fetcher import Fetcher
+    from cache import HTMLCache
+
     if schema:
         change_setting(CONFIG_FILE, 'schema', schema)
     if client:
-        change_setting(CONFIG_FILE, 'client', schema)
+        change_setting(CONFIG_FILE, 'client', client)
     setting = crud_config(CONFIG_FILE)
-    client = eval(setting.client)()
-    parser = eval(setting.parser)()
+    client = CLIENTS.create(setting.client)
+    parser = PARSERS.create(setting.parser)
     schema = setting.schema
+    cleaner = new_cleaner(cleaners)
     f = Feed(
         url="http://feeds.reuters.com/reuters/topNews",
         body_news_parser=parser,
         database_client=client,
-        schema=schema
+        schema=schema,
+        workers=workers,
+        timeout=timeout,
+        session=Fetcher(rate=rate, timeout=timeout, pool_size=workers),
+        exporters=create_exporters(prometheus_dir, statsd),
+        cache=HTMLCache(cache_dir, cache_size * 1024 ** 2) if cache_dir else None,
+        cleaner=cleaner,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        dedup=new_dedup(dedup),
     )
-    f.run()
+    try:
+        f.run()
+    finally:
+        if cleaner:
+            cleaner.shutdown()
     click.echo('scraper has been run')
 
+@click.command()
+@click.option('--feeds-file', default=None, help='File with feeds in format <url> [parser] [schema] per line, added to feeds of the schema')
+@click.option('--interval', default=3600.0, help='Seconds between two polls of a feed without history')
+@click.option('--min-interval', default=300.0, help='Min seconds between two polls of a feed')
+@click.option('--max-interval', default=86400.0, help='Max seconds between two polls of a feed')
+@click.option('--concurrency', default=4, help='Number of feeds scraped at the same time')
+@click.option('--workers', default=8, help='Number of news pages of a feed downloaded at the same time')
+@click.option('--timeout', default=10.0, help='Timeout of a news page download in seconds')
+@click.option('--rate', default=None, type=float, help='Max requests per second to one host')
+@click.option('--once', is_flag=True, help='Run all feeds once and exit')
+@click.option('--prometheus-dir', default=None, help='Folder for metrics of runs in the Prometheus text format')
+@click.option('--statsd', default=None, help='Address <host:port> of StatsD for metrics of runs')
+@click.option('--cache-dir', default=None, help='Folder for the cache of raw news pages')
+@click.option('--cache-size', default=1024, help='Max size of the cache of raw news pages in MB')
+@click.option('--cleaners', default=0, help='Number of processes which clean news pages, 0 to clean in the scraper process')
+@click.option('--batch-size', default=100, help='Number of news saved to the database by one insert')
+@click.option('--flush-interval', default=5.0, help='Max seconds a downloaded news waits for the insert')
+@click.option('--dedup', default='off', type=click.Choice(['off', 'download', 'store']), help='Skip news which tell a saved story: download skips pages by titles and short descriptions, store skips saving of bodies')
+def serve(
+        feeds_file, interval, min_interval, max_interval, concurrency, workers, timeout, rate, once, prometheus_dir, statsd, cache_dir, cache_size, cleaners,
+        batch_size, flush_interval, dedup
+):
+    """
+    Run scraper for all feeds of the schema as a long-running process
+    """
+    from scheduler import FeedScheduler
+    from cache import HTMLCache
+
+    setting = crud_config(CONFIG_FILE)
+    if not setting.schema and not feeds_file:
+        raise click.UsageError("set a schema by create-schema or use --feeds-file")
+    client = CLIENTS.create(setting.client)
+    client._schema = setting.schema or client._schema
+    parser = PARSERS.create(setting.parser)
+    cleaner = new_cleaner(cleaners)
+    scheduler = FeedScheduler(
+        database_client=client,
+        default_parser=parser,
+        schema=setting.schema,
+        feeds_file=feeds_file,
+        concurrency=concurrency,
+        workers=workers,
+        timeout=timeout,
+        exporters=create_exporters(prometheus_dir, statsd),
+        cache=HTMLCache(cache_dir, cache_size * 1024 ** 2) if cache_dir else None,
+        cleaner=cleaner,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        rate=rate,
+        interval=interval,
+        min_interval=min_interval,
+        max_interval=max_interval,
+        dedup=new_dedup(dedup),
+    )
+    try:
+        if once:
+            scheduler.run_once()
+        else:
+            click.echo(f'serve feeds every {min_interval}-{max_interval} seconds by their rate of news')
+            scheduler.serve()
+    finally:
+        if cleaner:
+            cleaner.shutdown()
+
 @click.command()
 @click.option('--start', default=None, help="Start period fo select data string in format <YYYY-MM-DD HH24:MI:SS> ")
 @click.option('--end', default=None, help="End period fo select data string in format <YYYY-MM-DD HH24:MI:SS> ")
 @click.option('--schema', default=None, help='Name of the database where the data will be saved')
 @click.option('--filename', default=None, help='Name for export file')
-def export(start, end, schema, filename):
+@click.option('--format', 'file_format', default='csv', type=click.Choice(FILETYPES.names()), help='Format of export file')
+@click.option('--incremental', is_flag=True, help='Export only news added after the previous incremental export to the destination')
+@click.option('--destination', default='default', help='Name of the destination of an incremental export, every destination has its own watermark')
+def export(start, end, schema, filename, file_format, incremental, destination):
     """
-    Export data to csv
+    Export data to file
     """
+    from clients import JOB_WATERMARK_PREFIX
+    from scraper import Feed
+
+    if incremental and (start or end):
+        raise click.UsageError('--incremental exports all news added after the previous export, --start and --end can not be set')
+    if incremental and destination.startswith(JOB_WATERMARK_PREFIX):
+        raise click.UsageError(f'names of destinations which start with {JOB_WATERMARK_PREFIX} are reserved for jobs')
     if schema:
         change_setting(CONFIG_FILE, 'schema', schema)
     setting = crud_config(CONFIG_FILE)
     schema = setting.schema
-    client = eval(setting.client)()
-    parser = eval(setting.parser)()
+    client = CLIENTS.create(setting.client)
     dt_start = None
     if start:
         dt_start = datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
@@ -102,12 +248,153 @@ def export(start, end, schema, filename):
 
     f = Feed(
         url="http://feeds.reuters.com/reuters/topNews",
-        body_news_parser=parser,
+        # pages are not cleaned by an export
+        body_news_parser=None,
+        database_client=client,
+        schema=schema,
+        filetype=FILETYPES.create(file_format),
+    )
+    f.export_to_file(
+        from_date=dt_start,
+        to_date=dt_end,
+        filename=filename,
+        destination=destination if incremental else None,
+    )
+
+
+@click.command()
+@click.argument('query')
+@click.option('--limit', default=20, type=click.IntRange(1), help='Number of news on a page')
+@click.option('--page', default=1, type=click.IntRange(1), help='Number of the page of results')
+@click.option('--start', default=None, help="Start period fo select data string in format <YYYY-MM-DD HH24:MI:SS> ")
+@click.option('--end', default=None, help="End period fo select data string in format <YYYY-MM-DD HH24:MI:SS> ")
+@click.option('--schema', default=None, help='Name of the database where the data are saved')
+def search(query, limit, page, start, end, schema):
+    """
+    Search news by words of titles and descriptions, the best matched first.
+    QUERY is in the syntax of web search engines: "exact phrase", -excluded, or
+    """
+    if schema:
+        change_setting(CONFIG_FILE, 'schema', schema)
+    setting = crud_config(CONFIG_FILE)
+    client = CLIENTS.create(setting.client)
+    client._schema = setting.schema or client._schema
+    dt_start = datetime.strptime(start, '%Y-%m-%d %H:%M:%S') if start else None
+    dt_end = datetime.strptime(end, '%Y-%m-%d %H:%M:%S') if end else None
+
+    found = 0
+    for n in client.search_news(query, limit=limit, offset=(page - 1) * limit, from_date=dt_start, to_date=dt_end):
+        found += 1
+        posted = f"{n.posted:%Y-%m-%d %H:%M}" if n.posted else "-"
+        click.echo(f"{n.rank:.3f}  {posted}  {n.title}\n    {n.url}\n    {' '.join((n.headline or '').split())}\n")
+    if not found:
+        click.echo("no news found")
+
+@click.command()
+@click.option('--start', default=None, help="Start period fo select data string in format <YYYY-MM-DD HH24:MI:SS> ")
+@click.option('--end', default=None, help="End period fo select data string in format <YYYY-MM-DD HH24:MI:SS> ")
+@click.option('--schema', default=None, help='Name of the database where the data are saved')
+@click.option('--cache-dir', required=True, help='Folder of the cache of raw news pages')
+@click.option('--processes', default=None, type=int, help='Number of processes which clean pages, by default the number of CPUs')
+@click.option('--batch-size', default=1000, help='Number of news updated by one batch')
+@click.option('--job', default='reparse', help='Name of the job, an interrupted job continues from its last batch')
+@click.option('--restart', is_flag=True, help='Start the job from the first news')
+def reparse(start, end, schema, cache_dir, processes, batch_size, job, restart):
+    """
+    Regenerate full descriptions of saved news from cached pages by the configured parser
+    """
+    from reparse import Reparser
+
+    if schema:
+        change_setting(CONFIG_FILE, 'schema', schema)
+    setting = crud_config(CONFIG_FILE)
+    client = CLIENTS.create(setting.client)
+    client._schema = setting.schema or client._schema
+    parser = PARSERS.create(setting.parser)
+    dt_start = datetime.strptime(start, '%Y-%m-%d %H:%M:%S') if start else None
+    dt_end = datetime.strptime(end, '%Y-%m-%d %H:%M:%S') if end else None
+
+    reparser = Reparser(
         database_client=client,
-        schema=schema
+        parser=parser,
+        cache_dir=cache_dir,
+        processes=processes,
+        batch_size=batch_size,
+        job=job,
     )
-    f.export_to_file(from_date=dt_start, to_date=dt_end, filename=filename)
+    reparser.run(from_date=dt_start, to_date=dt_end, restart=restart)
 
+@click.command()
+@click.option('--feeds-file', default=None, help='File with feeds in format <url> [parser] per line, added to feeds of the schema')
+@click.option('--interval', default=3600.0, help='Seconds between two runs of a feed')
+@click.option('--lease', default=60.0, help='Seconds a task is leased to the worker, a lease is extended while the task runs')
+@click.option('--max-attempts', default=3, help='Number of attempts of an article task before it is marked as failed')
+@click.option('--articles', default=50, help='Number of article tasks taken at once')
+@click.option('--workers', default=8, help='Number of news pages downloaded at the same time')
+@click.option('--timeout', default=10.0, help='Timeout of a news page download in seconds')
+@click.option('--rate', default=None, type=float, help='Max requests per second to one host')
+@click.option('--idle', default=5.0, help='Seconds to wait when the queue has no ready tasks')
+@click.option('--owner', default=None, help='Name of the worker in the queue, by default <hostname>-<pid>')
+@click.option('--once', is_flag=True, help='Exit when the queue has no ready tasks')
+@click.option('--cache-dir', default=None, help='Folder for the cache of raw news pages')
+@click.option('--cache-size', default=1024, help='Max size of the cache of raw news pages in MB')
+@click.option('--dedup', default='off', type=click.Choice(['off', 'download', 'store']), help='Skip news which tell a saved story: download skips pages by titles and short descriptions, store skips saving of bodies')
+def worker(
+        feeds_file, interval, lease, max_attempts, articles, workers, timeout, rate, idle, owner, once, cache_dir, cache_size, dedup
+):
+    """
+    Take feeds and news from the queue in Postgres, many workers share the work of the schema
+    """
+    from workqueue import QueueWorker, TaskQueue
+    from cache import HTMLCache
+
+    setting = crud_config(CONFIG_FILE)
+    if setting.client != "PostgresClient":
+        raise click.UsageError("the queue of tasks works only with PostgresClient")
+    client = CLIENTS.create(setting.client)
+    client._schema = setting.schema or client._schema
+    parser = PARSERS.create(setting.parser)
+    queue = TaskQueue(client, owner=owner, lease=lease, max_attempts=max_attempts)
+    qworker = QueueWorker(
+        database_client=client,
+        default_parser=parser,
+        queue=queue,
+        interval=interval,
+        articles=articles,
+        workers=workers,
+        timeout=timeout,
+        cache=HTMLCache(cache_dir, cache_size * 1024 ** 2) if cache_dir else None,
+        rate=rate,
+        dedup=new_dedup(dedup),
+    )
+    added = qworker.add_feeds(feeds_file)
+    click.echo(f'worker {queue.owner} started, {added} feeds added to the queue')
+    try:
+        qworker.serve(idle=idle, once=once)
+    finally:
+        queue.close()
+
+@click.command()
+@click.option('--keep-months', default=12, help='Number of months of news kept before the current month')
+@click.option('--drop', is_flag=True, help='Drop old partitions, by default they are detached and stay as separate tables')
+@click.option('--schema', default=None, help='Name of the database where the data are saved')
+def retention(keep_months, drop, schema):
+    """
+    Detach or drop monthly partitions of news which are older than the kept months
+    """
+    if schema:
+        change_setting(CONFIG_FILE, 'schema', schema)
+    setting = crud_config(CONFIG_FILE)
+    if setting.client != "PostgresClient":
+        raise click.UsageError("partitions of news are only in PostgresClient")
+    client = CLIENTS.create(setting.client)
+    client._schema = setting.schema or client._schema
+    now = datetime.now()
+    months = now.year * 12 + now.month - 1 - keep_months
+    before = datetime(months // 12, months % 12 + 1, 1)
+    retired = client.retire_partitions(before, drop=drop)
+    action = 'dropped' if drop else 'detached'
+    click.echo(f"{len(retired)} partitions of news before {before:%Y-%m} {action}: {', '.join(retired) or '-'}")
 
 @click.command()
 @click.argument('name')
@@ -117,11 +404,16 @@ def create_schema(name):
     """
     change_setting(CONFIG_FILE, 'schema', name)
     setting = crud_config(CONFIG_FILE)
-    client = eval(setting.client)()
+    client = CLIENTS.create(setting.client)
     client.create_schema(name)
 
 cli.add_command(run_scraper)
+cli.add_command(serve)
 cli.add_command(export)
+cli.add_command(search)
+cli.add_command(reparse)
+cli.add_command(worker)
+cli.add_command(retention)
 cli.add_command(create_schema)
 
 if __name__ == '__main__':
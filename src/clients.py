@@ -1,13 +1,26 @@
-import psycopg2
-import pymongo
+import importlib
 from abc import ABC, abstractmethod
 from collections import namedtuple
-from typing import List
+from typing import Iterator, List, Set
 from datetime import datetime
 
 # tuple for visual using data get from db
-Feed = namedtuple("Feed", ["id", "url", "parser"])
+Feed = namedtuple(
+    "Feed",
+    ["id", "url", "parser", "etag", "modified", "poll_interval", "next_poll_at"],
+    defaults=(None, None, None, None),
+)
 News = namedtuple("News", ['title', 'short_description', 'posted', 'url', 'hash', 'full_description'])
+NewsRef = namedtuple("NewsRef", ["id", "hash", "url"])
+# posted dates of the latest news and numbers of new news of the latest runs of a feed, newest first
+FeedHistory = namedtuple("FeedHistory", ["posted", "counts"])
+# a news found by search, rank is its relevance to the query and headline is the matched fragment of its text
+FoundNews = namedtuple("FoundNews", ["id", "title", "posted", "url", "rank", "headline"])
+# signature of a text of a news for search of near duplicates, keys are keys of its LSH bands,
+# duplicate_of is the hash of the original news of a duplicate
+NewsSignature = namedtuple("NewsSignature", ["hash", "kind", "signature", "duplicate_of", "keys"])
+# watermarks of jobs are saved with watermarks of export destinations, names of destinations can not start with it
+JOB_WATERMARK_PREFIX = "job:"
 
 class DBClientABC(ABC):
     """
@@ -23,365 +36,125 @@ class DBClientABC(ABC):
         pass
 
     @abstractmethod
-    def save_news(self, data) -> None:
+    def get_feeds(self) -> List[Feed]:
         pass
 
     @abstractmethod
-    def get_news(self, from_date: datetime = None, to_date: datetime = None ) -> List[News]:
+    def save_feed_validators(self, feed_id, etag: str = None, modified: str = None) -> None:
         pass
 
     @abstractmethod
-    def create_schema(self, name: str) -> None:
+    def get_feed_history(self, feed_id, limit: int = 20) -> FeedHistory:
         pass
 
     @abstractmethod
-    def save_scraper_info(self, scraper_info, by_user=False):
+    def save_feed_schedule(self, feed_id, poll_interval: float, next_poll_at: datetime) -> None:
         pass
 
     @abstractmethod
-    def get_last_posted_date(self):
+    def save_news(self, data) -> int:
         pass
 
+    @abstractmethod
+    def get_existing_hashes(self, hashes: List[str]) -> Set[str]:
+        pass
 
-class PostgresClient(DBClientABC):
-    """
-    Client for working with PostgresDB
-    """
+    @abstractmethod
+    def get_news(self, from_date: datetime = None, to_date: datetime = None ) -> List[News]:
+        pass
 
-    def __init__(
+    @abstractmethod
+    def iter_news(
             self,
-            dbname="postgres",
-            user="postgres",
-            password="scraper",
-            host="db",
-            schema="rsscraper",
-    ):
-        self._dbname = dbname
-        self._host = host
-        self._password = password
-        self._user = user
-        self._schema = schema
-        self._connection = None
-
-    def __str__(self):
-        return self.__repr__()
-
-    def __repr__(self):
-        return f"{self.__class__.__name__}({self._dbname}, {self._host}, ******, {self._user}, {self._schema})"
-
-    def _get_connection(self):
-        if not self._connection:
-            conn = psycopg2.connect(
-                user=self._user, password=self._password, host=self._host
-            )
-            self._connection = conn
-        return self._connection
-
-    def save_feed(self, url, parser=None) -> Feed:
-        conn = self._get_connection()
+            from_date: datetime = None,
+            to_date: datetime = None,
+            batch_size: int = 1000,
+            after_id=None,
+            until_id=None,
+    ) -> Iterator[News]:
+        pass
 
-        SQL_INSERT_FEED = f"""
-        INSERT INTO {self._schema}.feeds
-        (url, body_parser)
-        VALUES(%s, %s) RETURNING id;
-        """
+    @abstractmethod
+    def search_news(
+            self,
+            query: str,
+            limit: int = 20,
+            offset: int = 0,
+            from_date: datetime = None,
+            to_date: datetime = None,
+    ) -> Iterator[FoundNews]:
+        pass
 
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(SQL_INSERT_FEED, (url, parser))
-                (id,) = cur.fetchone()
-                return Feed(id, url, parser)
+    @abstractmethod
+    def get_similar_signatures(self, kind: str, keys: List[int]) -> List[NewsSignature]:
+        pass
 
-    def get_feed_by_url(self, url, **kwargs):
-        conn = self._get_connection()
+    @abstractmethod
+    def save_signatures(self, signatures: List[NewsSignature]) -> None:
+        pass
 
-        SQL_SELECT_FEED = f"""
-        SELECT id, url, body_parser FROM {self._schema}.feeds as f
-        WHERE f.url = %s
+    @abstractmethod
+    def get_export_bound(self):
         """
-
-        try:
-            with conn:
-                with conn.cursor() as cur:
-                    cur.execute(SQL_SELECT_FEED, (url,))
-                    row = cur.fetchone()
-                    if row:
-                        id, url, parser = row
-                        return Feed(id, url, parser)
-                    else:
-                        return self.save_feed(
-                            url=url, parser=kwargs.get("parser", None)
-                        )
-        except psycopg2.errors.UndefinedTable:
-            self.create_schema()
-            return self.save_feed(url=url, parser=kwargs.get("parser", None))
-
-    def save_news(self, news) -> None:
-
-        SQL_INSERT_NEWS = f"""
-        INSERT INTO {self._schema}.news
-        (feed_id, title, short_description, posted, url, hash, full_description)
-        VALUES(%s, %s, %s, %s, %s, %s, %s);
+        return the position to which news are exported by an incremental export, a news visible
+        later must get a greater position, otherwise it is skipped by every next export
         """
+        pass
 
-        conn = self._get_connection()
-        with conn:
-            with conn.cursor() as cur:
-                cur.executemany(
-                    SQL_INSERT_NEWS,
-                    [
-                        (
-                            n.feed.id,
-                            n.title,
-                            n.short_description,
-                            n.posted,
-                            n.url,
-                            n.hash,
-                            n.full_description,
-                        )
-                        for n in news
-                    ],
-                )
+    @abstractmethod
+    def get_news_refs(
+            self, from_date: datetime = None, to_date: datetime = None, after_id=None, limit: int = 1000
+    ) -> List[NewsRef]:
+        pass
 
-    def save_scraper_info(self, scraper_info, by_user=False):
+    @abstractmethod
+    def update_full_descriptions(self, descriptions) -> int:
+        pass
 
-        SQL = f"""INSERT INTO {self._schema}.scraper_info
-                (date_run, count, by_user, url, feed_id)
-                VALUES(%s, %s, %s, %s, %s);
-                """
-        conn = self._get_connection()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(SQL, scraper_info)
+    @abstractmethod
+    def get_watermark(self, destination: str):
+        pass
 
-    def get_news(
-            self, from_date: datetime = None, to_date: datetime = None
-    ) -> List[News]:
-        SQL = f"""
-              SELECT title, short_description, posted, url, hash, full_description 
-              FROM {self._schema}.news
-              """
-        # generate a condition where if select dates
-        WHERE = None
+    @abstractmethod
+    def save_watermark(self, destination: str, last_id) -> None:
+        pass
 
-        if from_date and to_date:
-            WHERE = f"\nWHERE posted between  TO_TIMESTAMP('{from_date.strftime('%Y-%m-%d %H:%M:%S')}', 'YYYY-MM-DD HH24:MI:SS') and TO_TIMESTAMP('{to_date.strftime('%Y-%m-%d %H:%M:%S')}', 'YYYY-MM-DD HH24:MI:SS') "
-        elif from_date:
-            WHERE = f"\nWHERE posted >= TO_TIMESTAMP('{from_date.strftime('%Y-%m-%d %H:%M:%S')}', 'YYYY-MM-DD HH24:MI:SS')"
-        elif to_date:
-            WHERE = f"\nWHERE posted <= TO_TIMESTAMP('{to_date.strftime('%Y-%m-%d %H:%M:%S')}', 'YYYY-MM-DD HH24:MI:SS')"
+    @abstractmethod
+    def delete_watermark(self, destination: str) -> None:
+        pass
 
-        if WHERE:
-            SQL = SQL + WHERE
+    @abstractmethod
+    def create_schema(self, name: str) -> None:
+        pass
 
-        conn = self._get_connection()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(SQL)
-                result = cur.fetchall()
-                return [News(*r) for r in result]
+    @abstractmethod
+    def save_scraper_info(self, scraper_info, by_user=False, metrics: dict = None):
+        pass
 
+    @abstractmethod
     def get_last_posted_date(self):
-        max_date = None
-        self.create_schema()
-        SQL = f"select max(n.posted) from {self._schema}.news n"
-        conn = self._get_connection()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(SQL)
-                (max_date,) = cur.fetchone()
-                return max_date
-
-    def create_schema(self, name: str = None) -> None:
-        """
-        Creates a new schema if the schema exists do nothing
-        """
-        if name:
-            self._schema = name
-
-        conn = self._get_connection()
-
-        DDL = f"""
-        -- DROP SCHEMA {self._schema};
-
-        CREATE SCHEMA {self._schema} AUTHORIZATION postgres;
-
-
-        -- Drop table
-
-        -- DROP TABLE {self._schema}.feeds;
-
-        CREATE TABLE  {self._schema}.feeds (
-            id serial NOT NULL,
-            url varchar NULL,
-            body_parser varchar NULL,
-            CONSTRAINT feeds_pk PRIMARY KEY (id)
-        );
-        CREATE INDEX feeds_url_idx ON {self._schema}.feeds USING btree (url);
-
-        -- Drop table
-
-        -- DROP TABLE {self._schema}.scraper_info;
-
-        CREATE TABLE  {self._schema}.scraper_info (
-            id serial NOT NULL,
-            date_run date NULL,
-            count int4 NULL,
-            by_user bool NULL DEFAULT false,
-            url varchar NULL,
-            feed_id int4 NULL,
-            CONSTRAINT scraper_info_pk PRIMARY KEY (id),
-            CONSTRAINT scraper_info_fk FOREIGN KEY (feed_id) REFERENCES {self._schema}.feeds(id)
-        );
-
-        -- Drop table
-
-        -- DROP TABLE {self._schema}.news;
-
-        CREATE TABLE {self._schema}.news (
-            id serial NOT NULL,
-            feed_id int4 NOT NULL,
-            title varchar NULL,
-            short_description varchar NULL,
-            posted timestamp NULL,
-            url varchar NULL,
-            hash varchar NULL,
-            full_description text NULL,
-            CONSTRAINT news_pk PRIMARY KEY (id),
-            CONSTRAINT news_fk FOREIGN KEY (feed_id) REFERENCES {self._schema}.feeds(id) ON UPDATE CASCADE ON DELETE CASCADE
-        );
-        """
-        with conn:
-            with conn.cursor() as cur:
-                try:
-                    cur.execute(DDL)
-                    conn.commit()
-                except psycopg2.errors.DuplicateSchema:
-                    pass
-
-    def close(self):
-        conn = self._get_connection()
-
-        if not conn.closed:
-            conn.close()
-
-
-class MongoClient(DBClientABC):
-    """
-    Client for working with MongoDB
-    """
-
-    def __init__(self, host="db", port=27017, schema="rsscraper"):
-        self._host = host
-        self._port = port
-        self._connection = None
-        self._db = None
-        self._schema = schema
-
-    @property
-    def connetion(self):
-        if not self._connection:
-            self._connection = pymongo.MongoClient()
-        return self._connection
-
-    @property
-    def db(self):
-        if not self._db:
-            self.create_schema()
-        return self._db
-
-    def save_feed(self, url, parser=None):
-        db = self.db
-        feeds = db["feeds"]
-
-        data = {"url": url, "parser": parser}
-        result = feeds.insert_one(data)
-        return result
-
-    def get_feed_by_url(self, url):
-        db = self.db
-        feeds = db["feeds"]
-        result = feeds.find_one({"url": url})
-        if not result:
-            resp = self.save_feed(url)
-            return Feed(resp.inserted_id, "url", None)
-        return Feed(result["_id"], result["url"], result["parser"])
-
-    def save_news(self, news) -> None:
-        db = self.db
-        collection = db["news"]
-        data = [
-            {
-                "feed_id": n.feed.id,
-                "title": n.title,
-                "short_description": n.short_description,
-                "posted": n.posted,
-                "url": n.url,
-                "hash": n.hash,
-                "full_description": n.full_description,
-            }
-            for n in news
-        ]
-        result = collection.insert_many(data)
-
-    def get_news(self, from_date: datetime = None, to_date: datetime = None ) -> List[News]:
-        db = self.db
-        news = db["news"]
-        result = []
-
-        if from_date and to_date:
-            documents = news.find({'posted': {'$lt': to_date, '$gt': from_date}})
-        elif to_date:
-            documents = news.find({'posted': {'$lt': to_date}})
-        elif from_date:
-            documents = news.find({'posted': {'$gt': from_date}})
-        else:
-            documents = news.find()
-
-        for n in documents:
-            result.append(
-                News(
-                    n["title"],
-                    n["short_description"],
-                    n["posted"],
-                    n["url"],
-                    n["hash"],
-                    n["full_description"],
-                )
-            )
-        return result
+        pass
 
-    def create_schema(self, name: str = None) -> None:
-        if name:
-            self._schema = name
+    @abstractmethod
+    def clone(self, schema: str = None) -> "DBClientABC":
+        pass
 
-        if not self._db:
-            conn = self.connetion
-            self._db = conn[f"{self._schema}"]
-        return self._db
+    @abstractmethod
+    def close(self) -> None:
+        pass
 
-    def save_scraper_info(self, scraper_info, by_user=False):
-        db = self.db
-        scraper = db["scraper_info"]
-        data = {
-            "run_date": scraper_info[0],
-            "count": scraper_info[1],
-            "by_user": scraper_info[2],
-            "url": scraper_info[3],
-            "feed_id": str(scraper_info[4]),
-        }
-        scraper.insert_one(data)
 
-    def get_last_posted_date(self):
-        db = self.db
-        news = db["news"]
-        last_dt = None
-        try:
-            last_dt = (
-                news.find().sort("posted", pymongo.DESCENDING).limit(1)[0]["posted"]
-            )
-        except IndexError:
-            pass
-        return last_dt
+# clients live in their own modules, so a driver is imported only with its client
+_CLIENT_MODULES = {
+    "PostgresClient": "postgres",
+    "BlockingConnectionPool": "postgres",
+    "MongoClient": "mongo",
+}
 
 
+def __getattr__(name):
+    """import a client on the first access, from clients import PostgresClient still works"""
+    module = _CLIENT_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module), name)
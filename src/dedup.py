@@ -0,0 +1,179 @@
+import hashlib
+import re
+import struct
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+from clients import DBClientABC, NewsSignature
+
+# kinds of signatures, a summary is the title and the short description of a news in the feed,
+# a body is its cleaned full description
+SUMMARY = "summary"
+BODY = "body"
+
+WORD = re.compile(r"\w+", re.UNICODE)
+TAG = re.compile(r"<[^>]+>")
+
+# the finalizer of splitmix64, it spreads bits of combined hashes of words
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_PRIME = np.uint64(0x100000001B3)
+
+
+def words(text: str) -> List[str]:
+    return WORD.findall(TAG.sub(" ", text or "").lower())
+
+
+def shingle_hashes(tokens: List[str], size: int) -> np.ndarray:
+    """return 64-bit hashes of all runs of size words, hashes are the same in every process"""
+    if len(tokens) < size:
+        return np.empty(0, dtype=np.uint64)
+    w = np.fromiter((zlib.crc32(t.encode("utf8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+    count = len(tokens) - size + 1
+    h = np.zeros(count, dtype=np.uint64)
+    for i in range(size):
+        h = h * _PRIME + w[i:i + count]
+    h ^= h >> np.uint64(30)
+    h *= _MIX1
+    h ^= h >> np.uint64(27)
+    h *= _MIX2
+    h ^= h >> np.uint64(31)
+    return np.unique(h)
+
+
+class MinHasher:
+    """
+    MinHash of sets of shingles by num_perm hash functions a * x + b >> 32,
+    the share of equal values of two signatures estimates the Jaccard similarity of the sets
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        # the state is seeded, so signatures of all processes and runs are comparable
+        random = np.random.RandomState(seed)
+        self._a = np.frombuffer(random.bytes(8 * num_perm), dtype=np.uint64) | np.uint64(1)
+        self._b = np.frombuffer(random.bytes(8 * num_perm), dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        values = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return values.min(axis=0).astype("<u4")
+
+
+def band_keys(signature: bytes, bands: int) -> List[int]:
+    """
+    return keys of bands of the signature for LSH, signatures with an equal band
+    have the same key, a key is a signed 64-bit number
+    """
+    rows = len(signature) // bands
+    keys = []
+    for band in range(bands):
+        digest = hashlib.blake2b(
+            struct.pack("<H", band) + signature[band * rows:(band + 1) * rows], digest_size=8
+        ).digest()
+        keys.append(struct.unpack("<q", digest)[0])
+    return keys
+
+
+class NearDuplicates:
+    """
+    Finds news which tell a story which is already saved under other URL, e.g. a wire story
+    syndicated by many feeds. Texts are compared by MinHash, summaries by their words before
+    pages are downloaded and bodies by runs of 3 words after cleaning. Signatures are found by LSH:
+    a signature is split into bands and news with an equal band are candidates, keys of bands
+    are kept in the database, so news of all runs and workers of the schema are compared.
+
+    With skip "download" a news which summary matches a saved story is not downloaded,
+    with skip "store" its body is not saved when it matches a saved body. A duplicate is saved
+    without full description and its signature refers to the original news
+    """
+
+    def __init__(
+            self,
+            skip: str = "store",
+            threshold: float = 0.7,
+            summary_threshold: float = 0.8,
+            num_perm: int = 64,
+            bands: int = 16,
+            min_words: int = 8,
+    ):
+        if skip not in ("download", "store"):
+            raise ValueError(f"unknown skip {skip}, use download or store")
+        self.skip = skip
+        # texts are similar from this estimated Jaccard similarity of their shingles, a word changed
+        # in a short summary changes a bigger part of its words, but formulaic titles of different
+        # stories share many words, so summaries must be closer
+        self._thresholds = {SUMMARY: summary_threshold, BODY: threshold}
+        # shingles are words of summaries and runs of words of bodies, an edited sentence of a body
+        # changes few runs, but runs of a short summary would all be changed by a few edits
+        self._shingles = {SUMMARY: 1, BODY: 3}
+        self._bands = bands
+        # shorter texts are not compared, almost all of them look similar
+        self._min_words = min_words
+        self._minhasher = MinHasher(num_perm)
+
+    def signature(self, kind: str, text: str):
+        """return the signature of the text as bytes and keys of its bands or None for a short text"""
+        tokens = words(text)
+        if len(tokens) < self._min_words:
+            return None
+        signature = self._minhasher.signature(shingle_hashes(tokens, self._shingles[kind])).tobytes()
+        return signature, band_keys(signature, self._bands)
+
+    def similar(self, kind: str, first: bytes, second: bytes) -> bool:
+        equal = np.frombuffer(first, dtype="<u4") == np.frombuffer(second, dtype="<u4")
+        return equal.mean() >= self._thresholds[kind]
+
+    def mark_summaries(self, client: DBClientABC, news) -> int:
+        """mark news which titles and short descriptions match saved news, used before downloading"""
+        return self._mark(client, SUMMARY, news)
+
+    def mark_bodies(self, client: DBClientABC, news) -> int:
+        """mark news which cleaned pages match saved news, used before saving"""
+        return self._mark(client, BODY, news)
+
+    def _mark(self, client: DBClientABC, kind: str, news) -> int:
+        """
+        set duplicate_of of news which match a saved news or an earlier news of the list,
+        return the number of duplicates. Signatures are added to .signatures of news and are
+        saved with news. Only originals are put into bands, so every story has one entry in the index
+        """
+        texts = {
+            SUMMARY: lambda n: f"{n.title or ''} {n.short_description or ''}",
+            BODY: lambda n: n.full_description,
+        }[kind]
+        signed = []
+        for n in news:
+            found = self.signature(kind, texts(n))
+            if found:
+                signed.append((n, found[0], found[1]))
+        if not signed:
+            return 0
+
+        # candidates saved by other runs, the earlier news of the list are added to them
+        candidates: Dict[int, list] = {}
+        for s in client.get_similar_signatures(kind, [k for _, _, keys in signed for k in keys]):
+            for key in s.keys:
+                candidates.setdefault(key, []).append((s.hash, s.signature))
+
+        duplicates = 0
+        for n, signature, keys in signed:
+            original = n.duplicate_of
+            if not original:
+                for key in keys:
+                    match = next(
+                        (h for h, other in candidates.get(key, []) if h != n.hash and self.similar(kind, signature, other)),
+                        None,
+                    )
+                    if match:
+                        original = match
+                        break
+            if original:
+                n.duplicate_of = original
+                duplicates += 1
+                n.signatures.append(NewsSignature(n.hash, kind, signature, original, []))
+            else:
+                for key in keys:
+                    candidates.setdefault(key, []).append((n.hash, signature))
+                n.signatures.append(NewsSignature(n.hash, kind, signature, None, keys))
+        return duplicates
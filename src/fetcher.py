@@ -0,0 +1,286 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# the host is overloaded, it is asked less often
+THROTTLE_STATUSES = {429, 503}
+# the host failed, the request is tried again
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+# the connection or the answer broke, the request is tried again
+RETRY_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
+
+
+class CircuitOpenError(requests.RequestException):
+    """the host failed many times in a row, its requests are not sent for a while"""
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average and burst requests at once,
+    acquire waits for a token
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self._rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after failures in a row, an open breaker rejects requests for reset_timeout seconds,
+    then one request is let through, its success closes the breaker and its failure opens it again
+    """
+
+    def __init__(self, failures: int = 5, reset_timeout: float = 30):
+        self._max_failures = failures
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened is not None
+
+    def check(self, host: str) -> None:
+        """raise CircuitOpenError when a request to the host must not be sent"""
+        with self._lock:
+            if self._opened is None:
+                return
+            if not self._probing and time.monotonic() - self._opened >= self._reset_timeout:
+                self._probing = True
+                return
+        raise CircuitOpenError(f"circuit of {host} is open after {self._failures} failures")
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._probing = False
+
+    def failed(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._max_failures:
+                self._opened = time.monotonic()
+                self._probing = False
+
+    def throttled(self) -> None:
+        """the host is overloaded, it is not a failure but a probe does not close the breaker"""
+        with self._lock:
+            if self._probing:
+                self._opened = time.monotonic()
+                self._probing = False
+
+
+class HostLimiter:
+    """
+    Limits requests to one host: a token bucket for the rate and a limit of parallel requests
+    which is adapted by AIMD, it grows by one per limit successful fast requests and is halved
+    when the host throttles, fails or answers slower than slow seconds
+    """
+
+    def __init__(
+            self,
+            rate: float = None,
+            burst: int = 1,
+            concurrency: int = 4,
+            max_concurrency: int = 16,
+            slow: float = 5.0,
+            breaker: CircuitBreaker = None,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.limit = float(concurrency)
+        self._max_concurrency = max_concurrency
+        self._slow = slow
+        self.inflight = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self._condition:
+            while self.inflight >= int(self.limit):
+                self._condition.wait()
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.inflight -= 1
+                self._condition.notify()
+
+    def _decrease(self) -> None:
+        with self._condition:
+            self.limit = max(1.0, self.limit / 2)
+
+    def succeeded(self, seconds: float) -> None:
+        self.breaker.succeeded()
+        if seconds > self._slow:
+            self._decrease()
+            return
+        with self._condition:
+            self.limit = min(self._max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def throttled(self) -> None:
+        self.breaker.throttled()
+        self._decrease()
+
+    def failed(self) -> None:
+        self.breaker.failed()
+        self._decrease()
+
+
+def retry_after(response: requests.Response):
+    """return seconds from the header Retry-After or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class Fetcher:
+    """
+    HTTP client shared by feeds and downloads of one process, it has the method get
+    of requests.Session and is used instead of it. Connections are kept alive in a pool,
+    every host has its own HostLimiter and circuit breaker, failed requests are retried
+    with jittered exponential backoff or after Retry-After of the host
+    """
+
+    def __init__(
+            self,
+            rate: float = None,
+            burst: int = 5,
+            concurrency: int = 8,
+            max_concurrency: int = 32,
+            retries: int = 3,
+            backoff: float = 0.5,
+            max_backoff: float = 30.0,
+            failures: int = 5,
+            reset_timeout: float = 30.0,
+            timeout: float = 10.0,
+            pool_size: int = 32,
+            session: requests.Session = None,
+    ):
+        self._rate = rate
+        self._burst = burst
+        self._concurrency = concurrency
+        self._max_concurrency = max_concurrency
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._failures = failures
+        self._reset_timeout = reset_timeout
+        self._timeout = timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+        self.session = session or requests.Session()
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def host(self, host: str) -> HostLimiter:
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = self._hosts[host] = HostLimiter(
+                    rate=self._rate,
+                    burst=self._burst,
+                    concurrency=self._concurrency,
+                    max_concurrency=self._max_concurrency,
+                    # a request slower than half of the timeout overloads the host
+                    slow=self._timeout / 2,
+                    breaker=CircuitBreaker(self._failures, self._reset_timeout),
+                )
+            return limiter
+
+    def _delay(self, attempt: int) -> float:
+        # full jitter, requests of many workers to one host do not come at the same time
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+
+    def get(self, url, headers=None, timeout=None, **kwargs) -> requests.Response:
+        """
+        send GET by the limiter of the host, return the response or raise the error of the last attempt,
+        a response with an error status which is not retried is returned as is
+        """
+        host = urlsplit(url).hostname or ""
+        limiter = self.host(host)
+        timeout = timeout or self._timeout
+
+        for attempt in range(self._retries + 1):
+            if attempt and limiter.breaker.is_open:
+                # the host is given up, the result of the last attempt is returned
+                break
+            limiter.breaker.check(host)
+            limiter.bucket.acquire()
+            delay = None
+            with limiter.slot():
+                start = time.monotonic()
+                try:
+                    response = self.session.get(url, headers=headers, timeout=timeout, **kwargs)
+                except RETRY_ERRORS as e:
+                    limiter.failed()
+                    error, response = e, None
+                except Exception:
+                    # the request is not tried again, but every outcome of a probe must reach the breaker
+                    limiter.failed()
+                    raise
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        limiter.succeeded(time.monotonic() - start)
+                        return response
+                    if response.status_code in THROTTLE_STATUSES:
+                        limiter.throttled()
+                    else:
+                        limiter.failed()
+                    error, delay = None, retry_after(response)
+
+            if attempt < self._retries:
+                time.sleep(min(delay, self._max_backoff) if delay is not None else self._delay(attempt))
+
+        if response is not None:
+            return response
+        raise error
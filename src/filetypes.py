@@ -1,37 +1,189 @@
 import csv
+import gzip
+import io
+import json
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterable
 from clients import News
+from registry import FILETYPES
+
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class _TextWriter(io.TextIOBase):
+    """
+    Text file over a binary stream, used for streams which can not be wrapped by io.TextIOWrapper
+    """
+
+    def __init__(self, raw, encoding="utf-8"):
+        self._raw = raw
+        self._encoding = encoding
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._raw.write(text.encode(self._encoding))
+        return len(text)
+
+
+@contextmanager
+def open_text(filename, compression: str = None):
+    """
+    Open the file for writing text, the text is compressed by gzip or zstd if compression is set
+    """
+    if compression is None:
+        with open(filename, "w", newline="") as f:
+            yield f
+    elif compression == "gzip":
+        with gzip.open(filename, "wt", newline="") as f:
+            yield f
+    elif compression == "zstd":
+        import zstandard
+
+        with open(filename, "wb") as f:
+            writer = zstandard.ZstdCompressor().stream_writer(f)
+            yield _TextWriter(writer)
+            writer.flush(zstandard.FLUSH_FRAME)
+    else:
+        raise ValueError(f"unknown compression {compression}")
 
 
 class ABCType(ABC):
     """An abstract class with a single method, for saving news to file"""
 
+    extension = None
+
     @abstractmethod
-    def save(cls, news: List[News], filename: str = None) -> None:
+    def save(cls, news: Iterable[News], filename: str = None) -> int:
         pass
 
+    @staticmethod
+    def default_filename(extension: str) -> Path:
+        # saves the file to the default folder ./output
+        path = Path(__file__).parent.joinpath("output")
+        return path.joinpath(
+            f"output_news_{datetime.now().timestamp()}.{extension}"
+        ).absolute()
+
 
 class CSVType(ABCType):
-    def save(self, news: List[News], filename=None):
+    def __init__(self, compression: str = None):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"unknown compression {compression}")
+        self.compression = compression
+
+    @property
+    def extension(self) -> str:
+        return "csv" + COMPRESSION_EXTENSIONS[self.compression]
+
+    def open(self, filename):
         """
-        Save data to file
+        Open the file for writing text, the text is compressed if compression is set
+        """
+        return open_text(filename, self.compression)
+
+    def save(self, news: Iterable[News], filename=None) -> int:
+        """
+        Save data to file row by row, return the number of saved news
         """
 
         if not filename:
-            # saves the file to the default folder ./output
-            path = Path(__file__).parent.joinpath("output")
-            filename = path.joinpath(
-                f"output_news_{datetime.now().timestamp()}.csv"
-            ).absolute()
+            filename = self.default_filename(self.extension)
 
-        with open(filename, "w") as csvfile:
+        with self.open(filename) as csvfile:
             writer = csv.writer(csvfile, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
             # for a header use fields from 'News'
             writer.writerow(list(News._fields))
-            writer.writerows(news)
-            print(f'exported to {filename}')
+            count = 0
+            for n in news:
+                writer.writerow(n)
+                count += 1
+        return count
+
+
+class JSONLinesType(ABCType):
+    """
+    Saves every news as a JSON object on a separate line
+    """
+
+    def __init__(self, compression: str = None):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"unknown compression {compression}")
+        self.compression = compression
+
+    @property
+    def extension(self) -> str:
+        return "jsonl" + COMPRESSION_EXTENSIONS[self.compression]
+
+    def save(self, news: Iterable[News], filename=None) -> int:
+        if not filename:
+            filename = self.default_filename(self.extension)
+
+        count = 0
+        with open_text(filename, self.compression) as f:
+            for n in news:
+                data = n._asdict()
+                if data["posted"]:
+                    data["posted"] = data["posted"].isoformat()
+                f.write(json.dumps(data, ensure_ascii=False))
+                f.write("\n")
+                count += 1
+        return count
+
+
+class ParquetType(ABCType):
+    """
+    Saves news to a Parquet file, every row_group_size news are written as a separate row group
+    """
+
+    extension = "parquet"
+
+    def __init__(self, row_group_size: int = 10000, compression: str = "snappy"):
+        self.row_group_size = row_group_size
+        self.compression = compression
+
+    def save(self, news: Iterable[News], filename=None) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not filename:
+            filename = self.default_filename(self.extension)
+
+        schema = pa.schema(
+            [
+                ("title", pa.string()),
+                ("short_description", pa.string()),
+                ("posted", pa.timestamp("us")),
+                ("url", pa.string()),
+                ("hash", pa.string()),
+                ("full_description", pa.string()),
+            ]
+        )
+
+        def write(writer, rows):
+            columns = zip(*rows)
+            arrays = [pa.array(c, type=f.type) for c, f in zip(columns, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+        count = 0
+        with pq.ParquetWriter(str(filename), schema, compression=self.compression) as writer:
+            rows = []
+            for n in news:
+                rows.append(n)
+                if len(rows) == self.row_group_size:
+                    write(writer, rows)
+                    count += len(rows)
+                    rows = []
+            if rows:
+                write(writer, rows)
+                count += len(rows)
+        return count
 
 
+def get_filetype(name: str) -> ABCType:
+    """return a file type by the name of the export format, formats are registered in registry.FILETYPES"""
+    return FILETYPES.create(name)
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class RunMetrics:
+    """
+    Durations of stages and counters of one run of a feed
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        # seconds by stage, a stage which runs several times is summed
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self) -> Dict:
+        return {"stages": dict(self.stages), "counters": dict(self.counters)}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+class PrometheusTextfile:
+    """
+    Writes metrics of the last run of every feed to a separate file for the textfile collector
+    of the node exporter
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def export(self, labels: Dict[str, str], metrics: RunMetrics) -> None:
+        name = hashlib.sha1(_labels(labels).encode("utf8")).hexdigest()[:16]
+        path = os.path.join(self._directory, f"scraper_{name}.prom")
+        lines = [
+            "# HELP scraper_stage_seconds Duration of a stage of the last run of the feed",
+            "# TYPE scraper_stage_seconds gauge",
+        ]
+        for stage, seconds in sorted(metrics.stages.items()):
+            lines.append(f"scraper_stage_seconds{_labels({**labels, 'stage': stage})} {seconds:.6f}")
+        lines += [
+            "# HELP scraper_items Counters of the last run of the feed",
+            "# TYPE scraper_items gauge",
+        ]
+        for counter, value in sorted(metrics.counters.items()):
+            lines.append(f"scraper_items{_labels({**labels, 'counter': counter})} {value}")
+        lines += [
+            "# HELP scraper_last_run_timestamp_seconds Start of the last run of the feed",
+            "# TYPE scraper_last_run_timestamp_seconds gauge",
+            f"scraper_last_run_timestamp_seconds{_labels(labels)} {metrics.started:.3f}",
+        ]
+        # the collector must never read a half-written file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+
+class StatsdExporter:
+    """
+    Sends metrics of a run to StatsD by UDP, stages as timers in milliseconds and counters as counts
+    """
+
+    def __init__(self, address: str, prefix: str = "scraper"):
+        host, _, port = address.partition(":")
+        self._address = (host, int(port or 8125))
+        self._prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def export(self, labels: Dict[str, str], metrics: RunMetrics) -> None:
+        schema = labels.get("schema", "default")
+        prefix = f"{self._prefix}.{schema}"
+        lines = [f"{prefix}.stage.{stage}:{seconds * 1000:.3f}|ms" for stage, seconds in metrics.stages.items()]
+        lines += [f"{prefix}.{counter}:{value}|c" for counter, value in metrics.counters.items()]
+        for line in lines:
+            self._socket.sendto(line.encode("utf8"), self._address)
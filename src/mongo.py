@@ -0,0 +1,386 @@
+from datetime import datetime, timedelta
+from typing import Iterator, List, Set
+
+import pymongo
+from bson import ObjectId
+
+from clients import DBClientABC, Feed, FeedHistory, FoundNews, News, NewsRef, NewsSignature
+
+# news saved in this time are left for the next incremental export, ids of upserted news are
+# taken by the server at the write, so the lag covers writes in flight and clocks of members
+# of a cluster, a news written later than the lag after its id is skipped by incremental exports
+EXPORT_LAG = timedelta(minutes=1)
+
+
+class MongoClient(DBClientABC):
+    """
+    Client for working with MongoDB
+    """
+
+    def __init__(self, host="db", port=27017, schema="rsscraper", connection=None):
+        self._host = host
+        self._port = port
+        # a connection received from other client is shared and is not closed by this client
+        self._connection = connection
+        self._shared = connection is not None
+        self._db = None
+        self._schema = schema
+
+    @property
+    def connetion(self):
+        if not self._connection:
+            self._connection = pymongo.MongoClient()
+        return self._connection
+
+    @property
+    def db(self):
+        if not self._db:
+            self.create_schema()
+        return self._db
+
+    def save_feed(self, url, parser=None):
+        db = self.db
+        feeds = db["feeds"]
+
+        data = {"url": url, "parser": parser}
+        result = feeds.insert_one(data)
+        return result
+
+    def get_feed_by_url(self, url, **kwargs):
+        db = self.db
+        feeds = db["feeds"]
+        result = feeds.find_one({"url": url})
+        if not result:
+            parser = kwargs.get("parser", None)
+            resp = self.save_feed(url, parser)
+            return Feed(resp.inserted_id, url, parser)
+        return self._feed(result)
+
+    def get_feeds(self) -> List[Feed]:
+        db = self.db
+        feeds = db["feeds"]
+        return [self._feed(f) for f in feeds.find().sort("_id")]
+
+    @staticmethod
+    def _feed(document) -> Feed:
+        return Feed(
+            document["_id"],
+            document["url"],
+            document["parser"],
+            document.get("etag"),
+            document.get("modified"),
+            document.get("poll_interval"),
+            document.get("next_poll_at"),
+        )
+
+    def save_feed_validators(self, feed_id, etag: str = None, modified: str = None) -> None:
+        db = self.db
+        feeds = db["feeds"]
+        feeds.update_one({"_id": feed_id}, {"$set": {"etag": etag, "modified": modified}})
+
+    def get_feed_history(self, feed_id, limit: int = 20) -> FeedHistory:
+        db = self.db
+        news = db["news"].find({"feed_id": feed_id, "posted": {"$ne": None}}, {"posted": 1})
+        runs = db["scraper_info"].find({"feed_id": str(feed_id)}, {"count": 1})
+        return FeedHistory(
+            [n["posted"] for n in news.sort("posted", pymongo.DESCENDING).limit(limit)],
+            [r["count"] for r in runs.sort("_id", pymongo.DESCENDING).limit(limit)],
+        )
+
+    def save_feed_schedule(self, feed_id, poll_interval: float, next_poll_at: datetime) -> None:
+        db = self.db
+        feeds = db["feeds"]
+        feeds.update_one(
+            {"_id": feed_id}, {"$set": {"poll_interval": poll_interval, "next_poll_at": next_poll_at}}
+        )
+
+    def save_news(self, news) -> int:
+        db = self.db
+        collection = db["news"]
+        # upsert by hash inserts only news which are not saved yet
+        operations = [
+            pymongo.UpdateOne(
+                {"hash": n.hash},
+                {
+                    "$setOnInsert": {
+                        "feed_id": n.feed.id,
+                        "title": n.title,
+                        "short_description": n.short_description,
+                        "posted": n.posted,
+                        "url": n.url,
+                        "hash": n.hash,
+                        "full_description": n.full_description,
+                    }
+                },
+                upsert=True,
+            )
+            for n in news
+        ]
+        if not operations:
+            return 0
+        result = collection.bulk_write(operations, ordered=False)
+        return result.upserted_count
+
+    def get_existing_hashes(self, hashes: List[str]) -> Set[str]:
+        db = self.db
+        news = db["news"]
+        documents = news.find({"hash": {"$in": list(hashes)}}, {"hash": 1})
+        return {n["hash"] for n in documents}
+
+    def get_news(self, from_date: datetime = None, to_date: datetime = None ) -> List[News]:
+        return list(self.iter_news(from_date, to_date))
+
+    def iter_news(
+            self,
+            from_date: datetime = None,
+            to_date: datetime = None,
+            batch_size: int = 1000,
+            after_id=None,
+            until_id=None,
+    ) -> Iterator[News]:
+        db = self.db
+        news = db["news"]
+
+        query = self._posted_filter(from_date, to_date)
+        if after_id is not None or until_id is not None:
+            query["_id"] = {}
+            if after_id is not None:
+                query["_id"]["$gt"] = after_id
+            if until_id is not None:
+                query["_id"]["$lte"] = until_id
+
+        documents = news.find(query, batch_size=batch_size)
+        if "_id" in query:
+            # an incremental export goes in order of id to the watermark
+            documents = documents.sort("_id")
+
+        for n in documents:
+            yield News(
+                n["title"],
+                n["short_description"],
+                n["posted"],
+                n["url"],
+                n["hash"],
+                n["full_description"],
+            )
+
+    @staticmethod
+    def _posted_filter(from_date: datetime = None, to_date: datetime = None) -> dict:
+        if from_date and to_date:
+            return {'posted': {'$lt': to_date, '$gt': from_date}}
+        elif to_date:
+            return {'posted': {'$lt': to_date}}
+        elif from_date:
+            return {'posted': {'$gt': from_date}}
+        return {}
+
+    def search_news(
+            self,
+            query: str,
+            limit: int = 20,
+            offset: int = 0,
+            from_date: datetime = None,
+            to_date: datetime = None,
+    ) -> Iterator[FoundNews]:
+        """
+        Yield news matched by the query by the text index, the best scored first,
+        MongoDB has no headlines, so the short description is the headline
+        """
+        conditions = self._posted_filter(from_date, to_date)
+        conditions["$text"] = {"$search": query}
+        score = {"$meta": "textScore"}
+        documents = (
+            self.db["news"]
+            .find(conditions, {"title": 1, "posted": 1, "url": 1, "short_description": 1, "score": score})
+            .sort([("score", score), ("posted", pymongo.DESCENDING)])
+            .skip(offset)
+            .limit(limit)
+        )
+        for n in documents:
+            yield FoundNews(n["_id"], n["title"], n["posted"], n["url"], n["score"], n["short_description"])
+
+    def get_similar_signatures(self, kind: str, keys: List[int]) -> List[NewsSignature]:
+        db = self.db
+        found = {}
+        for band in db["news_bands"].find({"kind": kind, "key": {"$in": list(set(keys))}}):
+            found.setdefault(band["hash"], []).append(band["key"])
+        if not found:
+            return []
+        documents = db["news_signatures"].find({"kind": kind, "hash": {"$in": list(found)}})
+        return [
+            NewsSignature(s["hash"], kind, bytes(s["signature"]), s.get("duplicate_of"), found[s["hash"]])
+            for s in documents
+        ]
+
+    def save_signatures(self, signatures: List[NewsSignature]) -> None:
+        if not signatures:
+            return
+        db = self.db
+        db["news_signatures"].bulk_write(
+            [
+                pymongo.UpdateOne(
+                    {"hash": s.hash, "kind": s.kind},
+                    {"$setOnInsert": {"signature": s.signature, "duplicate_of": s.duplicate_of}},
+                    upsert=True,
+                )
+                for s in signatures
+            ],
+            ordered=False,
+        )
+        bands = [
+            pymongo.ReplaceOne(
+                {"kind": s.kind, "key": key, "hash": s.hash}, {"kind": s.kind, "key": key, "hash": s.hash}, upsert=True
+            )
+            for s in signatures
+            for key in s.keys
+        ]
+        if bands:
+            db["news_bands"].bulk_write(bands, ordered=False)
+
+    def get_export_bound(self):
+        """
+        return the max id of news saved EXPORT_LAG ago by the clock of the server, ids are taken
+        before writes, so a news with a lower id can be saved after a higher one in this time
+        """
+        db = self.db
+        news = db["news"]
+        now = db.command("isMaster")["localTime"]
+        bound = ObjectId.from_datetime(now - EXPORT_LAG)
+        last = news.find_one({"_id": {"$lt": bound}}, sort=[("_id", pymongo.DESCENDING)], projection={"_id": 1})
+        return last["_id"] if last else None
+
+    def get_news_refs(
+            self, from_date: datetime = None, to_date: datetime = None, after_id=None, limit: int = 1000
+    ) -> List[NewsRef]:
+        db = self.db
+        news = db["news"]
+        query = {}
+        if from_date or to_date:
+            query["posted"] = {}
+            if from_date:
+                query["posted"]["$gte"] = from_date
+            if to_date:
+                query["posted"]["$lte"] = to_date
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        documents = news.find(query, {"hash": 1, "url": 1}).sort("_id").limit(limit)
+        return [NewsRef(n["_id"], n["hash"], n["url"]) for n in documents]
+
+    def update_full_descriptions(self, descriptions) -> int:
+        db = self.db
+        news = db["news"]
+        operations = [
+            pymongo.UpdateOne({"_id": id}, {"$set": {"full_description": text}})
+            for id, text in descriptions
+        ]
+        if not operations:
+            return 0
+        news.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    def get_watermark(self, destination: str):
+        db = self.db
+        watermarks = db["export_watermarks"]
+        result = watermarks.find_one({"_id": destination})
+        return result["last_id"] if result else None
+
+    def save_watermark(self, destination: str, last_id) -> None:
+        db = self.db
+        watermarks = db["export_watermarks"]
+        watermarks.update_one(
+            {"_id": destination},
+            {"$set": {"last_id": last_id, "updated": datetime.now()}},
+            upsert=True,
+        )
+
+    def delete_watermark(self, destination: str) -> None:
+        db = self.db
+        db["export_watermarks"].delete_one({"_id": destination})
+
+    def create_schema(self, name: str = None) -> None:
+        if name:
+            self._schema = name
+
+        if not self._db:
+            conn = self.connetion
+            self._db = conn[f"{self._schema}"]
+            if "hash_1" not in self._db["news"].index_information():
+                removed = self._remove_duplicate_news(self._db["news"])
+                if removed:
+                    print(f"{removed} duplicates of saved news are deleted before the unique index of hashes")
+            self._db["news"].create_index("hash", unique=True)
+            # one text index of a collection, words of the title weigh more than words of descriptions
+            self._db["news"].create_index(
+                [
+                    ("title", pymongo.TEXT),
+                    ("short_description", pymongo.TEXT),
+                    ("full_description", pymongo.TEXT),
+                ],
+                weights={"title": 10, "short_description": 5, "full_description": 1},
+                default_language="english",
+                name="news_text_idx",
+            )
+            self._db["news_signatures"].create_index([("hash", 1), ("kind", 1)], unique=True)
+            self._db["news_bands"].create_index([("kind", 1), ("key", 1), ("hash", 1)], unique=True)
+        return self._db
+
+    @staticmethod
+    def _remove_duplicate_news(news) -> int:
+        """
+        Delete news saved more than once by versions without the unique index of hashes,
+        the oldest news of a hash is kept like the first insert of Postgres
+        """
+        duplicates = news.aggregate(
+            [
+                {"$sort": {"_id": 1}},
+                {"$group": {"_id": "$hash", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}},
+            ],
+            allowDiskUse=True,
+        )
+        removed = 0
+        for d in duplicates:
+            removed += news.delete_many({"_id": {"$in": d["ids"][1:]}}).deleted_count
+        return removed
+
+    def save_scraper_info(self, scraper_info, by_user=False, metrics: dict = None):
+        db = self.db
+        scraper = db["scraper_info"]
+        data = {
+            "run_date": scraper_info[0],
+            "count": scraper_info[1],
+            "by_user": scraper_info[2],
+            "url": scraper_info[3],
+            "feed_id": str(scraper_info[4]),
+            "metrics": metrics,
+        }
+        scraper.insert_one(data)
+
+    def get_last_posted_date(self):
+        db = self.db
+        news = db["news"]
+        last_dt = None
+        try:
+            last_dt = (
+                news.find().sort("posted", pymongo.DESCENDING).limit(1)[0]["posted"]
+            )
+        except IndexError:
+            pass
+        return last_dt
+
+    def clone(self, schema: str = None) -> "MongoClient":
+        """
+        Return a new client with the same settings, clients share one connection
+        """
+        return self.__class__(
+            host=self._host,
+            port=self._port,
+            schema=schema or self._schema,
+            connection=self.connetion,
+        )
+
+    def close(self):
+        if self._connection and not self._shared:
+            self._connection.close()
+            self._connection = None
+            self._db = None
@@ -1,6 +1,9 @@
-from bs4 import BeautifulSoup
+import threading
+import time
+from bs4 import BeautifulSoup, SoupStrainer
 from html2text import HTML2Text
 from abc import ABC, abstractmethod
+from registry import PARSERS
 
 
 class ABCParser(ABC):
@@ -44,3 +47,108 @@ class ReutersParser(ABCParser):
         parser.ignore_links = True
         data = parser.handle(str(headline) + str(body))
         return data
+
+
+class _Converter(HTML2Text):
+    """
+    HTML2Text which restores its initial state before every page, so one converter
+    cleans many pages with the same result as a new one
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.ignore_images = True
+        self.ignore_links = True
+        self._initial = dict(self.__dict__)
+
+    def handle(self, data: str) -> str:
+        self.__dict__.update(
+            (k, v.copy() if isinstance(v, (list, dict)) else v) for k, v in self._initial.items()
+        )
+        return super().handle(data)
+
+
+class FastReutersParser(ReutersParser):
+    """
+    ReutersParser which builds the tree only from the headline, body and garbage blocks,
+    scripts and navigation of the page are skipped while parsing, the result is the same.
+    Garbage blocks out of the body are parsed too, ReutersParser clears only the first garbage
+    block of the page, which can be before the body or contain the headline
+    """
+
+    features = "html.parser"
+    _strainers = {}
+    _local = threading.local()
+
+    @classmethod
+    def _strainer(cls) -> SoupStrainer:
+        # blocks are class attributes, so a subclass with other blocks has its own strainer
+        strainer = cls._strainers.get(cls)
+        if strainer is None:
+            blocks = [cls.headline_block, cls.body_block] + list(cls.garbage_blocks)
+            strainer = cls._strainers[cls] = SoupStrainer(
+                lambda name, attrs: any(
+                    name == tag and classes['class'] in (attrs.get('class') or '').split()
+                    for tag, classes in blocks
+                )
+            )
+        return strainer
+
+    @classmethod
+    def _converter(cls) -> _Converter:
+        # HTML2Text keeps state while converting, so every thread has its own converter
+        converter = getattr(cls._local, 'converter', None)
+        if converter is None:
+            converter = cls._local.converter = _Converter()
+        return converter
+
+    @classmethod
+    def cleaned_data(cls, text: str) -> str:
+        """
+        return clean text news body
+        """
+        soup = BeautifulSoup(text, features=cls.features, parse_only=cls._strainer())
+
+        # the first garbage block of the page is cleared like by ReutersParser,
+        # blocks of the strained tree are in the same order as on the page
+        for b in cls.garbage_blocks:
+            block = soup.find(*b)
+            if block:
+                block.clear()
+
+        headline = soup.find(*cls.headline_block)
+        body = soup.find(*cls.body_block)
+        return cls._converter().handle(str(headline) + str(body))
+
+
+class LxmlReutersParser(FastReutersParser):
+    """
+    FastReutersParser which reads pages by lxml, the fastest one, but lxml repairs broken
+    markup in its own way, so the result of a broken page can differ from ReutersParser
+    """
+
+    features = "lxml"
+
+
+def get_parser(name: str) -> ABCParser:
+    """
+    return an instance of the parser by the name of its class,
+    a parser of other package is found by its entry point in registry.PARSERS
+    """
+    classes = list(ABCParser.__subclasses__())
+    while classes:
+        cls = classes.pop()
+        if cls.__name__ == name:
+            return cls()
+        classes.extend(cls.__subclasses__())
+    return PARSERS.create(name)
+
+
+def clean_page(parser: ABCParser, text: str):
+    """
+    return the text cleaned by the parser and the time of cleaning in seconds,
+    used to clean pages in other processes
+    """
+    start = time.perf_counter()
+    data = parser.cleaned_data(text)
+    return data, time.perf_counter() - start
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterable, List
+
+# marks the end of items in a queue
+_DONE = object()
+
+
+class WriteBehindPipeline:
+    """
+    Streaming processing of items: items flow through bounded queues to threads which
+    process them, process returns a future, usually of the cleaning of a downloaded page,
+    then a writer finishes items and saves them by batches of batch_size or every
+    flush_interval seconds. A full queue stops the previous stage, so only a bounded number
+    of items is in memory, and saved batches stay in the database when the process dies.
+    """
+
+    def __init__(
+            self,
+            process: Callable[[object], Future],
+            finish: Callable[[object, Future], None],
+            write: Callable[[List], int],
+            workers: int = 8,
+            queue_size: int = 100,
+            batch_size: int = 100,
+            flush_interval: float = 5.0,
+    ):
+        self._process = process
+        self._finish = finish
+        self._write = write
+        self._workers = workers
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._error = None
+        self.saved = 0
+        self.batches = 0
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """put the item to the queue, return False when the pipeline is stopped by an error"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue, timeout: float):
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _fail(self, e: Exception) -> None:
+        if self._error is None:
+            self._error = e
+        self._stop.set()
+
+    def _work(self, items: queue.Queue, results: queue.Queue) -> None:
+        while not self._stop.is_set():
+            item = self._get(items, 0.1)
+            if item is None:
+                continue
+            if item is _DONE:
+                return
+            try:
+                future = self._process(item)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            self._put(results, (item, future))
+
+    def _flush(self, batch: List) -> None:
+        if batch:
+            self.saved += self._write(batch)
+            self.batches += 1
+            batch.clear()
+
+    def _writer(self, results: queue.Queue) -> None:
+        batch = []
+        deadline = None
+        try:
+            while not self._stop.is_set():
+                timeout = 0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))
+                result = self._get(results, timeout)
+                if result is _DONE:
+                    break
+                if result is not None:
+                    item, future = result
+                    self._finish(item, future)
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self._flush_interval
+                if len(batch) >= self._batch_size or deadline is not None and time.monotonic() >= deadline:
+                    self._flush(batch)
+                    deadline = None
+            self._flush(batch)
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, items: Iterable) -> int:
+        """process and save all items, return the number of saved items"""
+        tasks = queue.Queue(self._queue_size)
+        results = queue.Queue(self._queue_size)
+        workers = [
+            threading.Thread(target=self._work, args=(tasks, results), daemon=True)
+            for _ in range(self._workers)
+        ]
+        writer = threading.Thread(target=self._writer, args=(results,), daemon=True)
+        for thread in workers + [writer]:
+            thread.start()
+
+        for item in items:
+            if not self._put(tasks, item):
+                break
+        for _ in workers:
+            self._put(tasks, _DONE)
+        for thread in workers:
+            thread.join()
+        self._put(results, _DONE)
+        writer.join()
+
+        if self._error is not None:
+            raise self._error
+        return self.saved
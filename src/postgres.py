@@ -0,0 +1,1090 @@
+import io
+import re
+import threading
+import time
+import weakref
+from datetime import datetime
+from typing import Iterator, List, Set
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+
+from clients import JOB_WATERMARK_PREFIX, DBClientABC, Feed, FeedHistory, FoundNews, News, NewsRef, NewsSignature
+
+# (schema, month) of partitions of news which are known to exist
+_news_partitions = set()
+_news_partitions_lock = threading.Lock()
+
+# version of the DDL of schema_ddl, it is increased with every change of the DDL,
+# a schema of this version is not updated again
+SCHEMA_VERSION = 11
+# (host, schema) of schemas which are up to date, they are checked once per process
+_ready_schemas = set()
+# records of feeds by (host, schema) and url, feeds are not read again for every run
+_feed_records = {}
+_feed_records_lock = threading.Lock()
+# language of the full-text search of news
+SEARCH_CONFIG = "english"
+# words of the title weigh more than words of the descriptions, the full description is cut
+# because a tsvector is limited to 1MB
+SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(short_description, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', left(coalesce(full_description, ''), 100000)), 'C')"
+)
+# names of statements prepared on connections, a prepared statement lives as long as its connection
+_prepared_statements = weakref.WeakKeyDictionary()
+
+
+def missing_partitions(schema: str, posted) -> List[datetime]:
+    """
+    return first days of months of posted dates which partitions of news are not known to exist
+    """
+    months = {datetime(p.year, p.month, 1) for p in posted if p is not None}
+    with _news_partitions_lock:
+        return sorted(m for m in months if (schema, m) not in _news_partitions)
+
+
+def add_partitions(schema: str, months, exist: bool = True) -> None:
+    with _news_partitions_lock:
+        for month in months:
+            if exist:
+                _news_partitions.add((schema, month))
+            else:
+                _news_partitions.discard((schema, month))
+
+
+def news_partition_month(name: str):
+    """return the first day of the month of a partition of news by its name or None"""
+    match = re.fullmatch(r"news_(\d{4})_(\d{2})", name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def numbered_placeholders(sql: str) -> str:
+    """replace %s placeholders of psycopg2 by $1, $2... of PREPARE and asyncpg"""
+    counter = iter(range(1, sql.count("%s") + 1))
+    return re.sub("%s", lambda m: f"${next(counter)}", sql)
+
+
+def _copy_value(value) -> str:
+    """
+    Format a value for the text format of COPY
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+NEWS_COLUMNS = "feed_id, title, short_description, posted, url, hash, full_description"
+# news saved before the column xact get positions of an incremental export below any id of
+# a transaction, in order of their ids
+LEGACY_XACT_OFFSET = 2 ** 31
+
+
+def insert_new_news_sql(schema: str, source: str) -> str:
+    """
+    return INSERT of news from the source which hashes are not saved yet, a hash is saved
+    to news_hashes first, so news with the same hash are saved once in any partition
+    """
+    return f"""
+    WITH rows AS (
+        SELECT DISTINCT ON (hash) {NEWS_COLUMNS} FROM {source}
+    ), new AS (
+        INSERT INTO {schema}.news_hashes (hash)
+        SELECT hash FROM rows
+        ON CONFLICT (hash) DO NOTHING
+        RETURNING hash
+    )
+    INSERT INTO {schema}.news
+    ({NEWS_COLUMNS})
+    SELECT {NEWS_COLUMNS} FROM rows JOIN new USING (hash)
+    RETURNING id
+    """
+
+
+def news_filter(
+        from_date: datetime = None, to_date: datetime = None, after_id=None, until_id=None, key: str = "id"
+):
+    """
+    return a condition where by posted date and by the key of news and its parameters,
+    the key is id or xact of an incremental export
+    """
+    conditions = []
+    params = []
+    if from_date and to_date:
+        conditions.append("posted BETWEEN %s AND %s")
+        params.extend((from_date, to_date))
+    elif from_date:
+        conditions.append("posted >= %s")
+        params.append(from_date)
+    elif to_date:
+        conditions.append("posted <= %s")
+        params.append(to_date)
+    if after_id is not None:
+        conditions.append(f"{key} > %s")
+        params.append(after_id)
+    if until_id is not None:
+        conditions.append(f"{key} <= %s")
+        params.append(until_id)
+
+    if not conditions:
+        return "", ()
+    return "WHERE " + " AND ".join(conditions), tuple(params)
+
+
+def schema_ddl(schema: str) -> str:
+    """
+    return DDL of the schema of Postgres, it creates missing tables, columns and indexes
+    and does nothing for an up-to-date schema, used by sync and async clients
+    """
+    return f"""
+    -- DROP SCHEMA {schema};
+
+    CREATE SCHEMA IF NOT EXISTS {schema} AUTHORIZATION postgres;
+
+
+    -- Drop table
+
+    -- DROP TABLE {schema}.feeds;
+
+    CREATE TABLE IF NOT EXISTS {schema}.feeds (
+        id serial NOT NULL,
+        url varchar NULL,
+        body_parser varchar NULL,
+        etag varchar NULL,
+        modified varchar NULL,
+        poll_interval float8 NULL,
+        next_poll_at timestamp NULL,
+        CONSTRAINT feeds_pk PRIMARY KEY (id)
+    );
+    -- columns added after the first release
+    ALTER TABLE {schema}.feeds ADD COLUMN IF NOT EXISTS etag varchar NULL;
+    ALTER TABLE {schema}.feeds ADD COLUMN IF NOT EXISTS modified varchar NULL;
+    ALTER TABLE {schema}.feeds ADD COLUMN IF NOT EXISTS poll_interval float8 NULL;
+    ALTER TABLE {schema}.feeds ADD COLUMN IF NOT EXISTS next_poll_at timestamp NULL;
+    CREATE INDEX IF NOT EXISTS feeds_url_idx ON {schema}.feeds USING btree (url);
+
+    -- Drop table
+
+    -- DROP TABLE {schema}.scraper_info;
+
+    CREATE TABLE IF NOT EXISTS {schema}.scraper_info (
+        id serial NOT NULL,
+        date_run timestamp NULL,
+        count int4 NULL,
+        by_user bool NULL DEFAULT false,
+        url varchar NULL,
+        feed_id int4 NULL,
+        metrics jsonb NULL,
+        CONSTRAINT scraper_info_pk PRIMARY KEY (id),
+        CONSTRAINT scraper_info_fk FOREIGN KEY (feed_id) REFERENCES {schema}.feeds(id)
+    );
+    -- timings of stages of the run, date_run was a date in the first release
+    ALTER TABLE {schema}.scraper_info ADD COLUMN IF NOT EXISTS metrics jsonb NULL;
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_schema = '{schema}' AND table_name = 'scraper_info'
+            AND column_name = 'date_run') = 'date' THEN
+            ALTER TABLE {schema}.scraper_info ALTER COLUMN date_run TYPE timestamp;
+        END IF;
+    END
+    $$;
+
+    -- Drop table
+
+    -- DROP TABLE {schema}.news;
+
+    -- news are partitioned by month of posted, a table of the first release is partitioned below
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = '{schema}' AND c.relname = 'news' AND c.relkind = 'r'
+        ) THEN
+            ALTER TABLE {schema}.news RENAME TO news_unpartitioned;
+            ALTER INDEX IF EXISTS {schema}.news_hash_idx RENAME TO news_unpartitioned_hash_idx;
+            ALTER INDEX IF EXISTS {schema}.news_feed_posted_idx RENAME TO news_unpartitioned_feed_posted_idx;
+        END IF;
+    END
+    $$;
+
+    CREATE TABLE IF NOT EXISTS {schema}.news (
+        id serial NOT NULL,
+        feed_id int4 NOT NULL,
+        title varchar NULL,
+        short_description varchar NULL,
+        posted timestamp NULL,
+        url varchar NULL,
+        hash varchar NULL,
+        full_description text NULL,
+        search tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED,
+        xact int8 NOT NULL DEFAULT txid_current(),
+        CONSTRAINT news_fk FOREIGN KEY (feed_id) REFERENCES {schema}.feeds(id) ON UPDATE CASCADE ON DELETE CASCADE
+    ) PARTITION BY RANGE (posted);
+    -- the vector of the full-text search is computed by the server for every inserted or updated news
+    ALTER TABLE {schema}.news ADD COLUMN IF NOT EXISTS search tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED;
+    -- news without posted date or of a month which partition can not be created
+    CREATE TABLE IF NOT EXISTS {schema}.news_default PARTITION OF {schema}.news DEFAULT;
+    -- the id of the transaction which saved a news, an incremental export takes news of
+    -- committed transactions, so the news of a long transaction are exported after its commit
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = '{schema}' AND table_name = 'news' AND column_name = 'xact'
+        ) THEN
+            ALTER TABLE {schema}.news ADD COLUMN xact int8 NULL;
+            UPDATE {schema}.news SET xact = id::int8 - {LEGACY_XACT_OFFSET};
+            ALTER TABLE {schema}.news ALTER COLUMN xact SET DEFAULT txid_current();
+            ALTER TABLE {schema}.news ALTER COLUMN xact SET NOT NULL;
+        END IF;
+    END
+    $$;
+    -- indexes of the partitioned table are created in every partition
+    CREATE INDEX IF NOT EXISTS news_id_idx ON {schema}.news USING btree (id);
+    CREATE INDEX IF NOT EXISTS news_xact_idx ON {schema}.news USING btree (xact);
+    CREATE INDEX IF NOT EXISTS news_posted_idx ON {schema}.news USING btree (posted);
+    CREATE INDEX IF NOT EXISTS news_hash_idx ON {schema}.news USING btree (hash);
+    CREATE INDEX IF NOT EXISTS news_feed_posted_idx ON {schema}.news USING btree (feed_id, posted);
+    CREATE INDEX IF NOT EXISTS news_search_idx ON {schema}.news USING gin (search);
+
+    -- a unique index of a partitioned table must contain posted, so hashes of all saved news
+    -- are unique in their own table
+    CREATE TABLE IF NOT EXISTS {schema}.news_hashes (
+        hash varchar NOT NULL,
+        CONSTRAINT news_hashes_pk PRIMARY KEY (hash)
+    );
+
+    CREATE OR REPLACE FUNCTION {schema}.create_news_partitions(months timestamp[]) RETURNS void AS $$
+    DECLARE
+        month timestamp;
+    BEGIN
+        FOREACH month IN ARRAY months LOOP
+            month := date_trunc('month', month);
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I.%I PARTITION OF %I.news FOR VALUES FROM (%L) TO (%L)',
+                    '{schema}', 'news_' || to_char(month, 'YYYY_MM'), '{schema}', month, month + interval '1 month'
+                );
+            EXCEPTION
+                -- created by another client at the same time, or news of the month are in the default partition
+                WHEN duplicate_table OR unique_violation OR check_violation THEN NULL;
+            END;
+        END LOOP;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF to_regclass('{schema}.news_unpartitioned') IS NOT NULL THEN
+            PERFORM {schema}.create_news_partitions(ARRAY(
+                SELECT DISTINCT date_trunc('month', posted) FROM {schema}.news_unpartitioned
+                WHERE posted IS NOT NULL
+            ));
+            -- news saved more than once by versions without news_hashes are not copied,
+            -- the oldest news of a hash is kept like by the first insert
+            INSERT INTO {schema}.news
+            (id, feed_id, title, short_description, posted, url, hash, full_description, xact)
+            SELECT id, feed_id, title, short_description, posted, url, hash, full_description,
+                id::int8 - {LEGACY_XACT_OFFSET}
+            FROM {schema}.news_unpartitioned u
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {schema}.news_unpartitioned o WHERE o.hash = u.hash AND o.id < u.id
+            );
+            INSERT INTO {schema}.news_hashes
+            SELECT DISTINCT hash FROM {schema}.news_unpartitioned WHERE hash IS NOT NULL
+            ON CONFLICT DO NOTHING;
+            PERFORM setval(
+                pg_get_serial_sequence('{schema}.news', 'id'),
+                (SELECT coalesce(max(id), 0) + 1 FROM {schema}.news),
+                false
+            );
+            DROP TABLE {schema}.news_unpartitioned;
+        END IF;
+    END
+    $$;
+
+    -- Drop table
+
+    -- DROP TABLE {schema}.news_signatures;
+
+    -- signatures of texts of news for search of near duplicates, bands of originals are the LSH index
+    CREATE TABLE IF NOT EXISTS {schema}.news_signatures (
+        hash varchar NOT NULL,
+        kind varchar NOT NULL,
+        signature bytea NOT NULL,
+        duplicate_of varchar NULL,
+        CONSTRAINT news_signatures_pk PRIMARY KEY (hash, kind)
+    );
+    CREATE TABLE IF NOT EXISTS {schema}.news_bands (
+        kind varchar NOT NULL,
+        key int8 NOT NULL,
+        hash varchar NOT NULL,
+        CONSTRAINT news_bands_pk PRIMARY KEY (kind, key, hash)
+    );
+    CREATE INDEX IF NOT EXISTS news_bands_hash_idx ON {schema}.news_bands USING btree (hash);
+
+    -- Drop table
+
+    -- DROP TABLE {schema}.export_watermarks;
+
+    CREATE TABLE IF NOT EXISTS {schema}.export_watermarks (
+        destination varchar NOT NULL,
+        last_id int8 NOT NULL,
+        updated timestamp NOT NULL DEFAULT now(),
+        CONSTRAINT export_watermarks_pk PRIMARY KEY (destination)
+    );
+    -- watermarks of exports were ids of news, they are moved to xact of legacy news,
+    -- watermarks of jobs stay ids of news
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_schema = '{schema}' AND table_name = 'export_watermarks'
+            AND column_name = 'last_id') = 'integer' THEN
+            ALTER TABLE {schema}.export_watermarks ALTER COLUMN last_id TYPE int8;
+            UPDATE {schema}.export_watermarks SET last_id = last_id - {LEGACY_XACT_OFFSET}
+            WHERE destination NOT LIKE '{JOB_WATERMARK_PREFIX}%';
+        END IF;
+    END
+    $$;
+
+    -- Drop table
+
+    -- DROP TABLE {schema}.tasks;
+
+    CREATE TABLE IF NOT EXISTS {schema}.tasks (
+        id bigserial NOT NULL,
+        kind varchar NOT NULL,
+        key varchar NOT NULL,
+        payload jsonb NULL,
+        status varchar NOT NULL DEFAULT 'ready',
+        attempts int4 NOT NULL DEFAULT 0,
+        owner varchar NULL,
+        lease_until timestamp NULL,
+        not_before timestamp NOT NULL DEFAULT now(),
+        error varchar NULL,
+        CONSTRAINT tasks_pk PRIMARY KEY (id),
+        CONSTRAINT tasks_kind_key_uniq UNIQUE (kind, key)
+    );
+    CREATE INDEX IF NOT EXISTS tasks_ready_idx ON {schema}.tasks USING btree (kind, not_before) WHERE status = 'ready';
+    CREATE INDEX IF NOT EXISTS tasks_leased_idx ON {schema}.tasks USING btree (kind, lease_until) WHERE status = 'leased';
+
+    -- Drop table
+
+    -- DROP TABLE {schema}.schema_version;
+
+    CREATE TABLE IF NOT EXISTS {schema}.schema_version (
+        version int4 NOT NULL,
+        updated timestamp NOT NULL DEFAULT now()
+    );
+    -- a schema updated by a newer version of the scraper keeps its version
+    DELETE FROM {schema}.schema_version WHERE version < {SCHEMA_VERSION};
+    INSERT INTO {schema}.schema_version (version)
+    SELECT {SCHEMA_VERSION} WHERE NOT EXISTS (SELECT 1 FROM {schema}.schema_version);
+    """
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    Pool of connections which waits for a free connection instead of raising PoolError
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._semaphore = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self._semaphore.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._semaphore.release()
+
+
+class PostgresClient(DBClientABC):
+    """
+    Client for working with PostgresDB
+    """
+
+    def __init__(
+            self,
+            dbname="postgres",
+            user="postgres",
+            password="scraper",
+            host="db",
+            schema="rsscraper",
+            pool=None,
+            maxconn=10,
+            copy_threshold=1000,
+            page_size=200,
+    ):
+        self._dbname = dbname
+        self._host = host
+        self._password = password
+        self._user = user
+        self._schema = schema
+        self._connection = None
+        # the connection was taken from the pool and is returned to it on close
+        self._pooled = False
+        # connections pool shared between clones of the client, a client without a pool
+        # creates it on the first clone, clones are made by many threads at once
+        self._pool = pool
+        self._pool_lock = threading.Lock()
+        self._maxconn = maxconn
+        # from this number of rows news are saved by COPY, fewer rows are saved by pages of INSERT
+        self._copy_threshold = copy_threshold
+        self._page_size = page_size
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._dbname}, {self._host}, ******, {self._user}, {self._schema})"
+
+    def _get_connection(self):
+        if not self._connection:
+            if self._pool:
+                conn = self._pool.getconn()
+                self._pooled = True
+            else:
+                conn = psycopg2.connect(
+                    user=self._user, password=self._password, host=self._host
+                )
+            self._connection = conn
+        return self._connection
+
+    def _execute_prepared(self, cur, name: str, SQL: str, params=()) -> None:
+        """
+        Execute a hot statement prepared on the server, it is parsed and planned
+        once per connection instead of once per call
+        """
+        name = f"{self._schema}_{name}"
+        prepared = _prepared_statements.setdefault(cur.connection, set())
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {numbered_placeholders(SQL)}")
+            prepared.add(name)
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+    @property
+    def _cache_key(self):
+        return (self._host, self._schema)
+
+    def _cache_feed(self, feed: Feed) -> Feed:
+        with _feed_records_lock:
+            _feed_records.setdefault(self._cache_key, {})[feed.url] = feed
+        return feed
+
+    def _update_cached_feed(self, feed_id, **fields) -> None:
+        with _feed_records_lock:
+            feeds = _feed_records.get(self._cache_key, {})
+            for url, feed in feeds.items():
+                if feed.id == feed_id:
+                    feeds[url] = feed._replace(**fields)
+                    return
+
+    def clone(self, schema: str = None) -> "PostgresClient":
+        """
+        Return a new client with the same settings, clients take connections from the shared pool
+        """
+        with self._pool_lock:
+            if not self._pool:
+                self._pool = BlockingConnectionPool(
+                    1, self._maxconn, user=self._user, password=self._password, host=self._host
+                )
+        return self.__class__(
+            dbname=self._dbname,
+            user=self._user,
+            password=self._password,
+            host=self._host,
+            schema=schema or self._schema,
+            pool=self._pool,
+            maxconn=self._maxconn,
+            copy_threshold=self._copy_threshold,
+            page_size=self._page_size,
+        )
+
+    def save_feed(self, url, parser=None) -> Feed:
+        conn = self._get_connection()
+
+        SQL_INSERT_FEED = f"""
+        INSERT INTO {self._schema}.feeds
+        (url, body_parser)
+        VALUES(%s, %s) RETURNING id;
+        """
+
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL_INSERT_FEED, (url, parser))
+                (id,) = cur.fetchone()
+                return self._cache_feed(Feed(id, url, parser))
+
+    def get_feed_by_url(self, url, **kwargs):
+        """
+        return the feed by URL, the feed is saved when it is not saved yet.
+        Feeds are cached in the process and their cached validators and schedules are updated
+        by this process, so a validator changed by other process is only sent older and the server
+        answers with the full feed
+        """
+        feed = _feed_records.get(self._cache_key, {}).get(url)
+        if feed:
+            return feed
+
+        conn = self._get_connection()
+
+        SQL_SELECT_FEED = f"""
+        SELECT id, url, body_parser, etag, modified, poll_interval, next_poll_at FROM {self._schema}.feeds as f
+        WHERE f.url = %s
+        """
+
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    self._execute_prepared(cur, "select_feed", SQL_SELECT_FEED, (url,))
+                    row = cur.fetchone()
+                    if row:
+                        return self._cache_feed(Feed(*row))
+                    else:
+                        return self.save_feed(
+                            url=url, parser=kwargs.get("parser", None)
+                        )
+        except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedColumn):
+            # the schema is not created or is created by an older version
+            self.create_schema()
+            return self.get_feed_by_url(url, **kwargs)
+
+    def get_feeds(self) -> List[Feed]:
+        conn = self._get_connection()
+
+        SQL_SELECT_FEEDS = f"""
+        SELECT id, url, body_parser, etag, modified, poll_interval, next_poll_at FROM {self._schema}.feeds
+        ORDER BY id
+        """
+
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(SQL_SELECT_FEEDS)
+                    return [Feed(*row) for row in cur.fetchall()]
+        except psycopg2.errors.UndefinedTable:
+            return []
+
+    def save_feed_validators(self, feed_id, etag: str = None, modified: str = None) -> None:
+        """
+        Save ETag and Last-Modified of the last fetch of the feed for the conditional GET
+        """
+        conn = self._get_connection()
+
+        SQL_UPDATE_FEED = f"""
+        UPDATE {self._schema}.feeds SET etag = %s, modified = %s
+        WHERE id = %s
+        """
+
+        with conn:
+            with conn.cursor() as cur:
+                self._execute_prepared(cur, "save_validators", SQL_UPDATE_FEED, (etag, modified, feed_id))
+        self._update_cached_feed(feed_id, etag=etag, modified=modified)
+
+    def get_feed_history(self, feed_id, limit: int = 20) -> FeedHistory:
+        conn = self._get_connection()
+
+        SQL_POSTED = f"""
+        SELECT posted FROM {self._schema}.news
+        WHERE feed_id = %s AND posted IS NOT NULL
+        ORDER BY posted DESC LIMIT %s
+        """
+        SQL_COUNTS = f"""
+        SELECT count FROM {self._schema}.scraper_info
+        WHERE feed_id = %s
+        ORDER BY id DESC LIMIT %s
+        """
+
+        with conn:
+            with conn.cursor() as cur:
+                self._execute_prepared(cur, "feed_posted", SQL_POSTED, (feed_id, limit))
+                posted = [p for (p,) in cur.fetchall()]
+                self._execute_prepared(cur, "feed_counts", SQL_COUNTS, (feed_id, limit))
+                counts = [c for (c,) in cur.fetchall()]
+        return FeedHistory(posted, counts)
+
+    def save_feed_schedule(self, feed_id, poll_interval: float, next_poll_at: datetime) -> None:
+        """
+        Save the interval between polls of the feed learned from its history and the time of the next poll
+        """
+        conn = self._get_connection()
+
+        SQL_UPDATE_FEED = f"""
+        UPDATE {self._schema}.feeds SET poll_interval = %s, next_poll_at = %s
+        WHERE id = %s
+        """
+
+        with conn:
+            with conn.cursor() as cur:
+                self._execute_prepared(
+                    cur, "save_schedule", SQL_UPDATE_FEED, (poll_interval, next_poll_at, feed_id)
+                )
+        self._update_cached_feed(feed_id, poll_interval=poll_interval, next_poll_at=next_poll_at)
+
+    def save_news(self, news) -> int:
+        """
+        Save news which are not saved yet, return the number of saved news.
+        Big batches are saved by COPY, small ones by INSERT with many rows per statement
+        """
+        rows = [
+            (
+                n.feed.id,
+                n.title,
+                n.short_description,
+                n.posted,
+                n.url,
+                n.hash,
+                n.full_description,
+            )
+            for n in news
+        ]
+        if not rows:
+            return 0
+
+        started = time.perf_counter()
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                self._create_partitions(cur, [row[3] for row in rows])
+                if len(rows) >= self._copy_threshold:
+                    method = "COPY"
+                    saved = self._copy_news(cur, rows)
+                else:
+                    method = "INSERT"
+                    saved = self._insert_news(cur, rows)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{saved} of {len(rows)} news saved by {method} in {elapsed:.2f}s "
+            f"({len(rows) / elapsed:.0f} rows/s)"
+        )
+        return saved
+
+    def _create_partitions(self, cur, posted) -> None:
+        """create partitions of news for months of posted dates"""
+        months = missing_partitions(self._schema, posted)
+        if months:
+            cur.execute(f"SELECT {self._schema}.create_news_partitions(%s::timestamp[])", (months,))
+            add_partitions(self._schema, months)
+
+    def _insert_news(self, cur, rows) -> int:
+        SQL_INSERT_NEWS = insert_new_news_sql(self._schema, f"(VALUES %s) AS v ({NEWS_COLUMNS})")
+        inserted = psycopg2.extras.execute_values(
+            cur,
+            SQL_INSERT_NEWS,
+            rows,
+            # types of values are set, a column of NULLs would be text
+            template="(%s::int4, %s::varchar, %s::varchar, %s::timestamp, %s::varchar, %s::varchar, %s::text)",
+            page_size=self._page_size,
+            fetch=True,
+        )
+        return len(inserted)
+
+    def _copy_news(self, cur, rows) -> int:
+        # COPY can not skip conflicts, so rows are copied to a temporary table first
+        SQL_CREATE_TEMP = """
+        CREATE TEMP TABLE news_copy (
+            feed_id int4,
+            title varchar,
+            short_description varchar,
+            posted timestamp,
+            url varchar,
+            hash varchar,
+            full_description text
+        ) ON COMMIT DROP;
+        """
+        SQL_INSERT_NEWS = insert_new_news_sql(self._schema, "news_copy")
+        cur.execute(SQL_CREATE_TEMP)
+        data = io.StringIO()
+        for row in rows:
+            data.write("\t".join(_copy_value(v) for v in row))
+            data.write("\n")
+        data.seek(0)
+        cur.copy_expert(f"COPY news_copy ({NEWS_COLUMNS}) FROM STDIN", data)
+        cur.execute(SQL_INSERT_NEWS)
+        return cur.rowcount
+
+    def get_existing_hashes(self, hashes: List[str]) -> Set[str]:
+        """
+        return hashes from the list which are already saved, by one query
+        """
+        if not hashes:
+            return set()
+
+        self.ensure_schema()
+        SQL = f"SELECT hash FROM {self._schema}.news_hashes WHERE hash = ANY(%s)"
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                self._execute_prepared(cur, "existing_hashes", SQL, (list(hashes),))
+                return {h for (h,) in cur.fetchall()}
+
+    def save_scraper_info(self, scraper_info, by_user=False, metrics: dict = None):
+
+        SQL = f"""INSERT INTO {self._schema}.scraper_info
+                (date_run, count, by_user, url, feed_id, metrics)
+                VALUES(%s, %s, %s, %s, %s, %s);
+                """
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                self._execute_prepared(
+                    cur, "save_scraper_info", SQL, (*scraper_info, psycopg2.extras.Json(metrics))
+                )
+
+    def get_news(
+            self, from_date: datetime = None, to_date: datetime = None
+    ) -> List[News]:
+        return list(self.iter_news(from_date, to_date))
+
+    def _select_news(self, from_date, to_date, after_id, until_id):
+        # positions of an incremental export are ids of transactions which saved news
+        WHERE, params = news_filter(from_date, to_date, after_id, until_id, key="xact")
+        ORDER = "ORDER BY id" if after_id is not None or until_id is not None else ""
+        SQL = f"""
+              SELECT title, short_description, posted, url, hash, full_description
+              FROM {self._schema}.news
+              {WHERE}
+              {ORDER}
+              """
+        return SQL, params
+
+    def iter_news(
+            self,
+            from_date: datetime = None,
+            to_date: datetime = None,
+            batch_size: int = 1000,
+            after_id=None,
+            until_id=None,
+    ) -> Iterator[News]:
+        """
+        Yield news by a server-side cursor, only batch_size rows are kept in memory
+        """
+        SQL, params = self._select_news(from_date, to_date, after_id, until_id)
+
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor(name="iter_news") as cur:
+                cur.itersize = batch_size
+                cur.execute(SQL, params)
+                for row in cur:
+                    yield News(*row)
+
+    def search_news(
+            self,
+            query: str,
+            limit: int = 20,
+            offset: int = 0,
+            from_date: datetime = None,
+            to_date: datetime = None,
+    ) -> Iterator[FoundNews]:
+        """
+        Yield news matched by the query in the syntax of web search engines, the best ranked first.
+        News are found by the GIN index, headlines are made only for news of the page
+        """
+        self.ensure_schema()
+        WHERE, params = news_filter(from_date, to_date)
+        SQL = f"""
+        WITH page AS (
+            SELECT id, title, posted, url, short_description, full_description, q,
+                ts_rank_cd(search, q) AS rank
+            FROM {self._schema}.news, websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS q
+            {WHERE} {"AND" if WHERE else "WHERE"} search @@ q
+            ORDER BY rank DESC, posted DESC NULLS LAST, id
+            LIMIT %s OFFSET %s
+        )
+        SELECT id, title, posted, url, rank, ts_headline(
+            '{SEARCH_CONFIG}',
+            coalesce(short_description, '') || ' ' || left(coalesce(full_description, ''), 100000),
+            q,
+            'MaxFragments=2, MinWords=5, MaxWords=20, StartSel=*, StopSel=*'
+        )
+        FROM page
+        ORDER BY rank DESC, posted DESC NULLS LAST, id
+        """
+
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor(name="search_news") as cur:
+                cur.itersize = max(limit, 1)
+                cur.execute(SQL, (query, *params, limit, offset))
+                for row in cur:
+                    yield FoundNews(*row)
+
+    def get_similar_signatures(self, kind: str, keys: List[int]) -> List[NewsSignature]:
+        """
+        return signatures of original news which have one of the keys of bands,
+        keys of a signature are the found keys
+        """
+        if not keys:
+            return []
+        SQL = f"""
+        SELECT s.hash, s.kind, s.signature, s.duplicate_of, array_agg(b.key)
+        FROM {self._schema}.news_bands b
+        JOIN {self._schema}.news_signatures s ON s.hash = b.hash AND s.kind = b.kind
+        WHERE b.kind = %s AND b.key = ANY(%s::int8[])
+        GROUP BY s.hash, s.kind, s.signature, s.duplicate_of
+        """
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                self._execute_prepared(cur, "similar_signatures", SQL, (kind, list(set(keys))))
+                return [
+                    NewsSignature(hash, kind, bytes(signature), duplicate_of, keys)
+                    for hash, kind, signature, duplicate_of, keys in cur.fetchall()
+                ]
+
+    def save_signatures(self, signatures: List[NewsSignature]) -> None:
+        """
+        save signatures and keys of their bands, a saved signature of a news is kept
+        """
+        if not signatures:
+            return
+        SQL_SIGNATURES = f"""
+        INSERT INTO {self._schema}.news_signatures (hash, kind, signature, duplicate_of)
+        VALUES %s
+        ON CONFLICT (hash, kind) DO NOTHING
+        """
+        SQL_BANDS = f"""
+        INSERT INTO {self._schema}.news_bands (kind, key, hash)
+        VALUES %s
+        ON CONFLICT (kind, key, hash) DO NOTHING
+        """
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(
+                    cur,
+                    SQL_SIGNATURES,
+                    [(s.hash, s.kind, psycopg2.Binary(s.signature), s.duplicate_of) for s in signatures],
+                    page_size=self._page_size,
+                )
+                bands = [(s.kind, key, s.hash) for s in signatures for key in s.keys]
+                if bands:
+                    psycopg2.extras.execute_values(cur, SQL_BANDS, bands, page_size=self._page_size)
+
+    def copy_news_to(
+            self,
+            file,
+            from_date: datetime = None,
+            to_date: datetime = None,
+            after_id=None,
+            until_id=None,
+    ) -> int:
+        """
+        Write news to the file as CSV with a header formatted by the server with COPY,
+        return the number of written news
+        """
+        SQL, params = self._select_news(from_date, to_date, after_id, until_id)
+
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                # COPY does not accept parameters, so they are bound on the client side
+                query = cur.mogrify(SQL, params).decode()
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", file)
+                return cur.rowcount
+
+    def get_export_bound(self):
+        """
+        return the id of the last transaction before the oldest running one, all transactions
+        to it are finished, so their news are visible and no news with a lower xact is saved later
+        """
+        SQL = "SELECT txid_snapshot_xmin(txid_current_snapshot()) - 1"
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL)
+                (bound,) = cur.fetchone()
+                return bound
+
+    def get_news_refs(
+            self, from_date: datetime = None, to_date: datetime = None, after_id=None, limit: int = 1000
+    ) -> List[NewsRef]:
+        """
+        return the next page of ids of news ordered by id, pages are selected by the last id
+        of the previous page, so every page is read by the index on id
+        """
+        WHERE, params = news_filter(from_date, to_date, after_id)
+        SQL = f"""
+              SELECT id, hash, url FROM {self._schema}.news
+              {WHERE}
+              ORDER BY id
+              LIMIT %s
+              """
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL, (*params, limit))
+                return [NewsRef(*row) for row in cur.fetchall()]
+
+    def update_full_descriptions(self, descriptions) -> int:
+        """
+        Replace full descriptions of news by pairs (id, full_description) in one statement per page
+        """
+        SQL = f"""
+        UPDATE {self._schema}.news AS n SET full_description = v.full_description
+        FROM (VALUES %s) AS v(id, full_description)
+        WHERE n.id = v.id
+        """
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, SQL, descriptions, page_size=self._page_size)
+                return len(descriptions)
+
+    def get_watermark(self, destination: str):
+        """
+        return xact of the last news exported to the destination, or id of the last news of a job
+        """
+        self.ensure_schema()
+        SQL = f"SELECT last_id FROM {self._schema}.export_watermarks WHERE destination = %s"
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL, (destination,))
+                row = cur.fetchone()
+                return row[0] if row else None
+
+    def save_watermark(self, destination: str, last_id) -> None:
+        SQL = f"""
+        INSERT INTO {self._schema}.export_watermarks (destination, last_id, updated)
+        VALUES (%s, %s, now())
+        ON CONFLICT (destination) DO UPDATE SET last_id = excluded.last_id, updated = excluded.updated;
+        """
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL, (destination, last_id))
+
+    def delete_watermark(self, destination: str) -> None:
+        SQL = f"DELETE FROM {self._schema}.export_watermarks WHERE destination = %s"
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL, (destination,))
+
+    def get_last_posted_date(self):
+        max_date = None
+        self.ensure_schema()
+        SQL = f"select max(n.posted) from {self._schema}.news n"
+        conn = self._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL)
+                (max_date,) = cur.fetchone()
+                return max_date
+
+    def retire_partitions(self, before: datetime, drop: bool = False) -> List[str]:
+        """
+        Detach or drop partitions of news of months which end before the date, return their names.
+        A detached partition stays as a separate table, hashes of its news stay in news_hashes,
+        so its news are not saved again. Signatures of its news are deleted, so new news
+        are not marked as duplicates of news which are not in the table news
+        """
+        SQL_PARTITIONS = f"""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = '{self._schema}.news'::regclass
+        ORDER BY c.relname
+        """
+        conn = self._get_connection()
+        retired = []
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL_PARTITIONS)
+                for (name,) in cur.fetchall():
+                    month = news_partition_month(name)
+                    if month is None:
+                        continue
+                    end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+                    if end > before:
+                        continue
+                    cur.execute(
+                        f"""
+                        WITH retired AS (SELECT hash FROM {self._schema}.{name}), bands AS (
+                            DELETE FROM {self._schema}.news_bands b USING retired r WHERE b.hash = r.hash
+                        )
+                        DELETE FROM {self._schema}.news_signatures s USING retired r WHERE s.hash = r.hash
+                        """
+                    )
+                    if drop:
+                        cur.execute(f"DROP TABLE {self._schema}.{name}")
+                    else:
+                        cur.execute(f"ALTER TABLE {self._schema}.news DETACH PARTITION {self._schema}.{name}")
+                    add_partitions(self._schema, [month], exist=False)
+                    retired.append(name)
+        return retired
+
+    def create_schema(self, name: str = None) -> None:
+        """
+        Creates a new schema, if the schema exists adds only missing columns and indexes
+        """
+        if name:
+            self._schema = name
+
+        conn = self._get_connection()
+
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(schema_ddl(self._schema))
+        _ready_schemas.add(self._cache_key)
+        # ids of feeds of a recreated schema are changed
+        with _feed_records_lock:
+            _feed_records.pop(self._cache_key, None)
+
+    def ensure_schema(self) -> None:
+        """
+        Create or update the schema once per process, an up-to-date schema is checked
+        by one query of its version instead of running the whole DDL
+        """
+        if self._cache_key in _ready_schemas:
+            return
+
+        SQL = f"SELECT max(version) FROM {self._schema}.schema_version"
+        conn = self._get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(SQL)
+                    (version,) = cur.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            version = None
+
+        if version is None or version < SCHEMA_VERSION:
+            self.create_schema()
+        else:
+            _ready_schemas.add(self._cache_key)
+
+    def close(self):
+        conn = self._connection
+        if not conn:
+            return
+
+        if self._pooled:
+            # return the connection for other clients
+            self._pool.putconn(conn)
+        elif not conn.closed:
+            # the connection was opened before the pool was created by a clone
+            conn.close()
+        self._connection = None
+        self._pooled = False
@@ -0,0 +1,89 @@
+import importlib
+from typing import List
+
+
+def entry_points(group: str) -> list:
+    """
+    return entry points of installed packages in the group,
+    metadata of packages is read only here, it is slow for a start of the CLI
+    """
+    try:
+        from importlib.metadata import entry_points as find
+    except ImportError:
+        # python 3.7
+        import pkg_resources
+
+        return list(pkg_resources.iter_entry_points(group))
+
+    found = find()
+    if hasattr(found, "select"):
+        return list(found.select(group=group))
+    return list(found.get(group, []))
+
+
+class Registry:
+    """
+    Implementations of clients, parsers or file types by name. An implementation is registered
+    by the path <module>:<attribute> and its module is imported only when the name is selected,
+    so a command does not import drivers and libraries of backends which it does not use.
+    Implementations of other packages are found by entry points of the group
+    """
+
+    def __init__(self, kind: str, group: str = None):
+        self._kind = kind
+        self._group = group
+        self._paths = {}
+
+    def register(self, name: str, path: str, *args) -> None:
+        """register the implementation by its path, args are passed to it on creation"""
+        self._paths[name] = (path, args)
+
+    def names(self) -> List[str]:
+        """return names of registered implementations, entry points are not read"""
+        return list(self._paths)
+
+    def plugins(self) -> List[str]:
+        """return names of implementations found by entry points"""
+        if not self._group:
+            return []
+        return [ep.name for ep in entry_points(self._group)]
+
+    def load(self, name: str):
+        """import and return the implementation by name"""
+        return self._resolve(name)[0]
+
+    def create(self, name: str, *args, **kwargs):
+        """return a new instance of the implementation by name"""
+        cls, default_args = self._resolve(name)
+        return cls(*default_args, *args, **kwargs)
+
+    def _resolve(self, name: str):
+        if name in self._paths:
+            path, args = self._paths[name]
+            module, _, attribute = path.partition(":")
+            return getattr(importlib.import_module(module), attribute), args
+
+        if self._group:
+            for ep in entry_points(self._group):
+                if ep.name == name:
+                    return ep.load(), ()
+        raise ValueError(f"unknown {self._kind} {name}")
+
+
+CLIENTS = Registry("client", "scraper.clients")
+CLIENTS.register("PostgresClient", "postgres:PostgresClient")
+CLIENTS.register("MongoClient", "mongo:MongoClient")
+
+PARSERS = Registry("parser", "scraper.parsers")
+PARSERS.register("ReutersParser", "parsers:ReutersParser")
+PARSERS.register("FastReutersParser", "parsers:FastReutersParser")
+PARSERS.register("LxmlReutersParser", "parsers:LxmlReutersParser")
+
+FILETYPES = Registry("format")
+FILETYPES.register("csv", "filetypes:CSVType")
+FILETYPES.register("csv.gz", "filetypes:CSVType", "gzip")
+FILETYPES.register("csv.zst", "filetypes:CSVType", "zstd")
+FILETYPES.register("jsonl", "filetypes:JSONLinesType")
+FILETYPES.register("jsonl.gz", "filetypes:JSONLinesType", "gzip")
+FILETYPES.register("jsonl.zst", "filetypes:JSONLinesType", "zstd")
+FILETYPES.register("parquet", "filetypes:ParquetType")
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from cache import load_page
+from clients import JOB_WATERMARK_PREFIX, DBClientABC
+from parsers import ABCParser
+
+
+def clean_cached_page(parser: ABCParser, directory, key: str):
+    """
+    return the page from the cache cleaned by the parser or None when the page is not cached,
+    runs in a worker process, so only the key and the cleaned text are sent between processes
+    """
+    try:
+        text = load_page(directory, key)
+    except (EOFError, OSError):
+        return None
+    return parser.cleaned_data(text)
+
+
+class Reparser:
+    """
+    Regenerates full descriptions of saved news from their cached pages by a parser,
+    pages are cleaned in a process pool and the progress is saved as a watermark after
+    every batch, so an interrupted job continues from the last saved batch. The watermark
+    is deleted when the job is finished, so the next run of the job starts from the first news
+    """
+
+    def __init__(
+            self,
+            database_client: DBClientABC,
+            parser: ABCParser,
+            cache_dir,
+            processes: int = None,
+            batch_size: int = 1000,
+            job: str = "reparse",
+    ):
+        self._client = database_client
+        self._parser = parser
+        self._cache_dir = cache_dir
+        self._processes = processes
+        self._batch_size = batch_size
+        self._job = job
+        self._watermark = f"{JOB_WATERMARK_PREFIX}{job}"
+        self.updated = 0
+        self.missing = 0
+        self.failed = 0
+
+    def _write(self, refs, futures) -> None:
+        descriptions = []
+        for ref, future in zip(refs, futures):
+            try:
+                text = future.result()
+            except Exception as e:
+                self.failed += 1
+                print(f"failed to reparse {ref.url}: {e.__class__.__name__}: {e}")
+                continue
+            if text is None:
+                self.missing += 1
+                continue
+            descriptions.append((ref.id, text))
+
+        if descriptions:
+            self.updated += self._client.update_full_descriptions(descriptions)
+        # the batch is saved, the next run starts after it
+        self._client.save_watermark(self._watermark, refs[-1].id)
+
+    def run(self, from_date: datetime = None, to_date: datetime = None, restart: bool = False) -> None:
+        client = self._client
+        after_id = None if restart else client.get_watermark(self._watermark)
+        if after_id is not None:
+            print(f"continue interrupted {self._job} after news {after_id}")
+
+        started = time.perf_counter()
+        processed = 0
+        with ProcessPoolExecutor(max_workers=self._processes) as executor:
+            pending = None
+            while True:
+                refs = client.get_news_refs(from_date, to_date, after_id, self._batch_size)
+                if not refs:
+                    break
+                futures = [
+                    executor.submit(clean_cached_page, self._parser, self._cache_dir, ref.hash)
+                    for ref in refs
+                ]
+                # the previous batch is written while workers clean the current one
+                if pending:
+                    self._write(*pending)
+                pending = (refs, futures)
+                after_id = refs[-1].id
+                processed += len(refs)
+            if pending:
+                self._write(*pending)
+        client.delete_watermark(self._watermark)
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"{processed} news processed in {elapsed:.1f}s, {self.updated} updated, "
+            f"{self.missing} not cached, {self.failed} failed"
+        )
@@ -0,0 +1,253 @@
+import threading
+from collections import namedtuple
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from functools import partial
+from typing import List
+
+from cache import HTMLCache
+from clients import DBClientABC
+from fetcher import Fetcher
+from parsers import ABCParser, get_parser
+from scraper import Feed
+
+# a feed which will be scraped and the schema where its news are saved
+ScheduledFeed = namedtuple(
+    "ScheduledFeed", ["url", "parser", "schema", "poll_interval", "next_poll_at"], defaults=(None, None)
+)
+
+
+def next_poll_interval(
+        posted: List[datetime],
+        counts: List[int],
+        previous: float,
+        min_interval: float,
+        max_interval: float,
+        now: datetime = None,
+) -> float:
+    """
+    return seconds to the next poll of a feed learned from posted dates of its latest news
+    and numbers of new news of its latest runs, both newest first. A poll is planned when
+    about one new news is expected, a feed which is silent longer than usual or gave nothing
+    in the last run is polled less often
+    """
+    now = now or datetime.now()
+    interval = previous
+    if len(posted) >= 2:
+        interval = (posted[0] - posted[-1]).total_seconds() / (len(posted) - 1)
+        silence = (now - posted[0]).total_seconds()
+        interval = max(interval, silence / 2)
+    if counts and counts[0] == 0:
+        interval = max(interval, previous * 1.5)
+    return min(max_interval, max(min_interval, interval))
+
+
+def read_feeds_file(path) -> List[ScheduledFeed]:
+    """
+    Read feeds from a text file, one feed per line in format <url> [parser] [schema],
+    empty lines and lines started with # are skipped
+    """
+    feeds = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            url, *rest = line.split()
+            parser = rest[0] if rest else None
+            schema = rest[1] if len(rest) > 1 else None
+            feeds.append(ScheduledFeed(url, parser, schema))
+    return feeds
+
+
+class FeedScheduler:
+    """
+    Runs pipelines of many feeds concurrently in one process,
+    the feeds share the HTTP session and connections to the database
+    """
+
+    def __init__(
+            self,
+            database_client: DBClientABC,
+            default_parser: ABCParser,
+            schema: str = None,
+            feeds_file: str = None,
+            concurrency: int = 4,
+            workers: int = 8,
+            timeout: float = 10,
+            exporters: list = None,
+            cache: HTMLCache = None,
+            cleaner: Executor = None,
+            batch_size: int = 100,
+            flush_interval: float = 5.0,
+            rate: float = None,
+            interval: float = 3600,
+            min_interval: float = 300,
+            max_interval: float = 86400,
+            dedup=None,
+    ):
+        self._client = database_client
+        self._default_parser = default_parser
+        self._schema = schema
+        self._feeds_file = feeds_file
+        self._concurrency = concurrency
+        self._workers = workers
+        self._timeout = timeout
+        self._exporters = exporters
+        self._cache = cache
+        self._cleaner = cleaner
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        # dedup.NearDuplicates shared by all feeds
+        self._dedup = dedup
+        # a feed without history is polled every interval, the learned interval is between min and max
+        self._interval = interval
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        # the next poll by URL, also for feeds of the feeds file which are saved in other schemas
+        self._next_polls = {}
+
+        # limits of hosts are common for all feeds
+        self.session = Fetcher(rate=rate, timeout=timeout, pool_size=concurrency * workers)
+
+    def load_feeds(self) -> List[ScheduledFeed]:
+        """return feeds from the table feeds of the schema and from the feeds file"""
+        feeds = {}
+        if self._schema:
+            for f in self._client.get_feeds():
+                feeds[f.url] = ScheduledFeed(f.url, f.parser, self._schema, f.poll_interval, f.next_poll_at)
+        if self._feeds_file:
+            records = [f._replace(schema=f.schema or self._schema) for f in read_feeds_file(self._feeds_file)]
+            saved = self._load_schedules(records)
+            for f in records:
+                schedule = feeds.get(f.url) if f.schema and f.schema == self._schema else saved.get(f.url)
+                feeds[f.url] = f._replace(
+                    poll_interval=schedule and schedule.poll_interval,
+                    next_poll_at=schedule and schedule.next_poll_at,
+                )
+        return list(feeds.values())
+
+    def _load_schedules(self, records: List[ScheduledFeed]) -> dict:
+        """return saved feeds by URL of feeds of the feeds file which are saved in other schemas"""
+        saved = {}
+        by_schema = {}
+        for f in records:
+            if not f.schema or f.schema != self._schema:
+                # a feed without a schema is saved in the schema named by its domain
+                by_schema.setdefault(f.schema or Feed._domain(f.url), set()).add(f.url)
+        for schema, urls in by_schema.items():
+            client = self._client.clone(schema)
+            try:
+                saved.update((f.url, f) for f in client.get_feeds() if f.url in urls)
+            finally:
+                client.close()
+        return saved
+
+    def run_feed(self, record: ScheduledFeed) -> None:
+        """run the pipeline of one feed with its own client taken from the shared pool"""
+        schema = record.schema
+        parser = get_parser(record.parser) if record.parser else self._default_parser
+        client = self._client.clone(schema)
+        try:
+            feed = Feed(
+                url=record.url,
+                body_news_parser=parser,
+                database_client=client,
+                schema=schema,
+                workers=self._workers,
+                timeout=self._timeout,
+                session=self.session,
+                exporters=self._exporters,
+                cache=self._cache,
+                cleaner=self._cleaner,
+                batch_size=self._batch_size,
+                flush_interval=self._flush_interval,
+                dedup=self._dedup,
+            )
+            try:
+                feed.run()
+            except Exception:
+                # a failed feed is tried again soon but not at once
+                self._next_polls[record.url] = datetime.now() + timedelta(seconds=self._min_interval)
+                raise
+            self.schedule(client, feed, record)
+        finally:
+            client.close()
+
+    def schedule(self, client: DBClientABC, feed: Feed, record: ScheduledFeed) -> None:
+        """learn the interval of polls of the feed from its history and save the next poll"""
+        history = client.get_feed_history(feed.id)
+        # a not modified feed has no run in the history, but it is a run without news
+        counts = ([0] if feed.not_modified else []) + history.counts
+        interval = next_poll_interval(
+            history.posted,
+            counts,
+            record.poll_interval or self._interval,
+            self._min_interval,
+            self._max_interval,
+        )
+        next_poll_at = datetime.now() + timedelta(seconds=interval)
+        client.save_feed_schedule(feed.id, interval, next_poll_at)
+        self._next_polls[record.url] = next_poll_at
+        print(f"next poll of {record.url} in {interval:.0f}s")
+
+    def next_poll(self, record: ScheduledFeed) -> datetime:
+        return self._next_polls.get(record.url) or record.next_poll_at or datetime.min
+
+    def run_once(self) -> None:
+        """run all feeds once"""
+        self.run_feeds(self.load_feeds())
+
+    def run_feeds(self, feeds: List[ScheduledFeed]) -> None:
+        """run feeds concurrently, a failed feed does not stop the others"""
+        print(f"run {len(feeds)} feeds")
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            futures = {executor.submit(self.run_feed, f): f for f in feeds}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"feed {futures[future].url} failed: {e.__class__.__name__}: {e}")
+
+    def serve(self, stop: threading.Event = None) -> None:
+        """
+        run every feed at the time of its next poll until the process is stopped or stop is set.
+        A due feed is submitted at once without waiting for other feeds, a slow feed delays
+        only itself, and a feed which is still running is not submitted again
+        """
+        stop = stop or threading.Event()
+        running = {}
+        lock = threading.Lock()
+        # a finished feed has a new next poll, it may be earlier than the planned wait
+        finished = threading.Event()
+
+        def done(record: ScheduledFeed, future) -> None:
+            with lock:
+                running.pop(record.url, None)
+            try:
+                future.result()
+            except Exception as e:
+                print(f"feed {record.url} failed: {e.__class__.__name__}: {e}")
+            finished.set()
+
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            while not stop.is_set():
+                finished.clear()
+                feeds = self.load_feeds()
+                now = datetime.now()
+                with lock:
+                    waiting = [f for f in feeds if f.url not in running]
+                due = [f for f in waiting if self.next_poll(f) <= now]
+                for f in due:
+                    with lock:
+                        running[f.url] = future = executor.submit(self.run_feed, f)
+                    future.add_done_callback(partial(done, f))
+                if due:
+                    print(f"run {len(due)} feeds, {len(running)} feeds are running")
+
+                # new feeds of the schema are found at least every min interval
+                wait = self._min_interval
+                planned = [self.next_poll(f) for f in waiting if f not in due]
+                if planned:
+                    wait = min(wait, (min(planned) - datetime.now()).total_seconds())
+                finished.wait(max(1.0, wait))
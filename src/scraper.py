@@ -1,12 +1,13 @@
-import feedparser
-import requests
+import os
+from concurrent.futures import Executor, Future
 from time import mktime
 from datetime import datetime
 import hashlib
-from tldextract import extract
-from parsers import ReutersParser
-from clients import PostgresClient, MongoClient
 from filetypes import ABCType, CSVType
+from metrics import RunMetrics
+from cache import HTMLCache
+from pipeline import WriteBehindPipeline
+from clients import JOB_WATERMARK_PREFIX
 
 
 def save_to_file(data, filename=None):
@@ -25,6 +26,13 @@ class News:
         self.posted = posted
         self.url = url
         self.full_description = None
+        # the reason why the full description could not be received
+        self.error = None
+        self.downloaded_bytes = 0
+        self.from_cache = False
+        # hash of the saved news which tells the same story and signatures of texts of the news
+        self.duplicate_of = None
+        self.signatures = []
 
     def __str__(self):
         return self.__repr__()
@@ -35,59 +43,173 @@ class News:
     @property
     def hash(self):
         # generate hash by news URL
-        return (hashlib.sha1(self.url.encode("utf8")).hexdigest(),)
+        return hashlib.sha1(self.url.encode("utf8")).hexdigest()
 
-    def download_full_description(self):
+    def download(self, timeout=None):
+        """
+        download raw HTML of the news page, raise an exception if the page is not available,
+        the page is taken from the cache of the feed when it is there
+        """
+        cache = self.feed.cache
+        if cache is not None:
+            text = cache.get(self.url)
+            if text is not None:
+                self.from_cache = True
+                return text
+
+        r = self.feed.session.get(self.url, timeout=timeout)
+        r.raise_for_status()
+        self.downloaded_bytes = len(r.content)
+        if cache is not None:
+            cache.put(self.url, r.text)
+        return r.text
+
+    def download_full_description(self, timeout=None):
         # download news body from news URL
-        r = requests.get(self.url)
-        if r.status_code == 200:
-            body_parser = self.feed.body_news_parser
-            self.full_description = body_parser.cleaned_data(r.text)
+        body_parser = self.feed.body_news_parser
+        self.full_description = body_parser.cleaned_data(self.download(timeout or self.feed._timeout))
 
 
 class Feed():
 
     """Class for working with rss, parsing and saving in the database"""
 
-    def __init__(self, url, body_news_parser, database_client, schema=None, filetype: ABCType=None):
+    def __init__(
+            self,
+            url,
+            body_news_parser,
+            database_client,
+            schema=None,
+            filetype: ABCType = None,
+            workers: int = 8,
+            timeout: float = 10,
+            session=None,
+            exporters: list = None,
+            cache: HTMLCache = None,
+            cleaner: Executor = None,
+            batch_size: int = 100,
+            flush_interval: float = 5.0,
+            queue_size: int = None,
+            dedup=None,
+    ):
         self._url = url
         self.body_news_parser = body_news_parser
         # use domain name as name of schema if schema is None
-        self._schema = schema or extract(url).domain
+        self._schema = schema or self._domain(url)
         database_client._schema = self._schema
         self._database_client = database_client
-        self._news = []
+        self._news = None
+        # the feed was not changed since the last fetch, the server answered 304
+        self.not_modified = False
+        self._validators = (None, None)
         self._filetype = filetype or CSVType()
+        # number of parallel downloads and timeout of the one download in seconds
+        self._workers = workers
+        self._timeout = timeout
+        # HTTP fetcher, a Fetcher or requests.Session, and cache of pages may be shared
+        # between feeds which run in one process
+        self._session = session
+        self.cache = cache
+        # pages are cleaned in this executor, usually a process pool, or in the current thread
+        self._cleaner = cleaner
+        # news are saved by batches of batch_size or every flush_interval seconds during downloading,
+        # at most queue_size news wait for every stage
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue_size = queue_size or workers * 4
+        # dedup.NearDuplicates, a story saved from other URL is not downloaded or its body is not saved again
+        self._dedup = dedup
+        # news which full description could not be received during the run
+        self.failures = []
+        # timings of stages of the run, exporters send them to monitoring
+        self.metrics = RunMetrics()
+        self._exporters = exporters or []
+
+    @staticmethod
+    def _domain(url):
+        # tldextract is slow to import and is needed only without a schema
+        from tldextract import extract
+
+        return extract(url).domain
+
+    @property
+    def session(self):
+        """return the HTTP fetcher, a new one is created on the first fetch"""
+        if self._session is None:
+            # requests is slow to import and is not needed by exports
+            from fetcher import Fetcher
+
+            self._session = Fetcher(timeout=self._timeout)
+        return self._session
+
+    @property
+    def record(self):
+        """return the feed saved in the database, when the feed is not saved it will be saved"""
+        if not "_record" in self.__dict__:
+            client = self._database_client
+            self._record = client.get_feed_by_url(
+                url=self._url, parser=self.body_news_parser.__class__.__name__
+            )
+        return self._record
 
     @property
     def id(self):
         """return id when the id is None, get it from  database"""
-        if not "_id" in self.__dict__:
-            client = self._database_client
-            feed = client.get_feed_by_url(url=self._url)
-            self._id = feed.id
-        return self._id
+        return self.record.id
 
     @property
     def news(self):
         """return all news from URL at now"""
-        if not self._news:
+        if self._news is None:
             self.parse()
         return self._news
 
     @property
     def only_new_news(self):
-        """return only fresh news, in current realization based on DateTime last posted news"""
-        last_date = self._database_client.get_last_posted_date()
-        last_news = self.news
-        if last_date:
-            # filter only new news by posted date
-            last_news = [news for news in self.news if news.posted > last_date]
-        return last_news
+        """return only news which hashes are not saved in the database yet"""
+        unique = {}
+        for n in self.news:
+            unique.setdefault(n.hash, n)
+        saved = self._database_client.get_existing_hashes(list(unique))
+        return [n for h, n in unique.items() if h not in saved]
+
+    def fetch(self):
+        """
+        download RSS by URL with ETag and Last-Modified of the previous fetch,
+        return None when the feed was not modified
+        """
+        headers = {}
+        if self.record.etag:
+            headers["If-None-Match"] = self.record.etag
+        if self.record.modified:
+            headers["If-Modified-Since"] = self.record.modified
+
+        r = self.session.get(self._url, headers=headers, timeout=self._timeout)
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        self._validators = (r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        return r
 
     def parse(self):
         """parsing RSS by URL and save found items to ._news"""
-        feed = feedparser.parse(self._url)
+        with self.metrics.stage("fetch"):
+            r = self.fetch()
+        self.not_modified = r is None
+        if self.not_modified:
+            self._news = []
+            return
+
+        with self.metrics.stage("parse"):
+            self._news = self._parse_entries(r)
+        self.metrics.add("feed_bytes", len(r.content))
+        self.metrics.add("items", len(self._news))
+
+    def _parse_entries(self, r):
+        import feedparser
+
+        headers = {k.lower(): v for k, v in r.headers.items()}
+        feed = feedparser.parse(r.content, response_headers=headers)
         news = []
 
         for item in feed.entries:
@@ -100,37 +222,184 @@ class Feed():
                     item.link,
                 )
             )
-
-        self._news = news
+        return news
 
     def save_news_to_db(self, by_user: bool = False) -> None:
         """ saving news to database, will be saved only new news"""
         client = self._database_client
-        news = self.only_new_news
+        with self.metrics.stage("filter"):
+            news = self.only_new_news
+        self.metrics.add("new_items", len(news))
+        if news:
+            # download fulltext description only for news which will be saved,
+            # news are saved while others are downloading
+            with self.metrics.stage("download"):
+                saved = self.ingest_news(news)
+            self.metrics.add("saved", saved)
+            print(f"{saved} news saved to the schema {self._schema}")
+            if self.failures:
+                print(f"{len(self.failures)} news saved without full description")
+            duplicates = self.metrics.counters.get("duplicates")
+            if duplicates:
+                print(f"{duplicates} news are near duplicates of saved news, their full description is not saved")
+        else:
+            print(f"no new news")
         client.save_scraper_info(
-            (datetime.now(), len(news), by_user, self._url, self.id)
+            (datetime.now(), len(news), by_user, self._url, self.id),
+            metrics=self.metrics.as_dict(),
         )
-        if news:
-            # download fulltext description news by url for all item in list
-            for n in self.news:
-                n.download_full_description()
 
-            client.save_news(news)
-            print(f"{len(news)} news saved to the schema {self._schema}")
+    def ingest_news(self, news) -> int:
+        """
+        Download pages of news, clean them by the body parser and save news by batches,
+        return the number of saved news. Stages are connected by bounded queues,
+        so a downloaded page is cleaned while others are downloading and saved batches
+        are not lost when the run fails. A failed news is stored in .failures and saved
+        without full description. The time of the stage download includes the time of
+        the other stages, the times of the cleaning and inserts are measured separately
+        """
+        if self._dedup and self._dedup.skip == "download":
+            with self.metrics.stage("dedup"):
+                self.metrics.add("duplicates", self._dedup.mark_summaries(self._database_client, news))
+        pipeline = WriteBehindPipeline(
+            process=self._download_page,
+            finish=self._finish_page,
+            write=self._write_news,
+            workers=self._workers,
+            queue_size=self._queue_size,
+            batch_size=self._batch_size,
+            flush_interval=self._flush_interval,
+        )
+        saved = pipeline.run(news)
+        self.metrics.add("batches", pipeline.batches)
+        return saved
+
+    def _download_page(self, n) -> Future:
+        if n.duplicate_of:
+            # the story is saved from other URL, the page is not downloaded
+            future = Future()
+            future.set_result((None, 0.0))
+            return future
+        text = n.download(self._timeout)
+        if n.from_cache:
+            self.metrics.add("cache_hits")
         else:
-            print(f"no new news")
+            self.metrics.add("downloads")
+            self.metrics.add("download_bytes", n.downloaded_bytes)
+        return self._clean(text)
 
-    def export_to_file(self, from_date=None, to_date=None, filename=None):
+    def _finish_page(self, n, future: Future) -> None:
+        try:
+            n.full_description, seconds = future.result()
+            self.metrics.add_time("clean", seconds)
+        except Exception as e:
+            self._fail(n, e)
+
+    def _write_news(self, news) -> int:
+        client = self._database_client
+        # only skip store drops bodies of duplicates, in download mode every downloaded body is saved
+        if self._dedup and self._dedup.skip == "store":
+            with self.metrics.stage("dedup"):
+                self.metrics.add("duplicates", self._dedup.mark_bodies(client, news))
+            for n in news:
+                if n.duplicate_of:
+                    n.full_description = None
+        with self.metrics.stage("insert"):
+            saved = client.save_news(news)
+            if self._dedup:
+                # signatures are saved after their news, so a failed batch does not hide its news
+                client.save_signatures([s for n in news for s in n.signatures])
+        # saved descriptions are not needed anymore, so memory holds only news in flight
+        for n in news:
+            n.full_description = None
+        return saved
+
+    def _clean(self, text) -> Future:
+        # parsers import bs4 and html2text, they are needed only to clean pages
+        from parsers import clean_page
+
+        if self._cleaner:
+            return self._cleaner.submit(clean_page, self.body_news_parser, text)
+        future = Future()
+        try:
+            future.set_result(clean_page(self.body_news_parser, text))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _fail(self, n, e) -> None:
+        n.error = f"{e.__class__.__name__}: {e}"
+        self.failures.append(n)
+        self.metrics.add("failures")
+        print(f"failed to get full description of {n.url}: {n.error}")
+
+    def export_to_file(self, from_date=None, to_date=None, filename=None, destination=None):
         """
-        Get data from database and saves it to file
+        Get data from database and saves it to file.
+        With a destination only news added after the previous export to the destination are saved,
+        the watermark of the destination is moved after the file is completely written
         """
         client = self._database_client
-        news = client.get_news(from_date, to_date)
-        print(f"exported {len(news)} news")
-        self._filetype.save(news, filename)
+        filename = filename or self._filetype.default_filename(self._filetype.extension)
+
+        after_id = until_id = None
+        if destination:
+            if from_date or to_date:
+                # the watermark is one for all news, news out of dates would be marked as exported
+                raise ValueError("an incremental export exports all new news, dates can not be set")
+            if destination.startswith(JOB_WATERMARK_PREFIX):
+                raise ValueError(f"names of destinations which start with {JOB_WATERMARK_PREFIX} are reserved for jobs")
+            after_id = client.get_watermark(destination)
+            until_id = client.get_export_bound()
+            if until_id is None or until_id == after_id:
+                print(f"no new news for {destination}")
+                return
+            # the file appears under its name only when it is written
+            path = f"{filename}.part"
+        else:
+            path = filename
+
+        if hasattr(client, "copy_news_to") and isinstance(self._filetype, CSVType):
+            # the fast path, CSV is formatted by Postgres and streamed to the file
+            with self._filetype.open(path) as f:
+                count = client.copy_news_to(f, from_date, to_date, after_id, until_id)
+        else:
+            news = client.iter_news(from_date, to_date, after_id=after_id, until_id=until_id)
+            count = self._filetype.save(news, path)
 
+        if destination:
+            # the bound moves with writes of other feeds too, so it can pass no new news
+            if not count:
+                os.remove(path)
+                client.save_watermark(destination, until_id)
+                print(f"no new news for {destination}")
+                return
+            os.replace(path, filename)
+            client.save_watermark(destination, until_id)
+        # the file has its final name only now
+        print(f"exported to {filename}")
+        print(f"exported {count} news")
 
     def run(self):
-        self.parse()
-        self.save_news_to_db()
+        try:
+            self.parse()
+            if self.not_modified:
+                print(f"feed {self._url} is not modified")
+                self.metrics.add("not_modified")
+                return
+            self.save_news_to_db()
+            # validators are saved only after news, so news of a failed run will be received again
+            etag, modified = self._validators
+            self._database_client.save_feed_validators(self.id, etag, modified)
+        finally:
+            self.export_metrics()
+
+    def export_metrics(self):
+        """send metrics of the run to all exporters, a failed exporter does not stop the run"""
+        labels = {"feed": self._url, "schema": self._schema}
+        for exporter in self._exporters:
+            try:
+                exporter.export(labels, self.metrics)
+            except Exception as e:
+                print(f"failed to export metrics: {e.__class__.__name__}: {e}")
 
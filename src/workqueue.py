@@ -0,0 +1,320 @@
+import os
+import socket
+import threading
+import time
+from collections import namedtuple, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List
+
+import psycopg2.extras
+
+from cache import HTMLCache
+from fetcher import Fetcher
+from parsers import ABCParser, get_parser
+from postgres import PostgresClient
+from scheduler import read_feeds_file
+from scraper import Feed, News
+
+# a task leased by a worker, payload is a dict
+Task = namedtuple("Task", ["id", "kind", "key", "payload", "attempts"])
+
+FEED = "feed"
+ARTICLE = "article"
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class TaskQueue:
+    """
+    Queue of tasks in the table tasks of the schema of Postgres, shared by many workers.
+    A worker leases tasks by SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait
+    for each other and never get the same task. A lease expires after lease seconds,
+    so a task of a dead worker is taken by another worker, a living worker extends
+    its leases by heartbeats
+    """
+
+    def __init__(self, client: PostgresClient, owner: str = None, lease: float = 60, max_attempts: int = 3):
+        self._client = client
+        self.owner = owner or default_owner()
+        self._lease = lease
+        self._max_attempts = max_attempts
+        # heartbeats extend leases by their own connection while the connection of the queue is busy,
+        # the client is made once, so every heartbeat uses the same connection
+        self._heartbeat_client = client.clone()
+
+    @property
+    def _schema(self):
+        return self._client._schema
+
+    def _execute(self, SQL, params=(), fetch=False, client: PostgresClient = None):
+        conn = (client or self._client)._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL, params)
+                return cur.fetchall() if fetch else cur.rowcount
+
+    def put(self, kind: str, items, again: bool = False) -> int:
+        """
+        add tasks from (key, payload) pairs, return the number of added tasks.
+        An existing task with the same key is kept, when again is True its finished
+        or failed copy is made ready
+        """
+        rows = [(kind, key, psycopg2.extras.Json(payload)) for key, payload in items]
+        if not rows:
+            return 0
+        CONFLICT = (
+            "DO UPDATE SET status = 'ready', not_before = now(), attempts = 0, payload = EXCLUDED.payload "
+            f"WHERE {self._schema}.tasks.status = 'failed'"
+            if again else "DO NOTHING"
+        )
+        SQL = f"""
+        INSERT INTO {self._schema}.tasks (kind, key, payload)
+        VALUES %s
+        ON CONFLICT (kind, key) {CONFLICT}
+        RETURNING id
+        """
+        conn = self._client._get_connection()
+        with conn:
+            with conn.cursor() as cur:
+                return len(psycopg2.extras.execute_values(cur, SQL, rows, fetch=True))
+
+    def take(self, kind: str, limit: int = 1) -> List[Task]:
+        """lease ready tasks and tasks which leases are expired"""
+        SQL = f"""
+        WITH claimed AS (
+            SELECT id FROM {self._schema}.tasks
+            WHERE kind = %s AND (
+                status = 'ready' AND not_before <= now()
+                OR status = 'leased' AND lease_until < now()
+            )
+            ORDER BY not_before
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE {self._schema}.tasks AS t
+        SET status = 'leased', owner = %s, lease_until = now() + %s * interval '1 second',
+            attempts = t.attempts + 1
+        FROM claimed
+        WHERE t.id = claimed.id
+        RETURNING t.id, t.kind, t.key, t.payload, t.attempts
+        """
+        rows = self._execute(SQL, (kind, limit, self.owner, self._lease), fetch=True)
+        tasks = [Task(*row) for row in rows]
+
+        # a task which killed its workers too many times is not taken again
+        dead = [t for t in tasks if t.attempts > self._max_attempts]
+        if dead:
+            self.fail(dead, "lease expired too many times")
+        return [t for t in tasks if t.attempts <= self._max_attempts]
+
+    def extend(self, tasks: List[Task], client: PostgresClient = None) -> int:
+        """extend leases of tasks, return the number of tasks which are still leased by the worker"""
+        SQL = f"""
+        UPDATE {self._schema}.tasks SET lease_until = now() + %s * interval '1 second'
+        WHERE id = ANY(%s) AND owner = %s AND status = 'leased'
+        """
+        return self._execute(SQL, (self._lease, [t.id for t in tasks], self.owner), client=client)
+
+    def done(self, tasks: List[Task]) -> None:
+        """remove finished tasks"""
+        SQL = f"DELETE FROM {self._schema}.tasks WHERE id = ANY(%s) AND owner = %s"
+        self._execute(SQL, ([t.id for t in tasks], self.owner))
+
+    def later(self, tasks: List[Task], seconds: float, error: str = None) -> None:
+        """make tasks ready again after seconds, used by recurring tasks"""
+        SQL = f"""
+        UPDATE {self._schema}.tasks
+        SET status = 'ready', not_before = now() + %s * interval '1 second', attempts = 0,
+            owner = NULL, lease_until = NULL, error = %s
+        WHERE id = ANY(%s) AND owner = %s
+        """
+        self._execute(SQL, (seconds, error, [t.id for t in tasks], self.owner))
+
+    def fail(self, tasks: List[Task], error: str, delay: float = 30) -> None:
+        """retry tasks after a delay growing with attempts, a task out of attempts is marked as failed"""
+        SQL = f"""
+        UPDATE {self._schema}.tasks
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'ready' END,
+            not_before = now() + attempts * %s * interval '1 second',
+            owner = NULL, lease_until = NULL, error = %s
+        WHERE id = ANY(%s) AND owner = %s
+        """
+        self._execute(SQL, (self._max_attempts, delay, error[:1000], [t.id for t in tasks], self.owner))
+
+    @contextmanager
+    def heartbeat(self, tasks: List[Task]):
+        """extend leases of tasks in a thread while the block runs"""
+        stop = threading.Event()
+
+        def beat():
+            try:
+                while not stop.wait(self._lease / 3):
+                    self.extend(tasks, self._heartbeat_client)
+            except Exception as e:
+                print(f"failed to extend leases: {e.__class__.__name__}: {e}")
+                # a broken connection is opened again by the next heartbeat
+                self._heartbeat_client.close()
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def close(self) -> None:
+        self._heartbeat_client.close()
+
+
+class QueueWorker:
+    """
+    A scraper which takes feeds and articles from the queue, so many workers in different
+    containers share the work. A feed task fetches the feed and adds an article task for every
+    new news, the feed task is ready again after the interval. Article tasks are taken by
+    batches, their pages are downloaded and cleaned and news are saved
+    """
+
+    def __init__(
+            self,
+            database_client: PostgresClient,
+            default_parser: ABCParser,
+            queue: TaskQueue,
+            interval: float = 3600,
+            articles: int = 50,
+            workers: int = 8,
+            timeout: float = 10,
+            cache: HTMLCache = None,
+            rate: float = None,
+            dedup=None,
+    ):
+        self._client = database_client
+        self._default_parser = default_parser
+        self._queue = queue
+        self._interval = interval
+        self._articles = articles
+        self._workers = workers
+        self._timeout = timeout
+        self._cache = cache
+        # dedup.NearDuplicates, signatures are in the schema, so all workers find duplicates of each other
+        self._dedup = dedup
+
+        self.session = Fetcher(rate=rate, timeout=timeout, pool_size=workers)
+
+    def _feed(self, url, parser) -> Feed:
+        return Feed(
+            url=url,
+            body_news_parser=get_parser(parser) if parser else self._default_parser,
+            database_client=self._client,
+            schema=self._client._schema,
+            workers=self._workers,
+            timeout=self._timeout,
+            session=self.session,
+            cache=self._cache,
+            dedup=self._dedup,
+        )
+
+    def add_feeds(self, feeds_file=None) -> int:
+        """add a task for every feed of the schema and of the feeds file"""
+        self._client.ensure_schema()
+        items = {f.url: {"parser": f.parser} for f in self._client.get_feeds()}
+        if feeds_file:
+            for f in read_feeds_file(feeds_file):
+                items[f.url] = {"parser": f.parser}
+        return self._queue.put(FEED, items.items(), again=True)
+
+    def run_feed(self, task: Task) -> None:
+        """fetch the feed and add new news to the queue"""
+        feed = self._feed(task.key, task.payload.get("parser"))
+        feed.parse()
+        if feed.not_modified:
+            print(f"feed {task.key} is not modified")
+            return
+        news = feed.only_new_news
+        added = self._queue.put(
+            ARTICLE,
+            (
+                (
+                    n.hash,
+                    {
+                        "feed": task.key,
+                        "parser": task.payload.get("parser"),
+                        "title": n.title,
+                        "short_description": n.short_description,
+                        "posted": n.posted.isoformat(),
+                        "url": n.url,
+                    },
+                )
+                for n in news
+            ),
+        )
+        print(f"{added} news of {task.key} added to the queue")
+        etag, modified = feed._validators
+        self._client.save_feed_validators(feed.id, etag, modified)
+        self._client.save_scraper_info(
+            (datetime.now(), added, False, task.key, feed.id), metrics=feed.metrics.as_dict()
+        )
+
+    def run_articles(self, tasks: List[Task]) -> int:
+        """download, clean and save news of tasks, return the number of saved news"""
+        by_feed = defaultdict(list)
+        for t in tasks:
+            by_feed[(t.payload["feed"], t.payload.get("parser"))].append(t)
+
+        saved = 0
+        for (url, parser), feed_tasks in by_feed.items():
+            feed = self._feed(url, parser)
+            news = [
+                News(
+                    feed,
+                    t.payload["title"],
+                    t.payload["short_description"],
+                    datetime.fromisoformat(t.payload["posted"]),
+                    t.payload["url"],
+                )
+                for t in feed_tasks
+            ]
+            saved += feed.ingest_news(news)
+        return saved
+
+    def run_once(self) -> int:
+        """run tasks which are ready now, return the number of run tasks"""
+        queue = self._queue
+        count = 0
+        for task in queue.take(FEED, 1):
+            count += 1
+            try:
+                with queue.heartbeat([task]):
+                    self.run_feed(task)
+                queue.later([task], self._interval)
+            except Exception as e:
+                error = f"{e.__class__.__name__}: {e}"
+                print(f"failed to run feed {task.key}: {error}")
+                # a feed is a recurring task, it is tried again at the next interval
+                queue.later([task], self._interval, error)
+
+        tasks = queue.take(ARTICLE, self._articles)
+        if tasks:
+            count += len(tasks)
+            try:
+                with queue.heartbeat(tasks):
+                    saved = self.run_articles(tasks)
+                queue.done(tasks)
+                print(f"{saved} news of {len(tasks)} tasks saved by {queue.owner}")
+            except Exception as e:
+                error = f"{e.__class__.__name__}: {e}"
+                print(f"failed to run {len(tasks)} article tasks: {error}")
+                queue.fail(tasks, error)
+        return count
+
+    def serve(self, idle: float = 5, once: bool = False) -> None:
+        """run tasks until the process is stopped, with once until no task is ready"""
+        while True:
+            if self.run_once():
+                continue
+            if once:
+                return
+            time.sleep(idle)
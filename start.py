@@ -1,5 +1,6 @@
 import click
 import os
+import shlex
 
 @click.group()
 def cli():
@@ -23,9 +24,22 @@ def create_schema(name):
     os.system(cmd)
 
 @click.command()
-def run_scraper():
+@click.option('--dedup', type=click.Choice(['off', 'download', 'store']), default='off',
+              help='Skip downloading or storing near-duplicates of saved stories')
+def run_scraper(dedup):
     """Run scraper"""
-    cmd = f'docker-compose exec scraper /usr/local/bin/python /app/cli.py run-scraper'
+    cmd = f'docker-compose exec scraper /usr/local/bin/python /app/cli.py run-scraper --dedup {dedup}'
+    os.system(cmd)
+
+@click.command()
+@click.option('--feeds-file', default=None, help='File with feeds inside the scraper container')
+@click.option('--dedup', type=click.Choice(['off', 'download', 'store']), default='off',
+              help='Skip downloading or storing near-duplicates of saved stories')
+def serve(feeds_file, dedup):
+    """Run scraper for all feeds as a long-running process in background"""
+    cmd = f'docker-compose exec -d scraper /usr/local/bin/python /app/cli.py serve --dedup {dedup}'
+    if feeds_file:
+        cmd = cmd + f" --feeds-file '{feeds_file}' "
     os.system(cmd)
 
 @click.command()
@@ -33,8 +47,11 @@ def run_scraper():
 @click.option('--end', default=None, help="End period fo select data string in format <YYYY-MM-DD HH24:MI:SS> ")
 @click.option('--schema', default=None, help='Name of the database where the data will be saved')
 @click.option('--filename', default=None, help='Name for export file')
-def export(start, end, schema, filename):
-    """Export data to CSV, the data will be saved in the folder 'output'"""
+@click.option('--format', 'file_format', default=None, help='Format of export file: csv, csv.gz, csv.zst, jsonl, jsonl.gz, jsonl.zst or parquet')
+@click.option('--incremental', is_flag=True, help='Export only news added after the previous incremental export to the destination')
+@click.option('--destination', default=None, help='Name of the destination of an incremental export')
+def export(start, end, schema, filename, file_format, incremental, destination):
+    """Export data to file, the data will be saved in the folder 'output'"""
     cmd = f'docker-compose exec scraper /usr/local/bin/python /app/cli.py export '
     if start:
         cmd = cmd + f" --start '{start}' "
@@ -44,9 +61,37 @@ def export(start, end, schema, filename):
         cmd = cmd + f" --schema '{schema}' "
     if filename:
         cmd = cmd + f" --filename '{filename}' "
+    if file_format:
+        cmd = cmd + f" --format '{file_format}' "
+    if incremental:
+        cmd = cmd + " --incremental "
+    if destination:
+        cmd = cmd + f" --destination '{destination}' "
     os.system(cmd)
     print(cmd)
 
+@click.command()
+@click.argument('query')
+@click.option('--limit', default=20, help='Number of news on a page')
+@click.option('--page', default=1, help='Number of the page of results')
+@click.option('--schema', default=None, help='Name of the database where the data are saved')
+def search(query, limit, page, schema):
+    """Search news by words of titles and descriptions, the best matched first"""
+    cmd = f'docker-compose exec scraper /usr/local/bin/python /app/cli.py search {shlex.quote(query)} --limit {limit} --page {page}'
+    if schema:
+        cmd = cmd + f" --schema '{schema}' "
+    os.system(cmd)
+
+@click.command()
+@click.option('--keep-months', default=12, help='Number of months of news kept before the current month')
+@click.option('--drop', is_flag=True, help='Drop old partitions instead of detaching them')
+def retention(keep_months, drop):
+    """Detach or drop monthly partitions of old news"""
+    cmd = f'docker-compose exec scraper /usr/local/bin/python /app/cli.py retention --keep-months {keep_months}'
+    if drop:
+        cmd = cmd + " --drop "
+    os.system(cmd)
+
 @click.command()
 def stop_server():
     """Stop server"""
@@ -57,7 +102,10 @@ def stop_server():
 cli.add_command(start_server)
 cli.add_command(create_schema)
 cli.add_command(run_scraper)
+cli.add_command(serve)
 cli.add_command(export)
+cli.add_command(search)
+cli.add_command(retention)
 cli.add_command(stop_server)
 
 if __name__ == '__main__':
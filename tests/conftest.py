@@ -0,0 +1,48 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT.joinpath("src")))
+sys.path.insert(0, str(ROOT.joinpath("benchmarks")))
+
+# tests of Postgres run against the server of this host, e.g. the socket folder of a local server,
+# without it they are skipped
+PG_HOST = os.environ.get("SCRAPER_TEST_PG_HOST")
+MONGO_HOST = os.environ.get("SCRAPER_TEST_MONGO_HOST")
+
+
+@pytest.fixture
+def pg_client():
+    """return a client of a new schema which is dropped after the test"""
+    if not PG_HOST:
+        pytest.skip("SCRAPER_TEST_PG_HOST is not set")
+    import postgres
+
+    client = postgres.PostgresClient(host=PG_HOST, schema=f"test_{uuid.uuid4().hex[:8]}")
+    client.create_schema()
+    yield client
+
+    conn = client._get_connection()
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {client._schema} CASCADE")
+    client.close()
+    postgres._ready_schemas.discard(client._cache_key)
+
+
+@pytest.fixture
+def mongo_database():
+    """return a new database which is dropped after the test"""
+    if not MONGO_HOST:
+        pytest.skip("SCRAPER_TEST_MONGO_HOST is not set")
+    import pymongo
+
+    connection = pymongo.MongoClient(MONGO_HOST)
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    yield connection, name
+    connection.drop_database(name)
+    connection.close()
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from aioclients import AsyncMongoClient, AsyncPostgresClient
+
+
+def _news(feed_id, url, posted):
+    return SimpleNamespace(
+        feed=SimpleNamespace(id=feed_id), title=url, short_description=None, posted=posted,
+        url=url, hash=url, full_description=None,
+    )
+
+
+async def _save_and_read(client):
+    feed = await client.get_feed_by_url("http://feed/rss", parser="ReutersParser")
+    assert await client.get_feed_by_url("http://feed/rss") == feed
+    assert [f.url for f in await client.get_feeds()] == ["http://feed/rss"]
+
+    saved = await client.save_news([
+        _news(feed.id, "http://a", datetime(2020, 1, 1)),
+        _news(feed.id, "http://b", datetime(2020, 2, 1)),
+        _news(feed.id, "http://a", datetime(2020, 1, 1)),
+    ])
+    assert saved == 2
+    assert await client.save_news([_news(feed.id, "http://a", datetime(2020, 1, 1))]) == 0
+    assert await client.get_existing_hashes(["http://a", "http://c"]) == {"http://a"}
+    assert await client.get_last_posted_date() == datetime(2020, 2, 1)
+    # news are streamed by batches
+    assert sorted([n.url async for n in client.iter_news(batch_size=1)]) == ["http://a", "http://b"]
+    assert [n.url async for n in client.iter_news(from_date=datetime(2020, 1, 15))] == ["http://b"]
+
+
+def test_async_postgres_client(pg_client):
+    async def run():
+        client = AsyncPostgresClient(host=pg_client._host, schema=pg_client._schema)
+        try:
+            await _save_and_read(client)
+            # news saved by the async client are exported incrementally like news of the sync one
+            bound = pg_client.get_export_bound()
+            assert [n.url async for n in client.iter_news(until_id=bound)] == ["http://a", "http://b"]
+            assert [n.url async for n in client.iter_news(after_id=bound)] == []
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+    assert [r.url for r in pg_client.get_news_refs()] == ["http://a", "http://b"]
+
+
+def test_async_mongo_client(mongo_database):
+    connection, name = mongo_database
+    host, port = connection.address
+
+    async def run():
+        client = AsyncMongoClient(host=host, port=port, schema=name)
+        try:
+            await _save_and_read(client)
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+    assert sorted(n["url"] for n in connection[name]["news"].find()) == ["http://a", "http://b"]
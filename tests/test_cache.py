@@ -0,0 +1,38 @@
+import os
+import time
+
+from cache import HTMLCache
+
+
+def _page(size: int) -> str:
+    # hex digits of random bytes are compressed about twice, so a file is a bit over size bytes
+    return os.urandom(size).hex()
+
+
+def test_processes_which_share_the_folder_keep_its_size(tmp_path):
+    # caches of two processes, every one knows only its own pages
+    first = HTMLCache(tmp_path, max_bytes=12000)
+    second = HTMLCache(tmp_path, max_bytes=12000)
+    for i in range(10):
+        (first if i % 2 else second).put(f"http://site/{i}", _page(4000))
+
+    files = list(tmp_path.glob("*/*.gz"))
+    assert sum(f.stat().st_size for f in files) <= 12000
+    assert first.size == second.size == sum(f.stat().st_size for f in files)
+    # the last pages are kept
+    assert first.get("http://site/9") is not None
+    assert second.get("http://site/8") is not None
+
+
+def test_recently_used_pages_are_kept(tmp_path):
+    cache = HTMLCache(tmp_path, max_bytes=12000)
+    cache.put("http://site/1", _page(4000))
+    cache.put("http://site/2", _page(4000))
+    # mtime is the time of the last use
+    time.sleep(0.01)
+    assert cache.get("http://site/1") is not None
+    cache.put("http://site/3", _page(4000))
+
+    assert cache.get("http://site/2") is None
+    assert cache.get("http://site/1") is not None
+    assert len(cache) == 2
@@ -0,0 +1,179 @@
+import random
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from dedup import BODY, SUMMARY, NearDuplicates, band_keys, shingle_hashes, words
+from memory_client import MemoryClient
+from scraper import Feed
+
+TITLE = "Oil prices rise as OPEC agrees to extend output cuts through the end of the year"
+
+# edits of the title which keep the story
+SAME_STORY = [
+    "Oil prices climb as OPEC agrees to extend output cuts through the end of the year",
+    "UPDATE 2-Oil prices rise as OPEC agrees to extend output cuts through the end of the year",
+    "Oil prices rise as OPEC agrees to extend <b>output cuts</b> through the end of the year.",
+    "OIL PRICES RISE as OPEC agrees to extend output cuts through the end of this year",
+]
+OTHER_STORIES = [
+    "Oil prices fall as OPEC fails to agree on output cuts amid a glut of crude",
+    "Tesla shares slump after the electric carmaker misses delivery estimates for the quarter",
+    "Gold hits a record high as investors seek safety from the trade war fears",
+]
+
+VOCABULARY = (
+    "market shares bank rates central inflation growth economy trade tariffs oil prices investors "
+    "government minister election vote court ruling company profit quarter sales forecast analysts "
+    "said reported percent billion million year month week data report expected rose fell"
+).split()
+
+
+def article(seed: int, length: int = 400) -> list:
+    rng = random.Random(seed)
+    return [rng.choice(VOCABULARY) for _ in range(length)]
+
+
+def edited(tokens: list, every: int, seed: int = 0) -> list:
+    """replace every n-th word"""
+    rng = random.Random(seed)
+    return [rng.choice(VOCABULARY) if i % every == 0 else t for i, t in enumerate(tokens)]
+
+
+def test_words_skip_tags_and_case():
+    assert words("<p>Oil PRICES</p> rise, again!") == ["oil", "prices", "rise", "again"]
+
+
+def test_shingles_do_not_depend_on_order_of_runs():
+    tokens = words("a b c d e")
+    assert len(shingle_hashes(tokens, 3)) == 3
+    assert set(shingle_hashes(tokens, 1)) == set(shingle_hashes(list(reversed(tokens)), 1))
+    assert len(shingle_hashes(tokens[:2], 3)) == 0
+
+
+def test_band_keys():
+    signature = bytes(range(64))
+    keys = band_keys(signature, 16)
+    assert len(keys) == 16 and len(set(keys)) == 16
+    assert all(-2 ** 63 <= k < 2 ** 63 for k in keys)
+    # a change of one band changes only its key
+    changed = band_keys(signature[:4] + b"\xff" * 4 + signature[8:], 16)
+    assert [a == b for a, b in zip(keys, changed)] == [True, False] + [True] * 14
+    # equal chunks of different bands have different keys
+    assert len(set(band_keys(b"\x00" * 64, 16))) == 16
+
+
+@pytest.mark.parametrize("text", SAME_STORY)
+def test_edited_summary_is_similar(text):
+    dedup = NearDuplicates()
+    first, first_keys = dedup.signature(SUMMARY, TITLE)
+    second, second_keys = dedup.signature(SUMMARY, text)
+    assert dedup.similar(SUMMARY, first, second)
+    # it is found by the index
+    assert set(first_keys) & set(second_keys)
+
+
+@pytest.mark.parametrize("text", OTHER_STORIES)
+def test_other_summary_is_not_similar(text):
+    dedup = NearDuplicates()
+    first, _ = dedup.signature(SUMMARY, TITLE)
+    second, _ = dedup.signature(SUMMARY, text)
+    assert not dedup.similar(SUMMARY, first, second)
+
+
+def test_short_text_has_no_signature():
+    dedup = NearDuplicates()
+    assert dedup.signature(SUMMARY, "Markets close higher") is None
+    assert dedup.signature(SUMMARY, "one two three four five six seven eight") is not None
+
+
+def test_bodies():
+    dedup = NearDuplicates()
+    body = article(1)
+    first, first_keys = dedup.signature(BODY, " ".join(body))
+    # one word of 30 is changed and the syndicator added its boilerplate
+    for text in (edited(body, 30), body + article(3, 40)):
+        second, second_keys = dedup.signature(BODY, " ".join(text))
+        assert dedup.similar(BODY, first, second)
+        assert set(first_keys) & set(second_keys)
+    # a rewritten body tells other story
+    third, _ = dedup.signature(BODY, " ".join(edited(body, 2)))
+    assert not dedup.similar(BODY, first, third)
+    other, other_keys = dedup.signature(BODY, " ".join(article(2)))
+    assert not dedup.similar(BODY, first, other)
+    assert not set(first_keys) & set(other_keys)
+
+
+def test_signatures_of_both_kinds_are_minhashes_of_one_size():
+    dedup = NearDuplicates()
+    summary, _ = dedup.signature(SUMMARY, TITLE)
+    body, _ = dedup.signature(BODY, " ".join(article(1)))
+    assert len(summary) == len(body)
+
+
+def _news(url, summary, body=None):
+    return SimpleNamespace(
+        feed=SimpleNamespace(id=1), title=summary, short_description="", posted=datetime(2020, 1, 1),
+        url=url, hash=url, full_description=body, duplicate_of=None, signatures=[],
+    )
+
+
+def _save(client, news):
+    client.save_news(news)
+    client.save_signatures([s for n in news for s in n.signatures])
+
+
+def test_mark_duplicates_of_saved_news():
+    client = MemoryClient()
+    dedup = NearDuplicates()
+    original = _news("http://a/1", TITLE)
+    assert dedup.mark_summaries(client, [original]) == 0
+    _save(client, [original])
+
+    news = [_news("http://b/1", SAME_STORY[0]), _news("http://b/2", OTHER_STORIES[0]), _news("http://b/3", "Short")]
+    assert dedup.mark_summaries(client, news) == 1
+    assert [n.duplicate_of for n in news] == ["http://a/1", None, None]
+    # only originals are put into the index, a short text has no signature
+    assert [(s.duplicate_of, bool(s.keys)) for n in news for s in n.signatures] == [("http://a/1", False), (None, True)]
+
+
+def test_mark_duplicates_in_one_batch():
+    client = MemoryClient()
+    dedup = NearDuplicates()
+    body = article(1)
+    news = [
+        _news("http://a/1", TITLE, " ".join(body)),
+        _news("http://b/1", TITLE, " ".join(edited(body, 30))),
+        _news("http://c/1", TITLE, " ".join(article(2))),
+    ]
+    assert dedup.mark_bodies(client, news) == 1
+    assert [n.duplicate_of for n in news] == [None, "http://a/1", None]
+
+
+def test_retired_news_are_not_originals(pg_client):
+    feed = pg_client.save_feed("http://feed/rss")
+    dedup = NearDuplicates()
+    old = _news("http://a/1", TITLE)
+    old.feed, old.posted = feed, datetime(2019, 1, 1)
+    kept = _news("http://a/2", OTHER_STORIES[1])
+    kept.feed, kept.posted = feed, datetime(2020, 6, 1)
+    dedup.mark_summaries(pg_client, [old, kept])
+    _save(pg_client, [old, kept])
+
+    assert pg_client.retire_partitions(datetime(2020, 1, 1), drop=True) == ["news_2019_01"]
+
+    news = _news("http://b/1", SAME_STORY[0])
+    assert dedup.mark_summaries(pg_client, [news]) == 0
+    # signatures of news which are kept are still found
+    kept_keys = kept.signatures[0].keys
+    assert {s.hash for s in pg_client.get_similar_signatures(SUMMARY, kept_keys)} == {"http://a/2"}
+
+
+def test_bodies_are_not_compared_when_duplicates_skip_download():
+    client = MemoryClient()
+    body = " ".join(article(1))
+    feed = Feed("http://feed/rss", None, client, schema="test", dedup=NearDuplicates(skip="download"))
+    feed._write_news([_news("http://a/1", TITLE, body), _news("http://b/1", OTHER_STORIES[1], body)])
+    assert [n.full_description for _, n in client.news] == [body, body]
+    assert feed.metrics.counters.get("duplicates") is None
@@ -0,0 +1,62 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from fetcher import CircuitOpenError, Fetcher
+
+
+class StubSession:
+    """raises or answers by the next outcome"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(status_code=outcome, headers={})
+
+
+def _fetcher(*outcomes):
+    return Fetcher(failures=1, reset_timeout=0.05, retries=0, session=StubSession(*outcomes))
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ChunkedEncodingError("broken"),
+    requests.exceptions.TooManyRedirects("loop"),
+    ValueError("unexpected"),
+])
+def test_failed_probe_opens_the_circuit_again(error):
+    fetcher = _fetcher(requests.ConnectionError("down"), error, 200)
+    with pytest.raises(requests.ConnectionError):
+        fetcher.get("http://host/1")
+    with pytest.raises(CircuitOpenError):
+        fetcher.get("http://host/2")
+
+    time.sleep(0.06)
+    with pytest.raises(type(error)):
+        fetcher.get("http://host/3")
+    with pytest.raises(CircuitOpenError):
+        fetcher.get("http://host/4")
+
+    # the host recovered, the next probe closes the circuit
+    time.sleep(0.06)
+    assert fetcher.get("http://host/5").status_code == 200
+    assert not fetcher.host("host").breaker.is_open
+
+
+def test_throttled_probe_opens_the_circuit_again():
+    fetcher = _fetcher(requests.ConnectionError("down"), 503, 200)
+    with pytest.raises(requests.ConnectionError):
+        fetcher.get("http://host/1")
+
+    time.sleep(0.06)
+    assert fetcher.get("http://host/2").status_code == 503
+    with pytest.raises(CircuitOpenError):
+        fetcher.get("http://host/3")
+
+    time.sleep(0.06)
+    assert fetcher.get("http://host/4").status_code == 200
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from mongo import EXPORT_LAG, MongoClient
+
+
+def test_duplicates_are_removed_before_the_unique_index(mongo_database):
+    connection, name = mongo_database
+    news = connection[name]["news"]
+    first = news.insert_one({"hash": "a", "url": "http://a/1"}).inserted_id
+    news.insert_one({"hash": "a", "url": "http://a/1"})
+    news.insert_one({"hash": "b", "url": "http://b/1"})
+
+    client = MongoClient(schema=name, connection=connection)
+    client.create_schema()
+
+    assert sorted(n["hash"] for n in news.find()) == ["a", "b"]
+    assert news.find_one({"hash": "a"})["_id"] == first
+    assert client.get_existing_hashes(["a", "b", "c"]) == {"a", "b"}
+
+
+def _document(_id, url):
+    return {
+        "_id": _id, "feed_id": None, "title": url, "short_description": None, "posted": None,
+        "url": url, "hash": url, "full_description": None,
+    }
+
+
+def test_late_news_are_left_for_the_next_export(mongo_database):
+    connection, name = mongo_database
+    client = MongoClient(schema=name, connection=connection)
+    news = client.db["news"]
+    now = client.db.command("isMaster")["localTime"]
+    old = ObjectId.from_datetime(now - 2 * EXPORT_LAG)
+    news.insert_one(_document(old, "http://a"))
+    # a news of a batch in flight, its id was taken before the write
+    news.insert_one(_document(ObjectId.from_datetime(now - EXPORT_LAG / 2), "http://b"))
+    client.save_news([SimpleNamespace(
+        feed=SimpleNamespace(id=None), title="c", short_description=None, posted=None, url="http://c",
+        hash="http://c", full_description=None,
+    )])
+
+    bound = client.get_export_bound()
+    assert bound == old
+    assert [n.url for n in client.iter_news(until_id=bound)] == ["http://a"]
+    assert [n.url for n in client.iter_news(after_id=bound)] == ["http://b", "http://c"]
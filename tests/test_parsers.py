@@ -0,0 +1,45 @@
+from pathlib import Path
+
+import pytest
+
+from parsers import FastReutersParser, LxmlReutersParser, ReutersParser
+
+FIXTURES = Path(__file__).absolute().parent.parent.joinpath("benchmarks", "fixtures", "reuters")
+
+HEADLINE = '<h1 class="ArticleHeader_headline">Headline</h1>'
+GARBAGE = '<div class="RelatedCoverage_related-coverage-module">{}</div>'
+
+
+def _body(text):
+    return f'<div class="StandardArticleBody_body">{text}</div>'
+
+
+PAGES = {
+    "garbage in the body": HEADLINE + _body("<p>first</p>" + GARBAGE.format("<p>related</p>") + "<p>second</p>"),
+    "nested garbage": HEADLINE + _body(GARBAGE.format("<p>related</p>" + GARBAGE.format("<p>inner</p>"))),
+    "headline in garbage": GARBAGE.format(HEADLINE) + _body("<p>text</p>"),
+    # only the first garbage block of the page is cleared, also when it is out of the body
+    "garbage before the body": (
+        HEADLINE + GARBAGE.format("<p>menu</p>") + _body("<p>text</p>" + GARBAGE.format("<p>related</p>"))
+    ),
+}
+
+
+def _pages():
+    for path in sorted(FIXTURES.glob("*.html")):
+        yield pytest.param(path.read_text(encoding="utf8"), id=path.name)
+    for name, page in PAGES.items():
+        yield pytest.param(f"<html><body><nav>menu</nav>{page}</body></html>", id=name)
+
+
+@pytest.mark.parametrize("page", _pages())
+@pytest.mark.parametrize("parser", [FastReutersParser, LxmlReutersParser])
+def test_fast_parsers_clean_pages_like_reuters_parser(parser, page):
+    assert parser.cleaned_data(page) == ReutersParser.cleaned_data(page)
+
+
+def test_garbage_is_removed_from_the_body():
+    page = PAGES["garbage in the body"]
+    text = FastReutersParser.cleaned_data(page)
+    assert "first" in text and "second" in text
+    assert "related" not in text
@@ -0,0 +1,119 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from pipeline import WriteBehindPipeline
+
+
+def done(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class Recorder:
+    """finishes items by results of their futures and records written batches"""
+
+    def __init__(self):
+        self.finished = {}
+        self.batches = []
+
+    def finish(self, item, future):
+        try:
+            self.finished[item] = future.result()
+        except Exception as e:
+            self.finished[item] = e
+
+    def write(self, batch):
+        self.batches.append(list(batch))
+        return len(batch)
+
+
+def run(pipeline, items, timeout=10.0):
+    """run the pipeline in a thread, so a hanging pipeline fails the test instead of blocking it"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome["saved"] = pipeline.run(items)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the pipeline did not terminate"
+    return outcome
+
+
+def test_all_items_are_written_by_batches():
+    recorder = Recorder()
+    pipeline = WriteBehindPipeline(
+        lambda n: done(n * 2), recorder.finish, recorder.write, workers=4, queue_size=4, batch_size=10
+    )
+    outcome = run(pipeline, range(25))
+
+    assert outcome == {"saved": 25}
+    assert pipeline.batches == 3
+    # the last batch is partial
+    assert sorted(len(b) for b in recorder.batches) == [5, 10, 10]
+    assert sorted(n for b in recorder.batches for n in b) == list(range(25))
+    assert recorder.finished == {n: n * 2 for n in range(25)}
+
+
+def test_partial_batch_is_flushed_by_interval():
+    recorder = Recorder()
+    written_before_next_items = []
+
+    def items():
+        yield from range(3)
+        time.sleep(0.5)
+        written_before_next_items.extend(recorder.batches)
+        yield from range(3, 5)
+
+    pipeline = WriteBehindPipeline(
+        done, recorder.finish, recorder.write, workers=2, batch_size=100, flush_interval=0.1
+    )
+    outcome = run(pipeline, items())
+
+    assert outcome == {"saved": 5}
+    assert [sorted(b) for b in written_before_next_items] == [[0, 1, 2]]
+    assert [sorted(b) for b in recorder.batches] == [[0, 1, 2], [3, 4]]
+
+
+def test_failed_item_is_finished_and_written():
+    recorder = Recorder()
+
+    def process(n):
+        if n == 1:
+            raise ValueError("broken page")
+        return done(n)
+
+    outcome = run(WriteBehindPipeline(process, recorder.finish, recorder.write, workers=2), range(3))
+
+    assert outcome == {"saved": 3}
+    assert isinstance(recorder.finished[1], ValueError)
+
+
+def test_pipeline_stops_when_write_fails():
+    recorder = Recorder()
+    produced = []
+
+    def write(batch):
+        if recorder.batches:
+            raise RuntimeError("database is down")
+        return recorder.write(batch)
+
+    def items():
+        for n in range(10000):
+            produced.append(n)
+            yield n
+
+    # small queues, so workers are blocked by the writer when it fails
+    pipeline = WriteBehindPipeline(done, recorder.finish, write, workers=4, queue_size=2, batch_size=5)
+    outcome = run(pipeline, items())
+
+    assert isinstance(outcome["error"], RuntimeError)
+    assert pipeline.saved == 5
+    # the items are not taken after the failure
+    assert len(produced) < 100
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+
+def test_concurrent_clones_share_one_pool(pg_client):
+    with ThreadPoolExecutor(8) as executor:
+        clones = list(executor.map(lambda _: pg_client.clone(), range(32)))
+    assert len({id(c._pool) for c in clones}) == 1
+    assert clones[0]._pool is pg_client._pool
+
+
+def test_close_after_clone(pg_client):
+    # the connection of the parent was opened before the pool
+    pg_client.get_feeds()
+    clone = pg_client.clone()
+    clone.get_feeds()
+    clone.close()
+    pg_client.close()
+    assert pg_client._connection is None
+    # the clone takes the connection returned to the pool
+    clone.get_feeds()
+    clone.close()
+
+
+def _news(feed_id, url):
+    return SimpleNamespace(
+        feed=SimpleNamespace(id=feed_id), title=url, short_description=None, posted=datetime(2020, 1, 1),
+        url=url, hash=url, full_description=None,
+    )
+
+
+def _exported(client, after, until):
+    return [n.url for n in client.iter_news(after_id=after, until_id=until)]
+
+
+def test_export_bound_waits_for_uncommitted_news(pg_client):
+    feed = pg_client.save_feed("http://feed/rss")
+    first, second = pg_client.clone(), pg_client.clone()
+
+    # the first writer saved news and did not commit yet
+    conn = first._get_connection()
+    cur = conn.cursor()
+    # a new partition locks the table till the commit
+    first._create_partitions(cur, [datetime(2020, 1, 1)])
+    conn.commit()
+    try:
+        first._insert_news(cur, [(feed.id, "a", None, datetime(2020, 1, 1), "http://a", "a", None)])
+        # the second writer does not wait for the first one
+        second.save_news([_news(feed.id, "http://b")])
+        # the news of the second writer are left for the next export with the news of the first one
+        bound = pg_client.get_export_bound()
+        assert _exported(pg_client, None, bound) == []
+    finally:
+        conn.commit()
+
+    after, bound = bound, pg_client.get_export_bound()
+    assert _exported(pg_client, after, bound) == ["http://a", "http://b"]
+    second.save_news([_news(feed.id, "http://c")])
+    assert _exported(pg_client, bound, pg_client.get_export_bound()) == ["http://c"]
+    first.close()
+    second.close()
+
+
+# the schema of the first version, news of a hash could be saved more than once
+BASELINE_DDL = """
+CREATE SCHEMA {schema};
+CREATE TABLE {schema}.feeds (
+    id serial NOT NULL,
+    url varchar NULL,
+    body_parser varchar NULL,
+    CONSTRAINT feeds_pk PRIMARY KEY (id)
+);
+CREATE INDEX feeds_url_idx ON {schema}.feeds USING btree (url);
+CREATE TABLE {schema}.scraper_info (
+    id serial NOT NULL,
+    date_run date NULL,
+    count int4 NULL,
+    by_user bool NULL DEFAULT false,
+    url varchar NULL,
+    feed_id int4 NULL,
+    CONSTRAINT scraper_info_pk PRIMARY KEY (id),
+    CONSTRAINT scraper_info_fk FOREIGN KEY (feed_id) REFERENCES {schema}.feeds(id)
+);
+CREATE TABLE {schema}.news (
+    id serial NOT NULL,
+    feed_id int4 NOT NULL,
+    title varchar NULL,
+    short_description varchar NULL,
+    posted timestamp NULL,
+    url varchar NULL,
+    hash varchar NULL,
+    full_description text NULL,
+    CONSTRAINT news_pk PRIMARY KEY (id),
+    CONSTRAINT news_fk FOREIGN KEY (feed_id) REFERENCES {schema}.feeds(id) ON UPDATE CASCADE ON DELETE CASCADE
+);
+"""
+
+
+def test_migration_of_baseline_schema_keeps_oldest_news_of_hash(pg_client):
+    import postgres
+
+    schema = pg_client._schema
+    conn = pg_client._get_connection()
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+            cur.execute(BASELINE_DDL.format(schema=schema))
+            cur.execute(f"INSERT INTO {schema}.feeds (url) VALUES ('http://feed/rss') RETURNING id")
+            (feed_id,) = cur.fetchone()
+            cur.executemany(
+                f"INSERT INTO {schema}.news (feed_id, title, posted, hash) VALUES (%s, %s, %s, %s)",
+                [
+                    (feed_id, "a", datetime(2020, 1, 1), "a"),
+                    (feed_id, "b", datetime(2020, 2, 1), "b"),
+                    (feed_id, "a again", datetime(2020, 3, 1), "a"),
+                    (feed_id, "no hash", None, None),
+                    (feed_id, "no hash again", None, None),
+                ],
+            )
+    postgres._ready_schemas.discard(pg_client._cache_key)
+
+    pg_client.create_schema()
+
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT id, title FROM {schema}.news ORDER BY id")
+            assert cur.fetchall() == [(1, "a"), (2, "b"), (4, "no hash"), (5, "no hash again")]
+            cur.execute(f"SELECT hash FROM {schema}.news_hashes ORDER BY hash")
+            assert cur.fetchall() == [("a",), ("b",)]
+    # new news take ids after the migrated ones and a saved hash is not saved again
+    pg_client.save_news([_news(feed_id, "a"), _news(feed_id, "http://c")])
+    assert [(r.id, r.url) for r in pg_client.get_news_refs()][-1] == (6, "http://c")
+    # the first incremental export takes the migrated news
+    assert _exported(pg_client, None, pg_client.get_export_bound()) == [None, None, None, None, "http://c"]
+
+
+def test_watermarks_of_ids_are_moved_to_xact(pg_client):
+    import postgres
+
+    feed = pg_client.save_feed("http://feed/rss")
+    pg_client.save_news([_news(feed.id, "http://a"), _news(feed.id, "http://b")])
+    first, second = (r.id for r in pg_client.get_news_refs())
+    # news and watermarks of a schema of the previous version
+    schema = pg_client._schema
+    conn = pg_client._get_connection()
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {schema}.news DROP COLUMN xact")
+            cur.execute(f"ALTER TABLE {schema}.export_watermarks ALTER COLUMN last_id TYPE int4")
+            cur.execute(f"UPDATE {schema}.schema_version SET version = 10")
+    pg_client.save_watermark("archive", first)
+    pg_client.save_watermark("job:reparse", first)
+    postgres._ready_schemas.discard(pg_client._cache_key)
+
+    pg_client.create_schema()
+
+    pg_client.save_news([_news(feed.id, "http://c")])
+    after = pg_client.get_watermark("archive")
+    assert _exported(pg_client, after, pg_client.get_export_bound()) == ["http://b", "http://c"]
+    assert pg_client.get_watermark("job:reparse") == first
+    assert [r.id for r in pg_client.get_news_refs(after_id=first)][0] == second
@@ -0,0 +1,80 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from cache import HTMLCache
+from memory_client import MemoryClient
+from reparse import Reparser
+
+
+class UpperParser:
+    @staticmethod
+    def cleaned_data(text):
+        return text.upper()
+
+
+class FailingClient(MemoryClient):
+    """fails to update the second batch like an interrupted job"""
+
+    def update_full_descriptions(self, descriptions) -> int:
+        if self._storage["watermarks"]:
+            raise RuntimeError("interrupted")
+        return super().update_full_descriptions(descriptions)
+
+
+def _save(client, cache, *urls):
+    feed = client.get_feed_by_url("http://feed/rss")
+    client.save_news([
+        SimpleNamespace(feed=feed, title=url, short_description=None, posted=datetime(2020, 1, 1),
+                        url=url, hash=HTMLCache.key(url), full_description=None)
+        for url in urls
+    ])
+    for url in urls:
+        cache.put(url, f"page of {url}")
+
+
+def test_finished_job_runs_again_from_the_first_news(tmp_path):
+    client = MemoryClient()
+    _save(client, HTMLCache(tmp_path), "http://a", "http://b", "http://c")
+
+    reparser = Reparser(client, UpperParser(), tmp_path, processes=1, batch_size=2)
+    reparser.run()
+    assert reparser.updated == 3
+    assert client.get_watermark("job:reparse") is None
+
+    # after a change of the parser the job reparses all news again
+    reparser = Reparser(client, UpperParser(), tmp_path, processes=1, batch_size=2)
+    reparser.run()
+    assert reparser.updated == 3
+    assert [n.full_description for _, n in client.news] == ["PAGE OF HTTP://A", "PAGE OF HTTP://B", "PAGE OF HTTP://C"]
+
+
+def test_interrupted_job_continues(tmp_path):
+    client = FailingClient()
+    _save(client, HTMLCache(tmp_path), "http://a", "http://b", "http://c")
+
+    with pytest.raises(RuntimeError):
+        Reparser(client, UpperParser(), tmp_path, processes=1, batch_size=2).run()
+    assert client.get_watermark("job:reparse") == 2
+    # the job does not take the watermark of an export destination of the same name
+    assert client.get_watermark("reparse") is None
+
+    reparser = Reparser(MemoryClient(storage=client._storage), UpperParser(), tmp_path, processes=1, batch_size=2)
+    reparser.run()
+    assert reparser.updated == 1
+    assert [n.full_description for _, n in client.news] == ["PAGE OF HTTP://A", "PAGE OF HTTP://B", "PAGE OF HTTP://C"]
+
+
+def test_reparse_in_postgres(pg_client, tmp_path):
+    pg_client.save_feed("http://feed/rss")
+    _save(pg_client, HTMLCache(tmp_path), "http://a", "http://b", "http://c")
+
+    for _ in range(2):
+        reparser = Reparser(pg_client, UpperParser(), tmp_path, processes=1, batch_size=2)
+        reparser.run()
+        assert (reparser.updated, reparser.missing) == (3, 0)
+        assert pg_client.get_watermark("job:reparse") is None
+    assert sorted(n.full_description for n in pg_client.iter_news()) == [
+        "PAGE OF HTTP://A", "PAGE OF HTTP://B", "PAGE OF HTTP://C"
+    ]
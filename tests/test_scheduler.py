@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from memory_client import MemoryClient
+from scheduler import FeedScheduler, ScheduledFeed
+
+
+class StubScheduler(FeedScheduler):
+    """runs feeds by sleeping, the fast feed is due again at once"""
+
+    def __init__(self, feeds, seconds, stop_after):
+        super().__init__(MemoryClient(), None, concurrency=4, min_interval=60)
+        self.feeds = feeds
+        self.seconds = seconds
+        self.stop_after = stop_after
+        self.runs = Counter()
+        self.running = Counter()
+        self.stop = threading.Event()
+
+    def load_feeds(self):
+        return self.feeds
+
+    def run_feed(self, record):
+        self.running[record.url] += 1
+        assert self.running[record.url] == 1, "the feed is run twice at once"
+        time.sleep(self.seconds[record.url])
+        self.running[record.url] -= 1
+        self.runs[record.url] += 1
+        self._next_polls[record.url] = datetime.now()
+        if self.runs[record.url] == self.stop_after:
+            self.stop.set()
+
+
+def test_slow_feed_does_not_delay_other_feeds():
+    feeds = [ScheduledFeed("http://slow/rss", None, "test"), ScheduledFeed("http://fast/rss", None, "test")]
+    scheduler = StubScheduler(feeds, {"http://slow/rss": 1.0, "http://fast/rss": 0.01}, stop_after=10)
+
+    thread = threading.Thread(target=scheduler.serve, args=(scheduler.stop,), daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    # the fast feed ran again and again while the slow one was running once
+    assert scheduler.runs == {"http://fast/rss": 10, "http://slow/rss": 1}
+
+
+class SchemaClient(MemoryClient):
+    """memory client with a storage per schema like schemas of a database"""
+
+    def __init__(self, schema="test", storages=None):
+        self._storages = storages if storages is not None else {}
+        super().__init__(schema, self._storages.get(schema))
+        self._storages.setdefault(schema, self._storage)
+        self.clones = []
+        self.closed = False
+
+    def clone(self, schema: str = None) -> "SchemaClient":
+        clone = SchemaClient(schema or self._schema, self._storages)
+        self.clones.append(clone)
+        return clone
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_schedules_of_feeds_file_are_read_from_their_schemas(tmp_path):
+    client = SchemaClient("test")
+    next_poll_at = datetime(2030, 1, 1)
+    for schema, url, interval in (("test", "http://a/rss", 60.0), ("other", "http://b/rss", 600.0)):
+        saved = client.clone(schema)
+        feed = saved.save_feed(url)
+        saved.save_feed_schedule(feed.id, interval, next_poll_at)
+    feeds_file = tmp_path.joinpath("feeds.txt")
+    feeds_file.write_text("http://a/rss\nhttp://b/rss ReutersParser other\nhttp://c/rss ReutersParser other\n")
+
+    client.clones = []
+    scheduler = FeedScheduler(client, None, schema="test", feeds_file=str(feeds_file))
+    feeds = {f.url: f for f in scheduler.load_feeds()}
+
+    assert feeds["http://a/rss"] == ScheduledFeed("http://a/rss", None, "test", 60.0, next_poll_at)
+    assert feeds["http://b/rss"] == ScheduledFeed("http://b/rss", "ReutersParser", "other", 600.0, next_poll_at)
+    assert feeds["http://c/rss"] == ScheduledFeed("http://c/rss", "ReutersParser", "other")
+    assert [(c._schema, c.closed) for c in client.clones] == [("other", True)]
@@ -0,0 +1,109 @@
+import csv
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from cache import HTMLCache
+from memory_client import MemoryClient
+from scraper import Feed
+
+RSS = """<?xml version="1.0"?>
+<rss version="2.0"><channel><title>test</title>{items}</channel></rss>
+"""
+ITEM = """<item><title>{title}</title><description>{description}</description>
+<link>{url}</link><pubDate>Wed, 01 Jan 2020 10:00:00 GMT</pubDate></item>"""
+
+
+class StubSession:
+    """answers by pages of URLs and records requested URLs"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requested.append(url)
+        text = self.pages[url]
+        return SimpleNamespace(
+            status_code=200, headers={}, text=text, content=text.encode("utf8"), raise_for_status=lambda: None
+        )
+
+
+class TextParser:
+    @staticmethod
+    def cleaned_data(text):
+        return text
+
+
+def rss(*items):
+    return RSS.format(items="".join(ITEM.format(title=t, description=d, url=u) for t, d, u in items))
+
+
+def _save(client, *urls):
+    feed = client.get_feed_by_url("http://feed/rss")
+    client.save_news([
+        SimpleNamespace(feed=feed, title=url, short_description=None, posted=datetime(2020, 1, 1),
+                        url=url, hash=url, full_description=None)
+        for url in urls
+    ])
+
+
+def _exported(filename):
+    with open(filename, newline="") as f:
+        return [row["url"] for row in csv.DictReader(f)]
+
+
+def test_incremental_export(tmp_path, capsys):
+    client = MemoryClient()
+    feed = Feed("http://feed/rss", None, client, schema="test")
+    filename = str(tmp_path.joinpath("news.csv"))
+
+    _save(client, "http://a", "http://b")
+    feed.export_to_file(filename=filename, destination="archive")
+    assert _exported(filename) == ["http://a", "http://b"]
+    # the name of the file is printed after the rename of the part file
+    assert f"exported to {filename}\n" in capsys.readouterr().out
+
+    _save(client, "http://c")
+    feed.export_to_file(filename=filename, destination="archive")
+    assert _exported(filename) == ["http://c"]
+    assert client.get_watermark("archive") == 3
+
+
+def test_incremental_export_by_dates_is_rejected(tmp_path):
+    client = MemoryClient()
+    feed = Feed("http://feed/rss", None, client, schema="test")
+    _save(client, "http://a")
+
+    with pytest.raises(ValueError):
+        feed.export_to_file(from_date=datetime(2019, 1, 1), filename=str(tmp_path.joinpath("news.csv")),
+                            destination="archive")
+    assert client.get_watermark("archive") is None
+
+
+def test_pages_are_taken_from_the_cache(tmp_path):
+    pages = {
+        "http://feed/rss": rss(("first", "a", "http://site/1"), ("second", "b", "http://site/2")),
+        "http://site/1": "first page",
+        "http://site/2": "second page",
+    }
+    session = StubSession(pages)
+    Feed("http://feed/rss", TextParser(), MemoryClient(), schema="test", session=session,
+         cache=HTMLCache(tmp_path)).run()
+    assert sorted(session.requested) == ["http://feed/rss", "http://site/1", "http://site/2"]
+
+    # other schema saves the same news again, pages are read from the cache on disk
+    session.requested = []
+    client = MemoryClient()
+    feed = Feed("http://feed/rss", TextParser(), client, schema="other", session=session, cache=HTMLCache(tmp_path))
+    feed.run()
+    assert session.requested == ["http://feed/rss"]
+    assert feed.metrics.counters["cache_hits"] == 2
+    assert sorted(n.full_description for _, n in client.news) == ["first page", "second page"]
+
+
+def test_destinations_of_jobs_are_reserved(tmp_path):
+    feed = Feed("http://feed/rss", None, MemoryClient(), schema="test")
+    with pytest.raises(ValueError):
+        feed.export_to_file(filename=str(tmp_path.joinpath("news.csv")), destination="job:reparse")
@@ -0,0 +1,30 @@
+import time
+
+from workqueue import ARTICLE, TaskQueue
+
+
+def _lease_until(queue, task):
+    (row,) = queue._execute(
+        f"SELECT lease_until - now() FROM {queue._schema}.tasks WHERE id = %s", (task.id,), fetch=True
+    )
+    return row[0].total_seconds()
+
+
+def test_heartbeats_extend_leases_by_one_connection(pg_client):
+    queue = TaskQueue(pg_client, owner="test", lease=0.3)
+    queue.put(ARTICLE, [("a", {}), ("b", {})])
+    pool = pg_client._pool
+
+    connections = set()
+    for _ in range(2):
+        tasks = queue.take(ARTICLE, 1)
+        with queue.heartbeat(tasks):
+            time.sleep(0.5)
+            # the lease of 0.3 seconds would be expired without heartbeats
+            assert _lease_until(queue, tasks[0]) > 0
+        connections.add(id(queue._heartbeat_client._connection))
+        queue.done(tasks)
+
+    assert len(connections) == 1
+    assert pg_client._pool is pool
+    queue.close()